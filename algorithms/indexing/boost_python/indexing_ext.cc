@@ -56,11 +56,19 @@ namespace dials { namespace algorithms { namespace boost_python {
       .def("crystal_ids", &w_t::crystal_ids);
   }
 
+  void export_real_space_grid_search_functional() {
+    def("real_space_grid_search_functional",
+        &real_space_grid_search_functional, (
+          arg("reciprocal_space_points"),
+          arg("vectors")));
+  }
+
   BOOST_PYTHON_MODULE(dials_algorithms_indexing_ext)
   {
     export_fft3d();
     export_assign_indices();
     export_assign_indices_local();
+    export_real_space_grid_search_functional();
   }
 
 }}} // namespace = dials::algorithms::boost_python
@@ -10,6 +10,7 @@
  */
 #ifndef DIALS_ALGORITHMS_INDEXING_H
 #define DIALS_ALGORITHMS_INDEXING_H
+#include <cmath>
 #include <vector>
 #include <map>
 #include <algorithm>
@@ -384,6 +385,31 @@ namespace dials { namespace algorithms {
   };
 
 
+  /**
+   * Evaluate the real space grid search functional for a set of search
+   * vectors. For each vector v, this is the sum over the reciprocal lattice
+   * points s of cos(2 pi s.v).
+   * @param reciprocal_space_points The reciprocal lattice points
+   * @param vectors The search vectors
+   * @returns The value of the functional for each vector
+   */
+  inline
+  af::shared<double> real_space_grid_search_functional(
+      af::const_ref<scitbx::vec3<double> > const & reciprocal_space_points,
+      af::const_ref<scitbx::vec3<double> > const & vectors) {
+    const double two_pi = 2 * scitbx::constants::pi;
+    af::shared<double> result(vectors.size(), 0);
+    for (std::size_t j = 0; j < vectors.size(); ++j) {
+      scitbx::vec3<double> v = vectors[j];
+      double sum = 0;
+      for (std::size_t i = 0; i < reciprocal_space_points.size(); ++i) {
+        sum += std::cos(two_pi * (reciprocal_space_points[i] * v));
+      }
+      result[j] = sum;
+    }
+    return result;
+  }
+
 }}
 
 #endif
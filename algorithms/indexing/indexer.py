@@ -1308,71 +1308,6 @@ def choose_best_orientation_matrix(self, candidate_orientation_matrices):
         volume_cutoff=filter_params.volume_cutoff,
         n_indexed_cutoff=filter_params.n_indexed_cutoff)
 
-    def run_one_refinement(args):
-      params, reflections, experiments = args
-      indexed_reflections = reflections.select(reflections['id'] > -1)
-
-      from dials.command_line import check_indexing_symmetry
-      grid_search_scope = params.indexing.check_misindexing.grid_search_scope
-
-      best_offset = (0,0,0)
-      best_cc = 0.0
-      best_nref = 0
-
-      if grid_search_scope > 0:
-        offsets, ccs, nref \
-          = check_indexing_symmetry.get_indexing_offset_correlation_coefficients(
-          indexed_reflections, experiments.crystals()[0],
-          grid=grid_search_scope, map_to_asu=True)
-
-        if len(offsets) > 1:
-          max_nref = flex.max(nref)
-
-          # select "best" solution - needs nref > 0.5 max nref && highest CC
-          # FIXME perform proper statistical test in here do not like heuristics
-
-          for offset, cc, n in zip(offsets, ccs, nref):
-            if n < (max_nref // 2):
-              continue
-            if cc > best_cc:
-              best_cc = cc
-              best_offset = offset
-              best_nref = n
-
-          #print offsets[13], nref[13], '%.2f' %ccs[13] # (0,0,0)
-          #print best_offset, best_nref, '%.2f' %best_cc
-
-          if best_offset != (0,0,0):
-            logger.debug('Applying h,k,l offset: (%i, %i, %i)' %best_offset
-                 + ' [cc = %.2f]' %best_cc)
-            indexed_reflections['miller_index'] = apply_hkl_offset(
-              indexed_reflections['miller_index'], best_offset)
-
-      from dials.algorithms.refinement import RefinerFactory
-      try:
-        logger = logging.getLogger()
-        disabled = logger.disabled
-        logger.disabled = True
-        refiner = RefinerFactory.from_parameters_data_experiments(
-          params, indexed_reflections, experiments,
-          verbosity=0)
-        refiner.run()
-      except (RuntimeError, ValueError, Sorry), e:
-        return
-      else:
-        rmsds = refiner.rmsds()
-        xy_rmsds = math.sqrt(rmsds[0]**2 + rmsds[1]**2)
-        model_likelihood = 1.0 - xy_rmsds
-        soln = Solution(model_likelihood=model_likelihood,
-                        crystal=experiments.crystals()[0],
-                        rmsds=rmsds,
-                        n_indexed=len(indexed_reflections),
-                        fraction_indexed=float(len(indexed_reflections))/len(reflections),
-                        hkl_offset=best_offset)
-        return soln
-      finally:
-        logger.disabled = disabled
-
     import copy
     params = copy.deepcopy(self.all_params)
     params.refinement.parameterisation.scan_varying = False
@@ -1464,13 +1399,14 @@ def run_one_refinement(args):
 
       args.append((params, refl, experiments))
 
-    from libtbx import easy_mp
-    results = easy_mp.parallel_map(
-      run_one_refinement,
-      args,
-      processes=self.params.nproc,
-      preserve_exception_message=True,
-    )
+    # With the filter scorer, candidates indexing too few reflections compared
+    # with the best so far are discarded without changing the best solution,
+    # so these need not be refined
+    skip_fraction = None
+    if solution_scorer != 'weighted':
+      skip_fraction = SolutionTrackerFilter.min_n_indexed_fraction
+    results = refine_candidates(
+      args, nproc=self.params.nproc, skip_fraction=skip_fraction)
 
     for soln in results:
       if soln is None:
@@ -1758,6 +1694,11 @@ def filter_doubled_cell(solutions):
 
 # Tracker for solutions based on code in rstbx/dps_core/basis_choice.py
 class SolutionTrackerFilter(object):
+
+  # Solutions indexing fewer than this fraction of the reflections indexed by
+  # the best solution are ignored
+  min_n_indexed_fraction = 0.05 # 5 percent
+
   def __init__(self, check_doubled_cell=True, likelihood_cutoff=0.8,
                volume_cutoff=1.25, n_indexed_cutoff=0.9):
     self.check_doubled_cell = check_doubled_cell
@@ -1804,7 +1745,7 @@ def update_analysis(self):
     # pre-filter out solutions that only account for a very small
     # percentage of the indexed spots relative to the best one
     self.filtered_solutions = self.filter_by_n_indexed(
-      self.all_solutions, n_indexed_cutoff=0.05) # 5 percent
+      self.all_solutions, n_indexed_cutoff=self.min_n_indexed_fraction)
 
     if self.check_doubled_cell:
       self.filtered_solutions = filter_doubled_cell(self.filtered_solutions)
@@ -1934,6 +1875,159 @@ def __str__(self):
     return table_utils.format(rows=rows, has_header=True)
 
 
+def run_one_refinement(args):
+  params, reflections, experiments = args
+  indexed_reflections = reflections.select(reflections['id'] > -1)
+
+  from dials.command_line import check_indexing_symmetry
+  grid_search_scope = params.indexing.check_misindexing.grid_search_scope
+
+  best_offset = (0,0,0)
+  best_cc = 0.0
+  best_nref = 0
+
+  if grid_search_scope > 0:
+    offsets, ccs, nref \
+      = check_indexing_symmetry.get_indexing_offset_correlation_coefficients(
+      indexed_reflections, experiments.crystals()[0],
+      grid=grid_search_scope, map_to_asu=True)
+
+    if len(offsets) > 1:
+      max_nref = flex.max(nref)
+
+      # select "best" solution - needs nref > 0.5 max nref && highest CC
+      # FIXME perform proper statistical test in here do not like heuristics
+
+      for offset, cc, n in zip(offsets, ccs, nref):
+        if n < (max_nref // 2):
+          continue
+        if cc > best_cc:
+          best_cc = cc
+          best_offset = offset
+          best_nref = n
+
+      #print offsets[13], nref[13], '%.2f' %ccs[13] # (0,0,0)
+      #print best_offset, best_nref, '%.2f' %best_cc
+
+      if best_offset != (0,0,0):
+        logger.debug('Applying h,k,l offset: (%i, %i, %i)' %best_offset
+             + ' [cc = %.2f]' %best_cc)
+        indexed_reflections['miller_index'] = apply_hkl_offset(
+          indexed_reflections['miller_index'], best_offset)
+
+  from dials.algorithms.refinement import RefinerFactory
+  try:
+    root_logger = logging.getLogger()
+    disabled = root_logger.disabled
+    root_logger.disabled = True
+    refiner = RefinerFactory.from_parameters_data_experiments(
+      params, indexed_reflections, experiments,
+      verbosity=0)
+    refiner.run()
+  except (RuntimeError, ValueError, Sorry), e:
+    return
+  else:
+    rmsds = refiner.rmsds()
+    xy_rmsds = math.sqrt(rmsds[0]**2 + rmsds[1]**2)
+    model_likelihood = 1.0 - xy_rmsds
+    soln = Solution(model_likelihood=model_likelihood,
+                    crystal=experiments.crystals()[0],
+                    rmsds=rmsds,
+                    n_indexed=len(indexed_reflections),
+                    fraction_indexed=float(len(indexed_reflections))/len(reflections),
+                    hkl_offset=best_offset)
+    return soln
+  finally:
+    root_logger.disabled = disabled
+
+
+# The candidates being refined, inherited by the worker processes
+_candidate_args = None
+
+def _run_one_refinement_index(index):
+  import traceback
+  try:
+    return index, run_one_refinement(_candidate_args[index]), None
+  except Exception, e:
+    return index, None, '%s\n%s' % (traceback.format_exc(), str(e))
+
+
+def refine_candidates(args, nproc=1, skip_fraction=None):
+  '''
+  Refine each candidate solution, in parallel if nproc > 1.
+
+  Candidates are refined in order of decreasing number of indexed
+  reflections. If skip_fraction is set, candidates indexing fewer than
+  this fraction of the reflections indexed by the best refined solution so
+  far are not refined; these would be discarded by the solution tracker
+  anyway. Solutions which would be discarded are also removed from the
+  results, so that the results do not depend on the number of processes or
+  the order in which they finish.
+
+  :param args: The list of (params, reflections, experiments) for each
+               candidate
+  :param nproc: The number of processes
+  :param skip_fraction: The fraction of the best number of indexed
+                        reflections below which candidates are skipped
+  :return: The list of solutions (or None) in the order of the candidates
+  '''
+  global _candidate_args
+  import platform
+
+  n_indexed = [(refl['id'] > -1).count(True) for params, refl, expts in args]
+  order = sorted(range(len(args)), key=lambda i: -n_indexed[i])
+  results = [None] * len(args)
+  max_n_indexed = [0]
+
+  def skip(i):
+    return (skip_fraction is not None and
+            n_indexed[i] < skip_fraction * max_n_indexed[0])
+
+  def accept(i, soln):
+    results[i] = soln
+    if soln is not None:
+      max_n_indexed[0] = max(max_n_indexed[0], soln.n_indexed)
+
+  if nproc == 1 or len(args) < 2 or platform.system() == "Windows":
+    for i in order:
+      if not skip(i):
+        accept(i, run_one_refinement(args[i]))
+  else:
+    import multiprocessing
+    import Queue
+    done = Queue.Queue()
+    _candidate_args = args
+    pool = multiprocessing.Pool(min(nproc, len(args)))
+    try:
+      queue = list(order)
+      npending = 0
+      while len(queue) > 0 or npending > 0:
+        while len(queue) > 0 and npending < nproc:
+          i = queue.pop(0)
+          if not skip(i):
+            pool.apply_async(
+              _run_one_refinement_index, (i,), callback=done.put)
+            npending += 1
+        if npending > 0:
+          i, soln, error = done.get(True, 1e9)
+          npending -= 1
+          if error is not None:
+            raise RuntimeError(error)
+          accept(i, soln)
+    finally:
+      pool.terminate()
+      pool.join()
+      _candidate_args = None
+
+  # Remove the solutions which would be discarded
+  if skip_fraction is not None:
+    results = [
+      soln if soln is not None and
+        soln.n_indexed >= skip_fraction * max_n_indexed[0] else None
+      for soln in results]
+  return results
+
+
 def detect_non_primitive_basis(miller_indices, threshold=0.9):
 
   from rstbx.indexing_api import tools
@@ -24,6 +24,62 @@
 from dxtbx.model.experiment_list import Experiment, ExperimentList
 
 
+def search_vectors(directions, lengths):
+  '''
+  Get the search vectors for each direction and length, ordered by direction
+  and then by length.
+
+  :param directions: The unit vectors of the search directions
+  :param lengths: The list of vector lengths
+  :return: The search vectors
+  '''
+  n = len(lengths)
+  vectors = flex.vec3_double(len(directions) * n)
+  for j, l in enumerate(lengths):
+    vectors.set_selected(
+      flex.size_t_range(len(directions)) * n + j, directions * l)
+  return vectors
+
+
+def compute_functional_parallel(reciprocal_lattice_points, vectors, nproc=1,
+                                min_block_size=100):
+  '''
+  Evaluate the real space grid search functional, sum(cos(2 pi s.v)) over the
+  reciprocal lattice points s, for each search vector v. The vectors are
+  split into contiguous blocks which are evaluated in parallel.
+
+  :param reciprocal_lattice_points: The reciprocal lattice points
+  :param vectors: The search vectors
+  :param nproc: The number of processes
+  :param min_block_size: The minimum number of vectors in a block
+  :return: The value of the functional for each vector
+  '''
+  from dials.algorithms.indexing import real_space_grid_search_functional
+  nblocks = min(nproc, len(vectors) // min_block_size)
+  if nblocks <= 1:
+    return real_space_grid_search_functional(
+      reciprocal_lattice_points, vectors)
+
+  from libtbx import easy_mp
+  block_size = int(math.ceil(len(vectors) / nblocks))
+  blocks = [(i, min(i + block_size, len(vectors)))
+            for i in range(0, len(vectors), block_size)]
+
+  def compute_block(block):
+    return real_space_grid_search_functional(
+      reciprocal_lattice_points, vectors[block[0]:block[1]])
+
+  results = easy_mp.parallel_map(
+    compute_block,
+    blocks,
+    processes=nblocks,
+    preserve_exception_message=True)
+  function_values = flex.double()
+  for values in results:
+    function_values.extend(values)
+  return function_values
+
+
 class indexer_real_space_grid_search(indexer_base):
 
   def __init__(self, reflections, imagesets, params):
@@ -54,9 +110,9 @@ def real_space_grid_search(self):
 
     logger.info("Indexing from %i reflections" %len(reciprocal_lattice_points))
 
-    def compute_functional(vector):
-      two_pi_S_dot_v = 2 * math.pi * reciprocal_lattice_points.dot(vector)
-      return flex.sum(flex.cos(two_pi_S_dot_v))
+    def compute_functional(vectors):
+      return compute_functional_parallel(
+        reciprocal_lattice_points, vectors, nproc=self.params.nproc)
 
     from rstbx.array_family import flex
     from rstbx.dps_core import SimpleSamplerTool
@@ -69,14 +125,10 @@ def compute_functional(vector):
     unique_cell_dimensions = set(cell_dimensions)
     logger.info(
       "Number of search vectors: %i" %(len(SST.angles) * len(unique_cell_dimensions)))
-    vectors = flex.vec3_double()
-    function_values = flex.double()
-    for i, direction in enumerate(SST.angles):
-      for l in unique_cell_dimensions:
-        v = matrix.col(direction.dvec) * l
-        f = compute_functional(v.elems)
-        vectors.append(v.elems)
-        function_values.append(f)
+    vectors = search_vectors(
+      flex.vec3_double([direction.dvec for direction in SST.angles]),
+      list(unique_cell_dimensions))
+    function_values = compute_functional(vectors)
 
     perm = flex.sort_permutation(function_values, reverse=True)
     vectors = vectors.select(perm)
@@ -110,8 +162,7 @@ def compute_functional(vector):
     if self.params.optimise_initial_basis_vectors:
       optimised_basis_vectors = optimise_basis_vectors(
         reciprocal_lattice_points, basis_vectors)
-      optimised_function_values = flex.double([
-        compute_functional(v) for v in optimised_basis_vectors])
+      optimised_function_values = compute_functional(optimised_basis_vectors)
 
       perm = flex.sort_permutation(optimised_function_values, reverse=True)
       optimised_basis_vectors = optimised_basis_vectors.select(perm)
@@ -121,9 +172,11 @@ def compute_functional(vector):
 
     logger.info("Number of unique vectors: %i" %len(unique_vectors))
 
+    unique_function_values = compute_functional(
+      flex.vec3_double([v.elems for v in unique_vectors]))
     for i in range(len(unique_vectors)):
       logger.debug("%s %s %s" %(
-        str(compute_functional(unique_vectors[i].elems)),
+        str(unique_function_values[i]),
         str(unique_vectors[i].length()),
         str(unique_vectors[i].elems)))
 
@@ -218,6 +218,82 @@ namespace dials { namespace algorithms { namespace boost_python {
     return result;
   }
 
+  /**
+   * Compute the shoebox memory and processing cost of the reflections in a
+   * range of experiments for each frame.
+   * @param data The reflections
+   * @param expr The range of experiments
+   * @param frames The range of frames
+   * @param flatten Will the shoeboxes be flattened
+   * @param overhead The cost of each reflection in addition to its pixels
+   * @returns A tuple containing the memory needed for the shoeboxes active
+   * on each frame and the cost of the reflections starting on each frame
+   */
+  boost::python::tuple frame_profile(
+      af::reflection_table data,
+      tiny<int,2> expr,
+      tiny<int,2> frames,
+      bool flatten,
+      double overhead) {
+
+    // Check the input
+    DIALS_ASSERT(data.is_consistent());
+    DIALS_ASSERT(data.contains("bbox"));
+    DIALS_ASSERT(data.contains("id"));
+    DIALS_ASSERT(expr[1] > expr[0]);
+    DIALS_ASSERT(frames[1] > frames[0]);
+
+    // Get the bounding boxes
+    af::const_ref<int6> bbox = data["bbox"];
+    af::const_ref<int> id = data["id"];
+
+    // Accumulate the memory allocated and freed and the cost on each frame
+    std::size_t nframes = frames[1] - frames[0];
+    af::shared<std::size_t> memory_to_alloc(nframes, 0);
+    af::shared<std::size_t> memory_to_free(nframes, 0);
+    af::shared<double> cost(nframes, 0);
+    for (std::size_t i = 0; i < bbox.size(); ++i) {
+      if (id[i] < expr[0] || id[i] >= expr[1]) {
+        continue;
+      }
+      int6 b = bbox[i];
+      DIALS_ASSERT(b[1] > b[0]);
+      DIALS_ASSERT(b[3] > b[2]);
+      DIALS_ASSERT(b[5] > b[4]);
+      int z0 = std::max(b[4], frames[0]);
+      int z1 = std::min(b[5], frames[1]);
+      if (z1 <= z0) {
+        continue;
+      }
+      std::size_t xsize = b[1] - b[0];
+      std::size_t ysize = b[3] - b[2];
+      std::size_t zsize = b[5] - b[4];
+      std::size_t size = xsize * ysize;
+      if (!flatten) {
+        size *= zsize;
+      }
+      std::size_t nbytes = size * (
+          sizeof(Shoebox<>::float_type) +
+          sizeof(Shoebox<>::float_type) +
+          sizeof(int));
+      memory_to_alloc[z0 - frames[0]] += nbytes;
+      memory_to_free[z1 - frames[0] - 1] += nbytes;
+      cost[z0 - frames[0]] += (double)(xsize * ysize * zsize) + overhead;
+    }
+
+    // Compute the memory active on each frame
+    af::shared<std::size_t> memory(nframes, 0);
+    std::size_t cur_memory_usage = 0;
+    for (std::size_t j = 0; j < nframes; ++j) {
+      cur_memory_usage += memory_to_alloc[j];
+      memory[j] = cur_memory_usage;
+      DIALS_ASSERT(memory_to_free[j] <= cur_memory_usage);
+      cur_memory_usage -= memory_to_free[j];
+    }
+    DIALS_ASSERT(cur_memory_usage == 0);
+    return boost::python::make_tuple(memory, cost);
+  }
+
   /**
    * Wrapper class to allow python function to inherit
    */
@@ -229,6 +305,15 @@ namespace dials { namespace algorithms { namespace boost_python {
 
   BOOST_PYTHON_MODULE(dials_algorithms_integration_integrator_ext)
   {
+    void (JobList::*job_list_add_uniform)(
+        tiny<int,2>,
+        tiny<int,2>,
+        int) = &JobList::add;
+    void (JobList::*job_list_add_jobs)(
+        tiny<int,2>,
+        tiny<int,2>,
+        const af::const_ref< tiny<int,2> >&) = &JobList::add;
+
     class_<GroupList::Group>("Group", no_init)
       .def("index", &GroupList::Group::index)
       .def("nindex", &GroupList::Group::nindex)
@@ -255,7 +340,8 @@ namespace dials { namespace algorithms { namespace boost_python {
     class_<JobList>("JobList")
       .def(init< tiny<int,2>,
                  const af::const_ref< tiny<int,2> >& >())
-      .def("add", &JobList::add)
+      .def("add", job_list_add_uniform)
+      .def("add", job_list_add_jobs)
       .def("__len__", &JobList::size)
       .def("__getitem__", &JobList::operator[],
           return_internal_reference<>())
@@ -272,6 +358,7 @@ namespace dials { namespace algorithms { namespace boost_python {
       .def("finished", &ReflectionManager::finished)
       .def("accumulate", &ReflectionManager::accumulate)
       .def("split", &ReflectionManager::split)
+      .def("indices", &ReflectionManager::indices)
       .def("job", &ReflectionManager::job,
           return_internal_reference<>())
       .def("data", &ReflectionManager::data)
@@ -317,6 +404,12 @@ namespace dials { namespace algorithms { namespace boost_python {
       .def("process_time", &ShoeboxProcessor::process_time)
       ;
 
+    def("frame_profile", &frame_profile, (
+          arg("data"),
+          arg("expr"),
+          arg("frames"),
+          arg("flatten") = false,
+          arg("overhead") = 0));
   }
 
 }}} // namespace = dials::algorithms::boost_python
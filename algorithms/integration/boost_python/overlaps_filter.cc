@@ -0,0 +1,30 @@
+/*
+ * overlaps_filter.cc
+ *
+ *  Copyright (C) 2017 Diamond Light Source
+ *
+ *  This code is distributed under the BSD license, a copy of which is
+ *  included in the root directory of this package.
+ */
+#include <boost/python.hpp>
+#include <boost/python/def.hpp>
+#include <dials/algorithms/integration/overlaps_filter.h>
+
+using namespace boost::python;
+
+namespace dials { namespace algorithms { namespace boost_python {
+
+  void export_overlaps_filter() {
+
+    def("foreground_foreground_overlaps_filter",
+        &foreground_foreground_overlaps_filter, (
+          arg("detector"),
+          arg("shoeboxes")));
+
+    def("foreground_background_overlaps_filter",
+        &foreground_background_overlaps_filter, (
+          arg("detector"),
+          arg("shoeboxes")));
+  }
+
+}}} // namespace = dials::algorithms::boost_python
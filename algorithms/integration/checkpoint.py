@@ -0,0 +1,245 @@
+#
+# checkpoint.py
+#
+#  Copyright (C) 2017 Diamond Light Source
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+
+from __future__ import absolute_import, division
+import logging
+logger = logging.getLogger(__name__)
+
+# The columns of the input reflections which define the processing jobs
+_reflection_key_columns = [
+  'id',
+  'panel',
+  'miller_index',
+  'entering',
+  'bbox',
+  'xyzcal.px',
+  's1',
+  'flags',
+]
+
+
+def _update_digest(digest, value):
+  '''
+  Add a parameter value to the digest.
+
+  '''
+  from scitbx.array_family import flex
+  if isinstance(value, flex.bool):
+    digest.update(value.as_int().copy_to_byte_str())
+  elif hasattr(value, 'copy_to_byte_str'):
+    digest.update(value.copy_to_byte_str())
+  elif isinstance(value, (list, tuple)):
+    digest.update('[')
+    for item in value:
+      _update_digest(digest, item)
+      digest.update(',')
+    digest.update(']')
+  else:
+    text = repr(value)
+    if ' object at 0x' in text:
+      # Avoid including the memory address in the digest
+      text = str(value)
+    digest.update(text)
+
+
+def _update_digest_from_extract(digest, extract, path, exclude):
+  '''
+  Walk a phil extract object and add the values to the digest.
+
+  '''
+  for name in sorted(extract.__dict__):
+    if name.startswith('_'):
+      continue
+    item_path = '.'.join([path, name]) if path else name
+    if item_path in exclude:
+      continue
+    value = getattr(extract, name)
+    items = value if isinstance(value, list) else [value]
+    if len(items) > 0 and all(hasattr(item, '__phil_path__') for item in items):
+      for i, item in enumerate(items):
+        _update_digest_from_extract(
+          digest, item, '%s[%d]' % (item_path, i), exclude)
+    else:
+      digest.update(item_path)
+      digest.update('=')
+      _update_digest(digest, value)
+      digest.update('\n')
+
+
+def parameters_digest(params):
+  '''
+  Compute a digest of the parameters which affect the integrated values.
+
+  Parameters which only affect how the processing is done (multiprocessing,
+  debug output, streaming, checkpointing and caching) are not included.
+
+  :param params: The input phil parameters
+  :return: The hex digest
+
+  '''
+  import hashlib
+  digest = hashlib.sha1()
+  exclude = set([
+    'integration.mp',
+    'integration.stream',
+    'integration.checkpoint',
+    'integration.debug',
+    'integration.frame_cache',
+  ])
+  _update_digest_from_extract(digest, params.integration, 'integration', exclude)
+  if hasattr(params, 'profile'):
+    _update_digest_from_extract(digest, params.profile, 'profile', exclude)
+  return digest.hexdigest()
+
+
+def checkpoint_key(experiments, reflections, manager, parameters=None):
+  '''
+  Compute a key identifying the processing so that checkpoints from different
+  input are not reused.
+
+  :param experiments: The experiment list
+  :param reflections: The input reflections
+  :param manager: The reflection manager defining the jobs
+  :param parameters: The parameters digest
+  :return: The hex digest
+
+  '''
+  import hashlib
+  import json
+  from dials.array_family import columnar
+  digest = hashlib.sha1()
+  digest.update(json.dumps(experiments.to_dict(), sort_keys=True))
+  for index in range(len(manager)):
+    job = manager.job(index)
+    digest.update(repr((tuple(job.frames()), tuple(job.expr()))))
+  digest.update(repr(len(reflections)))
+  for key in _reflection_key_columns:
+    if key in reflections:
+      typename, encoding, buf = columnar.encode_column(reflections[key])
+      digest.update(key)
+      digest.update(buf)
+  digest.update(repr(parameters))
+  return digest.hexdigest()
+
+
+class CheckpointDirectory(object):
+  '''
+  A directory holding the results of each processing job as it completes.
+
+  Each job is written to a columnar reflection file and a small pickle file
+  containing the other results. The pickle file is written last, so that its
+  presence marks a complete job. A checkpoint.json file records the key of
+  the processing; if the key changes the existing checkpoints are discarded.
+
+  '''
+
+  def __init__(self, directory, key):
+    '''
+    Open or create the checkpoint directory.
+
+    :param directory: The directory name
+    :param key: The key identifying the processing
+
+    '''
+    import json
+    import os
+    self.directory = directory
+    self.key = key
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    filename = os.path.join(directory, 'checkpoint.json')
+    previous = None
+    if os.path.exists(filename):
+      try:
+        with open(filename) as infile:
+          previous = json.load(infile)['key']
+      except Exception:
+        previous = None
+    if previous != key:
+      if previous is not None:
+        logger.warn(
+          ' Experiments or parameters have changed; discarding checkpoints in %s'
+          % directory)
+      self.clear()
+      with open(filename, 'w') as outfile:
+        json.dump({'key' : key}, outfile)
+
+  def _filenames(self, index):
+    import os
+    prefix = os.path.join(self.directory, 'job_%06d' % index)
+    return prefix + '.refl', prefix + '.pickle'
+
+  def clear(self):
+    '''
+    Remove all the checkpointed jobs.
+
+    '''
+    import os
+    import re
+    pattern = re.compile(r'^job_\d{6}\.(refl|pickle)(\.tmp)?$')
+    for name in os.listdir(self.directory):
+      if pattern.match(name):
+        os.remove(os.path.join(self.directory, name))
+
+  def completed(self):
+    '''
+    Get the indices of the completed jobs.
+
+    :return: The sorted list of job indices
+
+    '''
+    import os
+    import re
+    pattern = re.compile(r'^job_(\d{6})\.pickle$')
+    indices = []
+    for name in os.listdir(self.directory):
+      match = pattern.match(name)
+      if match is not None:
+        index = int(match.group(1))
+        if os.path.exists(self._filenames(index)[0]):
+          indices.append(index)
+    return sorted(indices)
+
+  def save(self, result):
+    '''
+    Save the result of a job.
+
+    :param result: The processing result
+
+    '''
+    import cPickle as pickle
+    import os
+    from dials.array_family import columnar
+    refl_filename, pickle_filename = self._filenames(result.index)
+    columnar.dump(result.reflections, refl_filename + '.tmp')
+    os.rename(refl_filename + '.tmp', refl_filename)
+    state = dict(
+      (key, value) for key, value in result.__dict__.iteritems()
+      if key != 'reflections')
+    with open(pickle_filename + '.tmp', 'wb') as outfile:
+      pickle.dump(state, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+    os.rename(pickle_filename + '.tmp', pickle_filename)
+
+  def load(self, index):
+    '''
+    Load the result of a job.
+
+    :param index: The job index
+    :return: The processing result
+
+    '''
+    import cPickle as pickle
+    from dials.array_family import columnar
+    from dials.algorithms.integration.processor import Result
+    refl_filename, pickle_filename = self._filenames(index)
+    with open(pickle_filename, 'rb') as infile:
+      state = pickle.load(infile)
+    result = Result(index, columnar.load(refl_filename))
+    result.__dict__.update(state)
+    assert result.index == index, "Checkpoint has the wrong job index"
+    return result
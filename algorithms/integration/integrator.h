@@ -203,6 +203,35 @@ namespace dials { namespace algorithms {
       groups_.add(int2(j0, j1), expr, range);
     }
 
+    /**
+     * Add a new group of jobs covering a range of experiments with the jobs
+     * given explicitly. The jobs must cover the range of frames in order,
+     * each job starting before or at the end of the previous job.
+     * @param expr The range of experiments
+     * @param range The range of frames
+     * @param jobs The frame range of each job
+     */
+    void add(tiny<int,2> expr,
+             tiny<int,2> range,
+             const af::const_ref< tiny<int,2> > &jobs) {
+      DIALS_ASSERT(expr[1] > expr[0]);
+      DIALS_ASSERT(range[1] > range[0]);
+      DIALS_ASSERT(jobs.size() > 0);
+      DIALS_ASSERT(jobs.front()[0] == range[0]);
+      DIALS_ASSERT(jobs.back()[1] == range[1]);
+      std::size_t j0 = size();
+      jobs_.push_back(Job(groups_.size(), expr, jobs[0]));
+      for (std::size_t i = 1; i < jobs.size(); ++i) {
+        DIALS_ASSERT(jobs[i][1] > jobs[i][0]);
+        DIALS_ASSERT(jobs[i][0] > jobs[i-1][0]);
+        DIALS_ASSERT(jobs[i][1] > jobs[i-1][1]);
+        DIALS_ASSERT(jobs[i][0] <= jobs[i-1][1]);
+        jobs_.push_back(Job(groups_.size(), expr, jobs[i]));
+      }
+      std::size_t j1 = size();
+      groups_.add(int2(j0, j1), expr, range);
+    }
+
     /**
      * @returns The requested job
      */
@@ -568,6 +597,15 @@ namespace dials { namespace algorithms {
       return lookup_.indices(index).size();
     }
 
+    /**
+     * @returns The indices of the reflections in a particular block.
+     */
+    af::shared<std::size_t> indices(std::size_t index) const {
+      DIALS_ASSERT(index < finished_.size());
+      af::const_ref<std::size_t> ind = lookup_.indices(index);
+      return af::shared<std::size_t>(ind.begin(), ind.end());
+    }
+
     /**
      * @returns The reflections for a particular block.
      */
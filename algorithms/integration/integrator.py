@@ -68,6 +68,17 @@ def generate_phil_scope():
           .type = float(value_min=0.0,value_max=1.0)
           .help = "The maximum percentage of total physical memory to use for"
                   "allocating shoebox arrays."
+
+        adaptive = False
+          .type = bool
+          .help = "Adapt the blocks to the reflections rather than using a"
+                  "fixed block size. Blocks whose shoeboxes would not fit in"
+                  "the memory available to each process are split, and the"
+                  "estimated cost of each block (from the number of reflections"
+                  "and the shoebox volumes) is balanced by splitting costly"
+                  "blocks and merging cheap ones, so that all processes stay"
+                  "busy. The block size is used as the starting point and the"
+                  "threshold sets the smallest block."
       }
 
       debug {
@@ -117,6 +128,33 @@ def generate_phil_scope():
 
       }
 
+      stream {
+
+        filename = None
+          .type = str
+          .help = "If set, the reflections from each processing block are"
+                  "appended to this file as soon as the block has finished,"
+                  "rather than being held in memory until all blocks are done."
+                  "The blocks are merged at the end of processing; any"
+                  "shoeboxes are kept only in this file. If processing fails,"
+                  "the completed blocks can still be read from the file."
+      }
+
+      checkpoint {
+
+        directory = None
+          .type = path
+          .help = "If set, the results of each processing job are saved to"
+                  "this directory as soon as the job has finished, along with"
+                  "a hash of the experiments, reflections and parameters. If"
+                  "integration is run again with the same input, the jobs"
+                  "which have already been completed are read back rather"
+                  "than processed again. Parameters which do not change the"
+                  "results (e.g. nproc) can be changed between runs."
+      }
+
+      include scope dials.util.frame_cache.phil_scope
+
       integrator = *auto 3d flat3d 2d single2d stills volume
         .type = choice
         .help = "The integrator to use."
@@ -180,6 +218,22 @@ def generate_phil_scope():
         nproc = 1
           .type = int(value_min=1)
           .help = "The number of processes to use per cluster job"
+
+        transport = *pickle shm
+          .type = choice
+          .help = "How the processed reflections are returned from the worker"
+                  "processes. With shm, each worker writes its reflections to"
+                  "a memory backed file (in /dev/shm if available) and only"
+                  "the filename is sent back through the pipe. This is only"
+                  "used with multiprocessing on a single node."
+          .expert_level = 2
+
+        prefetch = 0
+          .type = int(value_min=0)
+          .help = "The number of images to read ahead on a background thread"
+                  "while the reflections on the current image are processed."
+                  "Reading and decoding compressed images can then overlap"
+                  "with processing. If 0, images are read when needed."
       }
 
     }
@@ -330,6 +384,8 @@ def from_phil(params):
     mp.method = params.mp.method
     mp.nproc = params.mp.nproc
     mp.njobs = params.mp.njobs
+    mp.transport = params.mp.transport
+    mp.prefetch = params.mp.prefetch
 
     # Set the lookup parameters
     lookup = processor.Lookup()
@@ -342,11 +398,19 @@ def from_phil(params):
     block.threshold = params.block.threshold
     block.force = params.block.force
     block.max_memory_usage = params.block.max_memory_usage
+    block.adaptive = params.block.adaptive
+
+    # Set the frame cache parameters
+    cache = processor.Cache()
+    cache.enable = params.frame_cache.enable
+    cache.directory = params.frame_cache.directory
+    cache.max_size = params.frame_cache.max_size
 
     # Set the modelling processor parameters
     result.modelling.mp = mp
     result.modelling.lookup = lookup
     result.modelling.block = block
+    result.modelling.cache = cache
     if params.debug.during == 'modelling':
       result.modelling.debug.output = params.debug.output
     result.modelling.debug.select = params.debug.select
@@ -356,10 +420,13 @@ def from_phil(params):
     result.integration.mp = mp
     result.integration.lookup = lookup
     result.integration.block = block
+    result.integration.cache = cache
     if params.debug.during == 'integration':
       result.integration.debug.output = params.debug.output
     result.integration.debug.select = params.debug.select
     result.integration.debug.separate_files = params.debug.separate_files
+    result.integration.stream.filename = params.stream.filename
+    result.integration.checkpoint.directory = params.checkpoint.directory
 
     result.debug_reference_filename = params.debug.reference.filename
     result.debug_reference_output = params.debug.reference.output
@@ -1347,8 +1414,15 @@ def create(params, experiments, reflections):
       for experiment in experiments:
         experiment.scan = None
 
+    # Get the integrator parameters
+    integrator_params = Parameters.from_phil(params.integration)
+    if params.integration.checkpoint.directory is not None:
+      from dials.algorithms.integration.checkpoint import parameters_digest
+      integrator_params.integration.checkpoint.parameters = \
+        parameters_digest(params)
+
     # Return an instantiation of the class
     return IntegratorClass(
       experiments,
       reflections,
-      Parameters.from_phil(params.integration))
+      integrator_params)
@@ -0,0 +1,345 @@
+/*
+ * overlaps_filter.h
+ *
+ *  Copyright (C) 2017 Diamond Light Source
+ *
+ *  This code is distributed under the BSD license, a copy of which is
+ *  included in the root directory of this package.
+ */
+
+#ifndef DIALS_ALGORITHMS_INTEGRATION_OVERLAPS_FILTER_H
+#define DIALS_ALGORITHMS_INTEGRATION_OVERLAPS_FILTER_H
+
+#include <algorithm>
+#include <vector>
+#include <dxtbx/model/detector.h>
+#include <dials/model/data/shoebox.h>
+#include <dials/array_family/scitbx_shared_and_versa.h>
+#include <dials/error.h>
+
+namespace dials { namespace algorithms {
+
+  using dxtbx::model::Detector;
+  using dials::model::Shoebox;
+  using dials::model::Valid;
+  using dials::model::Background;
+  using dials::model::Foreground;
+
+  namespace detail {
+
+    /**
+     * A label image covering a single frame of a single panel at a time. The
+     * image is sized to the largest panel and is only reset at the pixels
+     * which have been written, so that the cost of processing a frame is
+     * proportional to the area of the shoeboxes on it rather than to the
+     * size of the panel.
+     */
+    class PanelLabelImage {
+    public:
+
+      PanelLabelImage(const Detector &detector, int empty)
+        : empty_(empty),
+          width_(0),
+          height_(0) {
+        std::size_t max_size = 0;
+        for (std::size_t i = 0; i < detector.size(); ++i) {
+          std::size_t size = detector[i].get_image_size()[0] *
+                             detector[i].get_image_size()[1];
+          max_size = std::max(max_size, size);
+        }
+        data_.assign(max_size, empty);
+      }
+
+      /**
+       * Select the panel to label, clearing the previous labels
+       */
+      void set_panel(const Detector &detector, std::size_t panel) {
+        DIALS_ASSERT(panel < detector.size());
+        for (std::size_t i = 0; i < touched_.size(); ++i) {
+          data_[touched_[i]] = empty_;
+        }
+        touched_.clear();
+        width_ = detector[panel].get_image_size()[0];
+        height_ = detector[panel].get_image_size()[1];
+      }
+
+      /**
+       * Get the label at a pixel, marking the pixel to be cleared
+       */
+      int& operator()(std::size_t j, std::size_t i) {
+        std::size_t index = i + j * width_;
+        if (data_[index] == empty_) {
+          touched_.push_back(index);
+        }
+        return data_[index];
+      }
+
+      /**
+       * Get the label at a pixel without marking it
+       */
+      int get(std::size_t j, std::size_t i) const {
+        return data_[i + j * width_];
+      }
+
+      std::size_t width() const {
+        return width_;
+      }
+
+      std::size_t height() const {
+        return height_;
+      }
+
+    private:
+      int empty_;
+      std::size_t width_;
+      std::size_t height_;
+      std::vector<int> data_;
+      std::vector<std::size_t> touched_;
+    };
+
+    /**
+     * Group the shoebox indices by panel and then by frame, so that each
+     * shoebox is listed on every frame it covers.
+     */
+    class ShoeboxIndex {
+    public:
+
+      ShoeboxIndex(
+          const Detector &detector,
+          const af::const_ref< Shoebox<> > &shoeboxes)
+        : panels_(detector.size()),
+          zmin_(detector.size(), 0) {
+        std::vector<int> zmax(detector.size(), 0);
+        std::vector<bool> first(detector.size(), true);
+        for (std::size_t i = 0; i < shoeboxes.size(); ++i) {
+          const Shoebox<> &shoebox = shoeboxes[i];
+          std::size_t p = shoebox.panel;
+          DIALS_ASSERT(p < detector.size());
+          DIALS_ASSERT(shoebox.is_consistent());
+          if (first[p]) {
+            zmin_[p] = shoebox.bbox[4];
+            zmax[p] = shoebox.bbox[5];
+            first[p] = false;
+          } else {
+            zmin_[p] = std::min(zmin_[p], shoebox.bbox[4]);
+            zmax[p] = std::max(zmax[p], shoebox.bbox[5]);
+          }
+        }
+        for (std::size_t p = 0; p < panels_.size(); ++p) {
+          panels_[p].resize(zmax[p] - zmin_[p]);
+        }
+        for (std::size_t i = 0; i < shoeboxes.size(); ++i) {
+          const Shoebox<> &shoebox = shoeboxes[i];
+          std::size_t p = shoebox.panel;
+          for (int z = shoebox.bbox[4]; z < shoebox.bbox[5]; ++z) {
+            panels_[p][z - zmin_[p]].push_back(i);
+          }
+        }
+      }
+
+      /** @returns The number of frames covered on a panel */
+      std::size_t num_frames(std::size_t panel) const {
+        return panels_[panel].size();
+      }
+
+      /** @returns The frame number of the first frame on a panel */
+      int first_frame(std::size_t panel) const {
+        return zmin_[panel];
+      }
+
+      /** @returns The indices of the shoeboxes covering a frame */
+      const std::vector<std::size_t>& indices(
+          std::size_t panel,
+          std::size_t frame) const {
+        return panels_[panel][frame];
+      }
+
+    private:
+      std::vector< std::vector< std::vector<std::size_t> > > panels_;
+      std::vector<int> zmin_;
+    };
+
+    /**
+     * Visit the pixels of a shoebox on a single frame which lie on the panel
+     * @param shoebox The shoebox
+     * @param z The frame number
+     * @param width The panel width
+     * @param height The panel height
+     * @param func Called with the panel coordinates and the mask code
+     */
+    template <typename Function>
+    void for_each_pixel(
+        const Shoebox<> &shoebox,
+        int z,
+        std::size_t width,
+        std::size_t height,
+        Function &func) {
+      int k = z - shoebox.bbox[4];
+      int x0 = std::max(shoebox.bbox[0], 0);
+      int x1 = std::min(shoebox.bbox[1], (int)width);
+      int y0 = std::max(shoebox.bbox[2], 0);
+      int y1 = std::min(shoebox.bbox[3], (int)height);
+      for (int j = y0; j < y1; ++j) {
+        for (int i = x0; i < x1; ++i) {
+          int code = shoebox.mask(k, j - shoebox.bbox[2], i - shoebox.bbox[0]);
+          if (!func(j, i, code)) {
+            return;
+          }
+        }
+      }
+    }
+
+    /**
+     * Label the foreground pixels, rejecting a reflection whose foreground
+     * pixel is already labelled along with the reflection which labelled it
+     */
+    class LabelForeground {
+    public:
+      LabelForeground(PanelLabelImage &labels, af::ref<bool> keep)
+        : labels_(labels),
+          keep_(keep),
+          index_(0) {}
+
+      void set_index(std::size_t index) {
+        index_ = index;
+      }
+
+      bool operator()(int j, int i, int code) {
+        const int code_fgd = Foreground | Valid;
+        if ((code & code_fgd) == code_fgd) {
+          int &label = labels_(j, i);
+          if (label < 0) {
+            label = (int)index_;
+          } else if (label != (int)index_) {
+            keep_[label] = false;
+            keep_[index_] = false;
+          }
+        }
+        return true;
+      }
+
+    private:
+      PanelLabelImage &labels_;
+      af::ref<bool> keep_;
+      std::size_t index_;
+    };
+
+    /**
+     * Combine the mask codes of the pixels
+     */
+    class CombineCodes {
+    public:
+      CombineCodes(PanelLabelImage &codes)
+        : codes_(codes) {}
+
+      bool operator()(int j, int i, int code) {
+        if (code != 0) {
+          codes_(j, i) |= code;
+        }
+        return true;
+      }
+
+    private:
+      PanelLabelImage &codes_;
+    };
+
+    /**
+     * Look for a pixel with both foreground and background codes set
+     */
+    class FindOverlap {
+    public:
+      bool found;
+
+      FindOverlap(const PanelLabelImage &codes)
+        : found(false),
+          codes_(codes) {}
+
+      bool operator()(int j, int i, int code) {
+        const int code_overlap = Foreground | Background | Valid;
+        found = (codes_.get(j, i) & code_overlap) == code_overlap;
+        return !found;
+      }
+
+    private:
+      const PanelLabelImage &codes_;
+    };
+
+  }
+
+  /**
+   * Find the reflections whose foreground overlaps the foreground of another
+   * reflection. On each frame of each panel the foreground pixels are
+   * labelled with the first reflection to claim them; when another
+   * reflection claims a labelled pixel both are rejected.
+   * @param detector The detector model
+   * @param shoeboxes The shoeboxes
+   * @returns True for the reflections to keep
+   */
+  inline
+  af::shared<bool> foreground_foreground_overlaps_filter(
+      const Detector &detector,
+      const af::const_ref< Shoebox<> > &shoeboxes) {
+    af::shared<bool> keep(shoeboxes.size(), true);
+    detail::ShoeboxIndex index(detector, shoeboxes);
+    detail::PanelLabelImage labels(detector, -1);
+    detail::LabelForeground label_foreground(labels, keep.ref());
+    for (std::size_t p = 0; p < detector.size(); ++p) {
+      for (std::size_t f = 0; f < index.num_frames(p); ++f) {
+        int z = index.first_frame(p) + (int)f;
+        const std::vector<std::size_t> &indices = index.indices(p, f);
+        labels.set_panel(detector, p);
+        for (std::size_t n = 0; n < indices.size(); ++n) {
+          label_foreground.set_index(indices[n]);
+          detail::for_each_pixel(shoeboxes[indices[n]], z,
+            labels.width(), labels.height(), label_foreground);
+        }
+      }
+    }
+    return keep;
+  }
+
+  /**
+   * Find the reflections which touch a pixel that is in the foreground of
+   * one reflection and in the background of another. On each frame of each
+   * panel the mask codes of all the shoeboxes are combined, then any
+   * reflection whose shoebox covers a pixel with both foreground and
+   * background codes set is rejected.
+   * @param detector The detector model
+   * @param shoeboxes The shoeboxes
+   * @returns True for the reflections to keep
+   */
+  inline
+  af::shared<bool> foreground_background_overlaps_filter(
+      const Detector &detector,
+      const af::const_ref< Shoebox<> > &shoeboxes) {
+    af::shared<bool> keep(shoeboxes.size(), true);
+    detail::ShoeboxIndex index(detector, shoeboxes);
+    detail::PanelLabelImage codes(detector, 0);
+    detail::CombineCodes combine_codes(codes);
+    for (std::size_t p = 0; p < detector.size(); ++p) {
+      for (std::size_t f = 0; f < index.num_frames(p); ++f) {
+        int z = index.first_frame(p) + (int)f;
+        const std::vector<std::size_t> &indices = index.indices(p, f);
+        codes.set_panel(detector, p);
+        for (std::size_t n = 0; n < indices.size(); ++n) {
+          detail::for_each_pixel(shoeboxes[indices[n]], z,
+            codes.width(), codes.height(), combine_codes);
+        }
+        for (std::size_t n = 0; n < indices.size(); ++n) {
+          if (keep[indices[n]]) {
+            detail::FindOverlap find_overlap(codes);
+            detail::for_each_pixel(shoeboxes[indices[n]], z,
+              codes.width(), codes.height(), find_overlap);
+            if (find_overlap.found) {
+              keep[indices[n]] = false;
+            }
+          }
+        }
+      }
+    }
+    return keep;
+  }
+
+}} // namespace dials::algorithms
+
+#endif // DIALS_ALGORITHMS_INTEGRATION_OVERLAPS_FILTER_H
@@ -0,0 +1,146 @@
+#
+# prefetch.py
+#
+#  Copyright (C) 2017 Diamond Light Source
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+
+from __future__ import absolute_import, division
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ImagePrefetcher(object):
+  '''
+  Iterate through the images and masks in an imageset, optionally reading
+  ahead on a background thread.
+
+  With a depth of zero, each image is read when it is requested. Otherwise, a
+  background thread reads and decodes up to depth images ahead of the
+  consumer. Only the background thread accesses the imageset while iterating.
+
+  The read time is the time spent reading the images and the wait time is the
+  time the consumer spent waiting for an image to be available.
+
+  '''
+
+  def __init__(self, imageset, depth=0, mask=None, cache=None):
+    '''
+    Initialise the prefetcher.
+
+    :param imageset: The imageset to read
+    :param depth: The number of images to read ahead
+    :param mask: An additional mask to apply to each image
+    :param cache: A frame cache to read the images through
+
+    '''
+    assert depth >= 0, "Prefetch depth must be >= 0"
+    self.imageset = imageset
+    self.depth = depth
+    self.mask = mask
+    self.cache = cache
+    self.read_time = 0.0
+    self.wait_time = 0.0
+    self._thread = None
+    self._queue = None
+    self._stop = None
+
+  def read(self, index):
+    '''
+    Read a single image and mask.
+
+    :param index: The index of the image in the imageset
+    :return: The image and mask
+
+    '''
+    from time import time
+    st = time()
+    if self.cache is not None:
+      image, mask = self.cache.read(self.imageset, index)
+    else:
+      image = self.imageset.get_corrected_data(index)
+      mask = self.imageset.get_mask(index)
+    if self.mask is not None:
+      assert len(mask) == len(self.mask), \
+        "Mask/Image are incorrect size %d %d" % (
+          len(mask),
+          len(self.mask))
+      mask = tuple(m1 & m2 for m1, m2 in zip(self.mask, mask))
+    self.read_time += time() - st
+    return image, mask
+
+  def __len__(self):
+    return len(self.imageset)
+
+  def __iter__(self):
+    '''
+    Iterate through the images and masks.
+
+    '''
+    if self.depth == 0:
+      return self._iter_serial()
+    return self._iter_prefetch()
+
+  def _iter_serial(self):
+    from time import time
+    for i in range(len(self.imageset)):
+      st = time()
+      image, mask = self.read(i)
+      self.wait_time += time() - st
+      yield image, mask
+
+  def _iter_prefetch(self):
+    from time import time
+    import threading
+    import Queue
+    self._queue = Queue.Queue(maxsize=self.depth)
+    self._stop = threading.Event()
+    self._thread = threading.Thread(target=self._worker)
+    self._thread.daemon = True
+    self._thread.start()
+    try:
+      for i in range(len(self.imageset)):
+        st = time()
+        item = self._queue.get()
+        self.wait_time += time() - st
+        if item[0] == 'error':
+          exc_type, exc_value, exc_traceback = item[1]
+          raise exc_type, exc_value, exc_traceback
+        yield item[1]
+        del item
+    finally:
+      self.close()
+
+  def _worker(self):
+    import sys
+    try:
+      for i in range(len(self.imageset)):
+        item = ('image', self.read(i))
+        if not self._put(item):
+          return
+        del item
+    except Exception:
+      self._put(('error', sys.exc_info()))
+
+  def _put(self, item):
+    import Queue
+    while not self._stop.is_set():
+      try:
+        self._queue.put(item, timeout=0.1)
+        return True
+      except Queue.Full:
+        pass
+    return False
+
+  def close(self):
+    '''
+    Stop the background thread.
+
+    '''
+    if self._thread is not None:
+      self._stop.set()
+      self._thread.join()
+      self._thread = None
+      self._queue = None
+      self._stop = None
@@ -42,12 +42,16 @@ def __init__(self):
     self.nproc = 1
     self.njobs = 1
     self.nthreads = 1
+    self.transport = "pickle"
+    self.prefetch = 0
 
   def update(self, other):
     self.method = other.method
     self.nproc = other.nproc
     self.njobs = other.njobs
     self.nthreads = other.nthreads
+    self.transport = other.transport
+    self.prefetch = other.prefetch
 
 class Lookup(object):
   '''
@@ -71,6 +75,7 @@ def __init__(self):
     self.threshold = 0.99
     self.force = False
     self.max_memory_usage = 0.75
+    self.adaptive = False
 
   def update(self, other):
     self.size = other.size
@@ -78,6 +83,7 @@ def update(self, other):
     self.threshold = other.threshold
     self.force = other.force
     self.max_memory_usage = other.max_memory_usage
+    self.adaptive = other.adaptive
 
 class Shoebox(object):
   '''
@@ -109,6 +115,45 @@ def update(self, other):
     self.split_experiments = other.split_experiments
     self.separate_files = other.separate_files
 
+class Stream(object):
+  '''
+  Streaming output parameters
+
+  '''
+  def __init__(self):
+    self.filename = None
+
+  def update(self, other):
+    self.filename = other.filename
+
+class Checkpoint(object):
+  '''
+  Checkpoint parameters
+
+  '''
+  def __init__(self):
+    self.directory = None
+    self.parameters = None
+
+  def update(self, other):
+    self.directory = other.directory
+    self.parameters = other.parameters
+
+class Cache(object):
+  '''
+  Frame cache parameters
+
+  '''
+  def __init__(self):
+    self.enable = False
+    self.directory = None
+    self.max_size = 2.0
+
+  def update(self, other):
+    self.enable = other.enable
+    self.directory = other.directory
+    self.max_size = other.max_size
+
 class Parameters(object):
   '''
   Class to handle parameters for the processor
@@ -124,6 +169,9 @@ def __init__(self):
     self.block = Block()
     self.shoebox = Shoebox()
     self.debug = Debug()
+    self.stream = Stream()
+    self.checkpoint = Checkpoint()
+    self.cache = Cache()
 
   def update(self, other):
     '''
@@ -135,6 +183,9 @@ def update(self, other):
     self.block.update(other.block)
     self.shoebox.update(other.shoebox)
     self.debug.update(other.debug)
+    self.stream.update(other.stream)
+    self.checkpoint.update(other.checkpoint)
+    self.cache.update(other.cache)
 
 
 class TimingInfo(object):
@@ -144,18 +195,22 @@ class TimingInfo(object):
   '''
   def __init__(self):
     self.read = 0
+    self.read_wait = 0
     self.extract = 0
     self.initialize = 0
     self.process = 0
     self.finalize = 0
     self.total = 0
     self.user = 0
+    self.cache_hits = 0
+    self.cache_misses = 0
 
   def __str__(self):
     ''' Convert to string. '''
     from libtbx.table_utils import format as table
     rows = [
       ["Read time"        , "%.2f seconds" % (self.read)       ],
+      ["Read wait time"   , "%.2f seconds" % (self.read_wait)  ],
       ["Extract time"     , "%.2f seconds" % (self.extract)    ],
       ["Pre-process time" , "%.2f seconds" % (self.initialize) ],
       ["Process time"     , "%.2f seconds" % (self.process)    ],
@@ -163,6 +218,10 @@ def __str__(self):
       ["Total time"       , "%.2f seconds" % (self.total)      ],
       ["User time"        , "%.2f seconds" % (self.user)       ],
     ]
+    lookups = self.cache_hits + self.cache_misses
+    if lookups > 0:
+      rows.append(["Frame cache hits", "%d / %d (%.1f%%)" % (
+        self.cache_hits, lookups, 100.0 * self.cache_hits / lookups)])
     return table(rows, justify='right', prefix=' ')
 
 
@@ -172,11 +231,23 @@ class ExecuteParallelTask(object):
 
   '''
 
+  def __init__(self, transport_directory=None):
+    '''
+    :param transport_directory: If set, return the reflections through a
+                                shared memory file in this directory
+
+    '''
+    self.transport_directory = transport_directory
+
   def __call__(self, task):
     from dials.util import log
     import logging
     log.config_simple_cached()
     result = task()
+    if self.transport_directory is not None and len(result.reflections) > 0:
+      from dials.util.mp import SharedMemoryTable
+      result.reflections = SharedMemoryTable(
+        result.reflections, self.transport_directory)
     handlers = logging.getLogger('dials').handlers
     assert len(handlers) == 1, "Invalid number of logging handlers"
     return result, handlers[0].messages()
@@ -254,21 +325,30 @@ def process(self):
     else:
       logger.info(' Using multiprocessing with %d parallel job(s)\n' % (mp_nproc))
     if mp_njobs * mp_nproc > 1:
+      transport_directory = self.transport_directory(mp_method, mp_njobs)
       def process_output(result):
+        from dials.util.mp import SharedMemoryTable
         for message in result[1]:
           logger.log(message.levelno, message.msg)
+        if isinstance(result[0].reflections, SharedMemoryTable):
+          result[0].reflections = result[0].reflections.load()
         self.manager.accumulate(result[0])
         result[0].reflections = None
         result[0].data = None
-      multi_node_parallel_map(
-        func                       = ExecuteParallelTask(),
-        iterable                   = list(self.manager.tasks()),
-        njobs                      = mp_njobs,
-        nproc                      = mp_nproc,
-        callback                   = process_output,
-        cluster_method             = mp_method,
-        preserve_order             = True,
-        preserve_exception_message = True)
+      try:
+        multi_node_parallel_map(
+          func                       = ExecuteParallelTask(transport_directory),
+          iterable                   = list(self.manager.tasks()),
+          njobs                      = mp_njobs,
+          nproc                      = mp_nproc,
+          callback                   = process_output,
+          cluster_method             = mp_method,
+          preserve_order             = True,
+          preserve_exception_message = True)
+      finally:
+        if transport_directory is not None:
+          import shutil
+          shutil.rmtree(transport_directory, ignore_errors=True)
     else:
       for task in self.manager.tasks():
         self.manager.accumulate(task())
@@ -278,6 +358,29 @@ def process_output(result):
     result1, result2 = self.manager.result()
     return result1, result2, self.manager.time
 
+  def transport_directory(self, mp_method, mp_njobs):
+    '''
+    Create a directory in shared memory through which the workers return
+    their reflections, if requested.
+
+    :param mp_method: The cluster method
+    :param mp_njobs: The number of cluster jobs
+    :return: The directory or None to return the reflections through pickle
+
+    '''
+    import tempfile
+    from dials.util.mp import shared_memory_directory
+    if self.manager.params.mp.transport != 'shm':
+      return None
+    if mp_njobs > 1 and mp_method not in (None, 'none', 'multiprocessing'):
+      logger.warn(
+        'Shared memory transport is not available with %s; using pickle' %
+        mp_method)
+      return None
+    return tempfile.mkdtemp(
+      prefix='dials_integrate_',
+      dir=shared_memory_directory())
+
 
 class Result(object):
   '''
@@ -325,6 +428,9 @@ def __call__(self):
     '''
     result = Result(self.index, self.reflections, None)
     result.read_time = 0
+    result.read_wait_time = 0
+    result.cache_hits = 0
+    result.cache_misses = 0
     result.extract_time = 0
     result.process_time = 0
     result.total_time = 0
@@ -378,6 +484,8 @@ def __call__(self):
     from dials.array_family import flex
     from time import time
     from dials.model.data import make_image
+    from dials.algorithms.integration.prefetch import ImagePrefetcher
+    from dials.util.frame_cache import FrameCache
     from libtbx.introspection import machine_memory_info
 
     # Get the start time
@@ -462,20 +570,19 @@ def __call__(self):
         logger.info('  Required shoebox memory: %g GB' % (sbox_memory/1e9))
         logger.info('')
 
-    # Loop through the imageset, extract pixels and process reflections
-    read_time = 0.0
-    for i in range(len(imageset)):
-      st = time()
-      image = imageset.get_corrected_data(i)
-      mask = imageset.get_mask(i)
-      if self.params.lookup.mask is not None:
-        assert len(mask) == len(self.params.lookup.mask), \
-          "Mask/Image are incorrect size %d %d" % (
-            len(mask),
-            len(self.params.lookup.mask))
-        mask = tuple(m1 & m2 for m1, m2 in zip(self.params.lookup.mask, mask))
-
-      read_time += time() - st
+    # Loop through the imageset, extract pixels and process reflections. The
+    # images are optionally read ahead while the reflections are processed
+    cache = None
+    if self.params.cache.enable:
+      cache = FrameCache(
+        self.params.cache.directory,
+        self.params.cache.max_size * 1e9)
+    images = ImagePrefetcher(
+      imageset,
+      depth=self.params.mp.prefetch,
+      mask=self.params.lookup.mask,
+      cache=cache)
+    for image, mask in images:
       processor.next(make_image(image, mask), self.executor)
       del image
       del mask
@@ -503,13 +610,112 @@ def __call__(self):
 
     # Return the result
     result = Result(self.index, self.reflections, self.executor.data())
-    result.read_time = read_time
+    result.read_time = images.read_time
+    result.read_wait_time = images.wait_time
+    if cache is not None:
+      result.cache_hits = cache.hits
+      result.cache_misses = cache.misses
+    else:
+      result.cache_hits = 0
+      result.cache_misses = 0
     result.extract_time = processor.extract_time()
     result.process_time = processor.process_time()
     result.total_time = time() - start_time
     return result
 
 
+def adaptive_job_frames(frames, memory, cost, half_size, min_half=1,
+                        budget=None, target=None):
+  '''
+  Compute job frame ranges whose size adapts to the reflections on each frame.
+
+  Jobs are made from pairs of adjacent half blocks, starting from uniform half
+  blocks. Half blocks are split while a job needs more than the memory budget
+  or costs more than twice the target; adjacent half blocks are then merged
+  while the jobs affected cost less than the target and fit in the budget.
+
+  :param frames: The range of frames
+  :param memory: The shoebox memory active on each frame
+  :param cost: The processing cost of the reflections starting on each frame
+  :param half_size: The initial number of frames in a half block
+  :param min_half: The minimum number of frames in a half block
+  :param budget: The memory budget for each job (None for no limit)
+  :param target: The target cost of each job (None to not merge blocks)
+  :return: The list of job frame ranges
+
+  '''
+  f0, f1 = frames
+  assert f1 > f0, "Invalid frame range"
+  assert len(memory) == f1 - f0, "Invalid memory profile"
+  assert len(cost) == f1 - f0, "Invalid cost profile"
+  half_size = max(1, half_size)
+  min_half = max(1, min_half)
+  memory = list(memory)
+  total = [0]
+  for c in cost:
+    total.append(total[-1] + c)
+
+  def window_memory(w):
+    return max(memory[w[0]-f0:w[1]-f0])
+
+  def window_cost(w):
+    return total[w[1]-f0] - total[w[0]-f0]
+
+  def windows(halves):
+    if len(halves) == 1:
+      return [halves[0]]
+    return [(halves[j][0], halves[j+1][1]) for j in range(len(halves)-1)]
+
+  def too_large(w):
+    if budget is not None and window_memory(w) > budget:
+      return True
+    if target is not None and window_cost(w) > 2 * target:
+      return True
+    return False
+
+  def can_merge(w):
+    if target is None or window_cost(w) > target:
+      return False
+    if budget is not None and window_memory(w) > budget:
+      return False
+    return True
+
+  # Start with uniform half blocks
+  halves = [(i, min(i + half_size, f1)) for i in range(f0, f1, half_size)]
+
+  # Split the more expensive half of each job which is too large
+  while True:
+    selected = set()
+    for j, w in enumerate(windows(halves)):
+      if too_large(w):
+        candidates = [k for k in (j, j+1)
+                      if k < len(halves)
+                      and halves[k][1] - halves[k][0] >= 2 * min_half]
+        if len(candidates) > 0:
+          selected.add(max(candidates, key=lambda k: window_cost(halves[k])))
+    if len(selected) == 0:
+      break
+    split = []
+    for k, (h0, h1) in enumerate(halves):
+      if k in selected:
+        hm = h0 + (h1 - h0) // 2
+        split.extend([(h0, hm), (hm, h1)])
+      else:
+        split.append((h0, h1))
+    halves = split
+
+  # Merge adjacent half blocks while the jobs are cheap enough
+  j = 0
+  while j < len(halves) - 1:
+    merged = halves[:j] + [(halves[j][0], halves[j+1][1])] + halves[j+2:]
+    affected = windows(merged)[max(0, j-1):j+1]
+    if all(can_merge(w) for w in affected):
+      halves = merged
+    else:
+      j += 1
+  return windows(halves)
+
+
 class Manager(object):
   '''
   A class to manage processing book-keeping
@@ -545,6 +751,12 @@ def __init__(self, experiments, reflections, params):
     # Initialise the timing information
     self.time = TimingInfo()
 
+    # The streaming output writer
+    self.writer = None
+
+    # The checkpoint directory
+    self.checkpoint = None
+
   def initialize(self):
     '''
     Initialise the processing
@@ -567,6 +779,21 @@ def initialize(self):
     # Create the reflection manager
     self.manager = ReflectionManager(self.jobs, self.reflections)
 
+    # Optionally append the results of each job to disk as they arrive rather
+    # than accumulating them in the reflection table
+    if self.params.stream.filename is not None:
+      from dials.array_family.columnar import ChunkedWriter
+      logger.info(' Streaming processed reflections to %s\n' %
+                  self.params.stream.filename)
+      self.writer = ChunkedWriter(self.params.stream.filename)
+      self.streamed = [False] * len(self.manager)
+
+    # Optionally save the results of each job as it finishes and reuse the
+    # results of any jobs completed by a previous run
+    self.completed = set()
+    if self.params.checkpoint.directory is not None:
+      self.restore_checkpoint()
+
     # Parallel reading of HDF5 from the same handle is not allowed. Python
     # multiprocessing is a bit messed up and used fork on linux so need to
     # close and reopen file.
@@ -578,6 +805,29 @@ def initialize(self):
     # Set the initialization time
     self.time.initialize = time() - start_time
 
+  def restore_checkpoint(self):
+    '''
+    Open the checkpoint directory and accumulate the results of any jobs
+    which have already been completed with the same input.
+
+    '''
+    from dials.algorithms.integration.checkpoint import CheckpointDirectory
+    from dials.algorithms.integration.checkpoint import checkpoint_key
+    directory = self.params.checkpoint.directory
+    key = checkpoint_key(
+      self.experiments,
+      self.reflections,
+      self.manager,
+      self.params.checkpoint.parameters)
+    self.checkpoint = CheckpointDirectory(directory, key)
+    completed = [i for i in self.checkpoint.completed() if i < len(self.manager)]
+    logger.info(' Checkpointing jobs to %s' % directory)
+    logger.info(' Reusing %d of %d jobs from previous run\n' % (
+      len(completed), len(self.manager)))
+    for index in completed:
+      self.accumulate(self.checkpoint.load(index))
+      self.completed.add(index)
+
   def task(self, index):
     '''
     Get a task.
@@ -612,13 +862,27 @@ def tasks(self):
 
     '''
     for i in range(len(self)):
-      yield self.task(i)
+      if i not in self.completed:
+        yield self.task(i)
 
   def accumulate(self, result):
     ''' Accumulate the results. '''
+    if self.checkpoint is not None and result.index not in self.completed:
+      self.checkpoint.save(result)
     self.data[result.index] = result.data
-    self.manager.accumulate(result.index, result.reflections)
+    if self.writer is not None:
+      assert not self.streamed[result.index], "Job already accumulated"
+      if len(result.reflections) > 0:
+        self.writer.append(
+          result.reflections,
+          self.manager.indices(result.index))
+      self.streamed[result.index] = True
+    else:
+      self.manager.accumulate(result.index, result.reflections)
     self.time.read += result.read_time
+    self.time.read_wait += result.read_wait_time
+    self.time.cache_hits += result.cache_hits
+    self.time.cache_misses += result.cache_misses
     self.time.extract += result.extract_time
     self.time.process += result.process_time
     self.time.total += result.total_time
@@ -633,13 +897,50 @@ def finalize(self):
     # Get the start time
     start_time = time()
 
-    # Check manager is finished
-    assert self.manager.finished(), "Manager is not finished"
+    # Check manager is finished and merge any streamed results
+    if self.writer is not None:
+      assert all(self.streamed), "Manager is not finished"
+      self.writer.close()
+      self.merge_stream()
+    else:
+      assert self.manager.finished(), "Manager is not finished"
 
     # Update the time and finalized flag
     self.time.finalize = time() - start_time
     self.finalized = True
 
+  def merge_stream(self):
+    '''
+    Merge the streamed results back into the reflection table.
+
+    The columns are read from the stream one block at a time so that only a
+    single column of a single block of the streamed data is in memory at
+    once. A column is only merged for the blocks which contain it, so the
+    rows of other jobs keep their input values. Shoeboxes are left in the
+    streamed file.
+
+    '''
+    import os
+    from dials.array_family import flex
+    from dials.array_family import columnar
+    filename = self.params.stream.filename
+    if self.writer.nblocks == 0 or not os.path.exists(filename):
+      logger.info(' No processed reflections in %s to merge' % filename)
+      return
+    with columnar.Reader(filename) as reader:
+      logger.info(' Merging %d reflections in %d blocks from %s' % (
+        reader.nrows, reader.nblocks, filename))
+      for key in reader.keys():
+        if key == 'shoebox':
+          logger.info(' Shoeboxes have been kept in %s' % filename)
+          continue
+        for block in range(reader.nblocks):
+          if key not in reader.block_keys(block):
+            continue
+          table = flex.reflection_table()
+          table[key] = reader.block_column(block, key)
+          self.reflections.set_selected(reader.block_index(block), table)
+
   def result(self):
     '''
     Return the result.
@@ -648,6 +949,8 @@ def result(self):
 
     '''
     assert self.finalized, "Manager is not finalized"
+    if self.writer is not None:
+      return self.reflections, self.data
     return self.manager.data(), self.data
 
   def finished(self):
@@ -657,6 +960,8 @@ def finished(self):
     :return: True/False all tasks have finished
 
     '''
+    if self.writer is not None:
+      return self.finalized and all(self.streamed)
     return self.finalized and self.manager.finished()
 
   def __len__(self):
@@ -700,6 +1005,7 @@ def compute_jobs(self):
       lambda x: (id(self.experiments[x].imageset),
                  id(self.experiments[x].scan)))
     self.jobs = JobList()
+    blocks = []
     for key, indices in groups:
       indices = list(indices)
       i0 = indices[0]
@@ -723,9 +1029,76 @@ def compute_jobs(self):
         block_size_frames = int(ceil(self.params.block.size))
       else:
         raise RuntimeError('Unknown block_size_units = %s' % block_size_units)
-      self.jobs.add((i0, i1), array_range, block_size_frames)
+      blocks.append(((i0, i1), array_range, block_size_frames))
+    if self.params.block.adaptive:
+      self.compute_adaptive_jobs(blocks)
+    else:
+      for expr, array_range, block_size_frames in blocks:
+        self.jobs.add(expr, array_range, block_size_frames)
     assert len(self.jobs) > 0, "Invalid number of jobs"
 
+  def compute_adaptive_jobs(self, blocks):
+    '''
+    Compute jobs whose size adapts to the shoebox memory and processing cost
+    of the reflections on each frame.
+
+    :param blocks: The list of (experiments, frames, block size) for each group
+
+    '''
+    from libtbx.introspection import machine_memory_info
+    from math import ceil
+    from scitbx.array_family import shared
+    from dials.array_family import flex
+
+    # The approximate cost of each reflection in addition to its pixels
+    overhead = 100
+
+    # Half blocks must contain most reflections
+    assert self.params.block.threshold > 0, "Threshold must be > 0"
+    assert self.params.block.threshold <= 1.0, "Threshold must be < 1"
+    x0, x1, y0, y1, z0, z1 = self.reflections['bbox'].parts()
+    nframes = z1 - z0
+    min_half = 1
+    if len(nframes) > 0:
+      nframes = nframes.select(flex.sort_permutation(nframes))
+      cutoff = min(int(self.params.block.threshold*len(nframes)), len(nframes)-1)
+      min_half = max(1, nframes[cutoff])
+
+    # The memory available to each process
+    nproc = self.params.mp.nproc
+    nworkers = self.params.mp.nproc * self.params.mp.njobs
+    total_memory = machine_memory_info().memory_total()
+    budget = None
+    if total_memory is not None:
+      budget = total_memory * self.params.block.max_memory_usage / nproc
+
+    # Aim for several jobs per process to balance the load
+    profiles = [
+      frame_profile(
+        self.reflections,
+        expr,
+        array_range,
+        self.params.shoebox.flatten,
+        overhead)
+      for expr, array_range, block_size_frames in blocks]
+    target = None
+    if nworkers > 1:
+      total_cost = sum(flex.sum(cost) for memory, cost in profiles)
+      target = total_cost / (nworkers * 4)
+
+    # Add the jobs for each group
+    for (expr, array_range, block_size_frames), (memory, cost) in zip(
+        blocks, profiles):
+      frames = adaptive_job_frames(
+        array_range,
+        memory,
+        cost,
+        half_size=int(ceil(block_size_frames / 2)),
+        min_half=min_half,
+        budget=budget,
+        target=target)
+      self.jobs.add(expr, array_range, shared.tiny_int_2(frames))
+
   def split_reflections(self):
     '''
     Split the reflections into partials or over job boundaries
@@ -838,7 +1211,11 @@ def summary(self):
     task_table = table(rows, has_header=True, justify="right", prefix=" ")
 
     # The format string
-    if self.params.block.size is None:
+    units = self.params.block.units
+    if self.params.block.adaptive:
+      block_size = "adaptive"
+      units = ""
+    elif self.params.block.size is None:
       block_size = "auto"
     else:
       block_size = str(self.params.block.size)
@@ -849,7 +1226,7 @@ def summary(self):
       '\n'
       '%s\n'
     )
-    return fmt % (block_size, self.params.block.units, task_table)
+    return fmt % (block_size, units, task_table)
 
 
 class ManagerRot(Manager):
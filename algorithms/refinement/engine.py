@@ -165,15 +165,21 @@ def __init__(self, target, prediction_parameterisation, constraints_manager=None
   def get_num_steps(self):
     return self.history.get_nrows() - 1
 
-  def prepare_for_step(self):
-    """Update the parameterisation and prepare the target function"""
+  def set_parameter_values(self):
+    """Set the parameterisation to the current parameter vector"""
 
     x = self.x
     if self._constr_manager is not None:
       x = self._constr_manager.expand_parameters(x)
+    self._parameters.set_param_vals(x)
+
+    return
+
+  def prepare_for_step(self):
+    """Update the parameterisation and prepare the target function"""
 
     # set current parameter values
-    self._parameters.set_param_vals(x)
+    self.set_parameter_values()
 
     # do reflection prediction
     self._target.predict()
@@ -328,6 +334,11 @@ def set_nproc(self, nproc):
     self._nproc = nproc
     return
 
+  def set_jacobian_chunk_size(self, chunk_size):
+    """Set the maximum number of reflections for which a Jacobian is built
+    at once. Only engines that accumulate normal equations implement this"""
+    raise NotImplementedError()
+
   def run(self):
     """
     To be implemented by derived class. It is expected that each step of
@@ -493,6 +504,179 @@ def compute_functional_gradients_diag(self):
     return self._f, self._g, diags
 
 
+class BuildUpWorkerPool(object):
+  """A pool of worker processes that persists for a whole refinement run.
+
+  The workers are forked from the refinery, so each has its own copy of the
+  target, parameterisation and reflection manager. At each step the refinery
+  predicts all the matches, then sends the parameter vector and, for each
+  block, the indices of the matches in the block to the workers. A worker sets
+  the parameters and predicts only the reflections of its block, which sets up
+  the parameterisation for the gradients of those reflections, then calculates
+  the residuals, Jacobian and weights for the block. So each match is
+  predicted twice per step, once by the refinery and once by a worker, but no
+  worker predicts the whole set.
+
+  The residuals, Jacobian and weights are returned as raw buffers in memory
+  backed files, encoded as the columns of a columnar reflection file, rather
+  than through the pipe. They are passed to the callback in block order so
+  that the normal equations are accumulated in the same order as the serial
+  calculation."""
+
+  def __init__(self, refinery, nproc):
+
+    import multiprocessing
+    self._refinery = refinery
+    self._tasks = multiprocessing.Queue()
+    self._results = multiprocessing.Queue()
+    self._step = 0
+    self._workers = []
+    for i in range(nproc):
+      worker = multiprocessing.Process(target=self._work)
+      worker.daemon = True
+      worker.start()
+      self._workers.append(worker)
+
+  def _work(self):
+    """The main loop of a worker process"""
+
+    import traceback
+    refinery = self._refinery
+    target = refinery._target
+    current_step = None
+    while True:
+      task = self._tasks.get()
+      if task is None:
+        break
+      step, x, iblock, isel = task
+      try:
+        if step != current_step:
+          refinery.x = x
+          refinery.set_parameter_values()
+          current_step = step
+        block = target.predict_for_matches(isel)
+        result = target.compute_residuals_and_gradients(block)
+        del block
+        filename, header = self._dump(result)
+        del result
+        self._results.put((step, iblock, filename, header, None))
+      except Exception:
+        self._results.put((step, iblock, None, None, traceback.format_exc()))
+
+  def _get_result(self):
+    """Wait for the next result, checking that the workers are still alive"""
+
+    import Queue
+    while True:
+      try:
+        return self._results.get(timeout=1)
+      except Queue.Empty:
+        if not all(worker.is_alive() for worker in self._workers):
+          raise RuntimeError("A refinement worker process has died")
+
+  @staticmethod
+  def _dump(result):
+    """Write the residuals, Jacobian and weights to a memory backed file,
+    returning the filename and a header with the encoding and size of each"""
+
+    import os
+    import tempfile
+    from dials.array_family.columnar import encode_column
+    from dials.util.mp import shared_memory_directory
+    fd, filename = tempfile.mkstemp(prefix='dials_refinement_',
+      suffix='.bin', dir=shared_memory_directory())
+    header = []
+    try:
+      with os.fdopen(fd, 'wb') as outfile:
+        for item in result:
+          name, encoding, buf = encode_column(item)
+          shape = item.all() if isinstance(item, flex.double) else None
+          header.append((name, encoding, len(buf), shape))
+          outfile.write(buf)
+          del buf
+    except Exception:
+      os.remove(filename)
+      raise
+    return filename, header
+
+  @staticmethod
+  def _load(filename, header):
+    """Read the residuals, Jacobian and weights and remove the file"""
+
+    import os
+    from dials.array_family.columnar import decode_column
+    result = []
+    try:
+      with open(filename, 'rb') as infile:
+        for name, encoding, size, shape in header:
+          item = decode_column(name, encoding, infile.read(size))
+          if shape is not None and len(shape) > 1:
+            item.reshape(flex.grid(*shape))
+          result.append(item)
+    finally:
+      os.remove(filename)
+    return result
+
+  def map(self, x, blocks, callback):
+    """Calculate the residuals, Jacobian and weights for each block of matches
+    at the parameter values x, and pass them to the callback in block order.
+    The blocks must be consecutive slices of the matches, as returned by
+    split_matches, and already predicted at x by the refinery"""
+
+    import os
+    self._step += 1
+    isel = self._refinery._target.get_matches_iselection()
+    assert len(isel) == sum(len(block) for block in blocks)
+    start = 0
+    for iblock, block in enumerate(blocks):
+      end = start + len(block)
+      self._tasks.put((self._step, x, iblock, isel[start:end]))
+      start = end
+    nblocks = len(blocks)
+    pending = {}
+    next_block = 0
+    try:
+      while next_block < nblocks:
+        step, iblock, filename, header, error = self._get_result()
+        assert step == self._step
+        if error is not None:
+          raise RuntimeError(
+            "Error in refinement worker process:\n%s" % error)
+        pending[iblock] = (filename, header)
+        while next_block in pending:
+          callback(*self._load(*pending.pop(next_block)))
+          next_block += 1
+    except Exception:
+      for filename, header in pending.values():
+        os.remove(filename)
+      self.close(terminate=True)
+      raise
+
+  def close(self, terminate=False):
+    """Stop the worker processes and remove any results not collected"""
+
+    import os
+    import Queue
+    if terminate:
+      for worker in self._workers:
+        worker.terminate()
+    else:
+      for worker in self._workers:
+        self._tasks.put(None)
+    for worker in self._workers:
+      worker.join(timeout=5)
+      if worker.is_alive():
+        worker.terminate()
+        worker.join()
+    self._workers = []
+    while True:
+      try:
+        step, iblock, filename, header, error = self._results.get_nowait()
+      except Queue.Empty:
+        break
+      if filename is not None and os.path.exists(filename):
+        os.remove(filename)
+
 class AdaptLstbx(
     Refinery,
     normal_eqns.non_linear_ls,
@@ -517,6 +701,12 @@ def __init__(self, target, prediction_parameterisation, constraints_manager=None
     # keep attribute for the Cholesky factor required for ESD calculation
     self.cf = None
 
+    # worker processes for build_up, created on first use if nproc > 1
+    self._worker_pool = None
+
+    # maximum number of reflections for which a Jacobian is built at once
+    self._jacobian_chunk_size = None
+
     normal_eqns.non_linear_ls.__init__(self, n_parameters = len(self.x))
 
   def restart(self):
@@ -526,6 +716,27 @@ def restart(self):
   def parameter_vector_norm(self):
     return self.x.norm()
 
+  def set_jacobian_chunk_size(self, chunk_size):
+    self._jacobian_chunk_size = chunk_size
+    return
+
+  def split_matches(self):
+    """Split the matches into the blocks for which a Jacobian is calculated
+    and added to the normal equations. These are chunks of fixed maximum size
+    if a Jacobian chunk size is set, otherwise blocks determined by the target
+    and the number of processes"""
+
+    if self._jacobian_chunk_size is not None:
+      return self._target.split_matches_into_chunks(self._jacobian_chunk_size)
+    return self._target.split_matches_into_blocks(nproc=self._nproc)
+
+  def close_worker_pool(self):
+    """Stop any worker processes used by build_up"""
+
+    if self._worker_pool is not None:
+      self._worker_pool.close()
+      self._worker_pool = None
+
   def build_up(self, objective_only=False):
 
     # code here to calculate the residuals. Rely on the target class
@@ -546,39 +757,39 @@ def build_up(self, objective_only=False):
       residuals, weights = self._target.compute_residuals()
       self.add_residuals(residuals, weights)
     else:
-      blocks = self._target.split_matches_into_blocks(nproc = self._nproc)
+      blocks = self.split_matches()
 
       if self._nproc > 1:
 
         # ensure the jacobian is not tracked
         self._jacobian = None
 
-        # processing functions
-        def task_wrapper(block):
-          residuals, jacobian, weights = \
-            self._target.compute_residuals_and_gradients(block)
-          return dict(residuals=residuals,
-                      jacobian=jacobian,
-                      weights=weights)
-        def callback_wrapper(result):
-          j = result['jacobian']
+        # the workers persist between steps and are sent the parameter vector
+        # and the indices of the matches in each block, which they predict
+        # again to set up the gradient calculation
+        if self._worker_pool is None:
+          self._worker_pool = BuildUpWorkerPool(self, self._nproc)
+
+        def callback(residuals, jacobian, weights):
           if self._constr_manager is not None:
-            j = self._constr_manager.constrain_jacobian(j)
-          self.add_equations(result['residuals'], j, result['weights'])
-          # no longer need the result
-          result['residuals'] = None
-          result['jacobian'] = None
-          result['weights'] = None
+            jacobian = self._constr_manager.constrain_jacobian(jacobian)
+          self.add_equations(residuals, jacobian, weights)
           return
 
-        task_results = easy_mp.parallel_map(
-          func=task_wrapper,
-          iterable=blocks,
-          processes=self._nproc,
-          callback=callback_wrapper,
-          method="multiprocessing",
-          #preserve_exception_message=True
-          )
+        self._worker_pool.map(self.x, blocks, callback)
+
+      elif self._jacobian_chunk_size is not None:
+
+        # accumulate the normal equations one chunk at a time, keeping no
+        # reference to the Jacobian of each chunk once it has been added
+        self._jacobian = None
+        while blocks:
+          residuals, j, weights = \
+            self._target.compute_residuals_and_gradients(blocks.pop(0))
+          if self._constr_manager is not None:
+            j = self._constr_manager.constrain_jacobian(j)
+          self.add_equations(residuals, j, weights)
+          del residuals, j, weights
 
       else:
         for block in blocks:
@@ -696,6 +907,13 @@ def __init__(self, target, prediction_parameterisation, constraints_manager=None
     libtbx.adopt_optional_init_args(self, kwds)
 
   def run(self):
+    try:
+      self._run_core()
+    finally:
+      self.close_worker_pool()
+    return
+
+  def _run_core(self):
     self.n_iterations = 0
 
     # prepare for first step
@@ -908,6 +1126,9 @@ def _run_core(self):
     return
 
   def run(self):
-    self._run_core()
+    try:
+      self._run_core()
+    finally:
+      self.close_worker_pool()
     self.calculate_esds()
     return
@@ -44,6 +44,9 @@ def __init__(self, cols=None,
       separate_panels=separate_panels,
       block_width=block_width)
 
+    # FastMCD draws random subsets of the data
+    self._uses_random_numbers = True
+
     # Keep the FastMCD options here
     self._alpha = alpha
     self._max_n_groups = max_n_groups
@@ -40,6 +40,13 @@ def __init__(self, cols=None,
 
     self._verbosity = 0
 
+    # number of processes over which to distribute the jobs
+    self._nproc = 1
+
+    # whether _detect_outliers draws random numbers, in which case each job
+    # is run with its own seed
+    self._uses_random_numbers = False
+
     return
 
   def get_block_width(self, exp_id=None):
@@ -61,6 +68,10 @@ def set_block_width(self, block_width):
   def set_verbosity(self, verbosity):
     self._verbosity = verbosity
 
+  def set_nproc(self, nproc):
+    """Set the number of processes used to run the outlier detection jobs"""
+    self._nproc = nproc
+
   def _detect_outliers(cols):
     """Perform outlier detection using the input cols and return a flex.bool
     indicating which rows in the cols are considered outlying. cols should be
@@ -161,6 +172,38 @@ def __call__(self, reflections):
       # keep the splits as they are
       jobs3 = jobs2
 
+    # determine the outliers for every job with enough reflections. If the
+    # detection uses random numbers then each job is given its own random seed,
+    # so that the outliers found do not depend on the order in which the jobs
+    # are run, or whether they are run in parallel. One more seed is drawn to
+    # reseed the generator afterwards, so that it is left in the same state
+    # whether or not the jobs were run in this process
+    if self._uses_random_numbers:
+      seeds = flex.random_size_t(len(jobs3) + 1, 2**31 - 1)
+    to_detect = [i for i, job in enumerate(jobs3)
+                 if len(job['indices']) >= self._min_num_obs]
+
+    def detect_outliers(i):
+      if self._uses_random_numbers:
+        flex.set_random_seed(int(seeds[i]))
+      data = jobs3[i]['data']
+      return self._detect_outliers([data[col] for col in self._cols])
+
+    if self._nproc > 1 and len(to_detect) > 1:
+      from libtbx import easy_mp
+      results = easy_mp.parallel_map(
+        func=detect_outliers,
+        iterable=to_detect,
+        processes=min(self._nproc, len(to_detect)),
+        method="multiprocessing",
+        preserve_order=True,
+        preserve_exception_message=True)
+    else:
+      results = [detect_outliers(i) for i in to_detect]
+    if self._uses_random_numbers:
+      flex.set_random_seed(int(seeds[len(jobs3)]))
+    job_outliers = dict(zip(to_detect, results))
+
     # Work out the format of the jobs table
     if self._verbosity > 0:
       header = ['Job']
@@ -173,7 +216,6 @@ def __call__(self, reflections):
     # now loop over the lowest level of splits
     for i, job in enumerate(jobs3):
 
-      data = job['data']
       indices = job['indices']
       iexp = job['id']
       ipanel = job['panel']
@@ -181,14 +223,8 @@ def __call__(self, reflections):
 
       if nref >= self._min_num_obs:
 
-        # get the subset of data as a list of columns
-        cols = [data[col] for col in self._cols]
-
-        # determine the position of outliers on this sub-dataset
-        outliers = self._detect_outliers(cols)
-
         # get positions of outliers from the original matches
-        ioutliers = indices.select(outliers)
+        ioutliers = indices.select(job_outliers[i])
 
       elif nref > 0:
         # too few reflections in the job
@@ -371,7 +407,8 @@ def __call__(self, reflections):
 class CentroidOutlierFactory(object):
 
   @classmethod
-  def from_parameters_and_colnames(cls, params, colnames, verbosity=0):
+  def from_parameters_and_colnames(cls, params, colnames, verbosity=0,
+                                   nproc=1):
 
     # id the relevant scope for the requested method
     method = params.outlier.algorithm
@@ -402,6 +439,7 @@ def from_parameters_and_colnames(cls, params, colnames, verbosity=0):
       block_width=params.outlier.block_width,
       **kwargs)
     od.set_verbosity(verbosity)
+    od.set_nproc(nproc)
     return od
 
 if __name__ == "__main__":
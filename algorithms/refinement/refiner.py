@@ -309,6 +309,15 @@
       .help = "Maximum number of iterations in refinement before termination."
               "None implies the engine supplies its own default."
       .type = int(value_min=1)
+
+    jacobian_chunk_size = None
+      .help = "For the GaussNewton, LevMar and SparseLevMar engines, accumulate"
+              "the normal equations in chunks of at most this many reflections."
+              "The Jacobian for each chunk is added to the normal matrix and"
+              "discarded, so the memory required depends on the number of"
+              "parameters but not on the number of reflections."
+      .type = int(value_min=1)
+      .expert_level = 2
   }
 
   target
@@ -1593,6 +1602,13 @@ def config_refinery(params, target, pred_param, constraints_manager,
         logger.warning("Could not set nproc={0} for refinement engine of type {1}".format(
           nproc, options.engine))
 
+    if options.jacobian_chunk_size is not None:
+      try:
+        engine.set_jacobian_chunk_size(options.jacobian_chunk_size)
+      except NotImplementedError:
+        logger.warning("Could not set jacobian_chunk_size={0} for refinement engine of type {1}".format(
+          options.jacobian_chunk_size, options.engine))
+
     return engine
 
   @staticmethod
@@ -1662,7 +1678,7 @@ def config_refman(params, reflections, experiments, do_stills, verbosity):
         colnames = ["x_resid", "y_resid", "phi_resid"]
       from dials.algorithms.refinement.outlier_detection import CentroidOutlierFactory
       outlier_detector = CentroidOutlierFactory.from_parameters_and_colnames(
-        options, colnames, verbosity)
+        options, colnames, verbosity, nproc=params.refinement.mp.nproc)
 
     # override default weighting strategy?
     weighting_strategy = None
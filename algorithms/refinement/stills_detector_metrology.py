@@ -421,21 +421,7 @@ def predict(self):
       # do prediction (updates reflection table in situ).
       reflections = self._reflection_manager.get_obs()
       #self._reflection_predictor.predict(reflections)
-      # FIXME HACK TO GET THE DETECTOR FROM THE FIRST EXPERIMENT
-      detector = self._reflection_predictor._experiments[0].detector
-      success = ray_intersection(detector, reflections, reflections['panel'])
-      assert success.all_eq(True)
-
-      x_obs, y_obs, _ = reflections['xyzobs.mm.value'].parts()
-      delpsi = reflections['delpsical.rad']
-      x_calc, y_calc, _ = reflections['xyzcal.mm'].parts()
-
-      # calculate residuals and assign columns
-      reflections['x_resid'] = x_calc - x_obs
-      reflections['x_resid2'] = reflections['x_resid']**2
-      reflections['y_resid'] = y_calc - y_obs
-      reflections['y_resid2'] = reflections['y_resid']**2
-      reflections['delpsical2'] = reflections['delpsical.rad']**2
+      self._intersect(reflections)
 
       # set used_in_refinement flag to all those that had predictions
       #mask = reflections.get_flags(reflections.flags.predicted)
@@ -446,6 +432,33 @@ def predict(self):
 
     return
 
+  def _intersect(self, reflections):
+    """intersect the reflections with the detector and calculate residuals"""
+
+    # FIXME HACK TO GET THE DETECTOR FROM THE FIRST EXPERIMENT
+    detector = self._reflection_predictor._experiments[0].detector
+    success = ray_intersection(detector, reflections, reflections['panel'])
+    assert success.all_eq(True)
+
+    x_obs, y_obs, _ = reflections['xyzobs.mm.value'].parts()
+    x_calc, y_calc, _ = reflections['xyzcal.mm'].parts()
+
+    # calculate residuals and assign columns
+    reflections['x_resid'] = x_calc - x_obs
+    reflections['x_resid2'] = reflections['x_resid']**2
+    reflections['y_resid'] = y_calc - y_obs
+    reflections['y_resid2'] = reflections['y_resid']**2
+    reflections['delpsical2'] = reflections['delpsical.rad']**2
+
+    return reflections
+
+  def predict_for_matches(self, isel):
+    """intersect the managed observations with the indices isel only with the
+    detector, as done by predict after the first step"""
+
+    reflections = self._reflection_manager.get_obs().select(isel)
+    return self._intersect(reflections)
+
 class LeastSquaresStillsDetectorSparse(SparseGradientsMixin,
   LeastSquaresStillsDetector):
   pass
@@ -152,6 +152,21 @@ def predict(self):
 
     return
 
+  def get_matches_iselection(self):
+    """return the indices of the matches in the managed observations"""
+
+    reflections = self._reflection_manager.get_obs()
+    return reflections.get_flags(
+      reflections.flags.used_in_refinement).iselection()
+
+  def predict_for_matches(self, isel):
+    """perform reflection prediction for the managed observations with the
+    indices isel only, returning them without updating the reflection manager.
+    The indices are a selection of those from get_matches_iselection"""
+
+    reflections = self._reflection_manager.get_obs().select(isel)
+    return self._predict_core(reflections)
+
   def predict_for_free_reflections(self):
     """perform prediction for the reflections not used for refinement"""
 
@@ -355,6 +370,17 @@ def split_matches_into_blocks(self, nproc=1):
     blocks.append(self._matches[start:end])
     return blocks
 
+  def split_matches_into_chunks(self, chunk_size):
+    """Return a list of the matches, split into consecutive chunks of at most
+    chunk_size reflections. Unlike split_matches_into_blocks the size of the
+    chunks does not depend on the total number of matches, so that the
+    Jacobian for each chunk has a fixed maximum size"""
+
+    self.update_matches()
+    nref = len(self._matches)
+    return [self._matches[start:min(start + chunk_size, nref)]
+            for start in range(0, max(nref, 1), chunk_size)]
+
   def compute_residuals_and_gradients(self, block=None):
     """return the vector of residuals plus their gradients and weights for
     non-linear least squares methods"""
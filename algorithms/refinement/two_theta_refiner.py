@@ -147,6 +147,19 @@ def __init__(self, experiments, reflection_predictor, ref_man,
 
     return
 
+  def _predict_core(self, reflections, skip_derivatives=False):
+    """perform prediction for the specified reflections"""
+
+    # set twotheta in place
+    self._reflection_predictor(reflections)
+
+    # calculate  residuals
+    reflections['2theta_resid'] = (reflections['2theta_cal.rad'] -
+                                   reflections['2theta_obs.rad'])
+    reflections['2theta_resid2'] = reflections['2theta_resid']**2
+
+    return reflections
+
   def predict(self):
     """perform reflection prediction for the working reflections and update the
     reflection manager"""
@@ -157,13 +170,8 @@ def predict(self):
     # reset the 'use' flag for all observations
     self._reflection_manager.reset_accepted_reflections()
 
-    # set twotheta in place
-    self._reflection_predictor(reflections)
-
-    # calculate  residuals
-    reflections['2theta_resid'] = (reflections['2theta_cal.rad'] -
-                                   reflections['2theta_obs.rad'])
-    reflections['2theta_resid2'] = reflections['2theta_resid']**2
+    # predict
+    reflections = self._predict_core(reflections)
 
     # set used_in_refinement flag to all those that had predictions
     mask = reflections.get_flags(reflections.flags.predicted)
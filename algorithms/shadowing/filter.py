@@ -1,9 +1,121 @@
 from __future__ import absolute_import, division
+from libtbx.phil import parse
+
+phil_scope = parse('''
+  shadowing
+    .expert_level = 1
+  {
+    angle_bin_width = None
+      .type = float(value_min=0)
+      .help = "If set, the goniometer shadow is only computed once for each"
+              "bin of scan angles of this width (in degrees), rather than for"
+              "every image. This is faster but approximate."
+  }
+''')
+
+class ShadowPolygonCache(object):
+  '''
+  Cache the shadow polygons projected onto the detector, keyed by the scan
+  angle. The angle is taken modulo 360 degrees so that the polygons are reused
+  when the goniometer geometry repeats. If a bin width is given, the polygons
+  are projected once for each angle bin, at the centre of the bin.
+
+  '''
+
+  def __init__(self, masker, detector, bin_width=None):
+    '''
+    Initialise the cache.
+
+    :param masker: The goniometer shadow masker
+    :param detector: The detector model
+    :param bin_width: The width of the angle bins in degrees
+
+    '''
+    assert bin_width is None or bin_width > 0
+    self.masker = masker
+    self.detector = detector
+    self.bin_width = bin_width
+    self._polygons = {}
+
+  def key(self, angle):
+    '''
+    Get the cache key for a scan angle.
+
+    :param angle: The scan angle in degrees
+    :return: The key
+
+    '''
+    import math
+    angle = angle % 360
+    if self.bin_width is None:
+      return round(angle, 6)
+    return int(math.floor(angle / self.bin_width))
+
+  def __call__(self, angle):
+    '''
+    Get the shadow polygons on each panel at a scan angle.
+
+    :param angle: The scan angle in degrees
+    :return: The list of shadow polygons
+
+    '''
+    key = self.key(angle)
+    if key not in self._polygons:
+      if self.bin_width is not None:
+        angle = (key + 0.5) * self.bin_width
+      self._polygons[key] = self.masker.project_extrema(self.detector, angle)
+    return self._polygons[key]
+
+
+def _find_groups(frame, panel, npanels):
+  '''
+  Sort the reflections by frame and panel and find the contiguous groups.
+
+  :param frame: The frame of each reflection
+  :param panel: The panel of each reflection
+  :param npanels: The number of panels
+  :return: The sort permutation and a list of (frame, panel, begin, end)
+
+  '''
+  from dials.array_family import flex
+  key = frame.as_double() * npanels + panel.as_double()
+  perm = flex.sort_permutation(key)
+  key = key.select(perm)
+  if len(key) == 0:
+    return perm, []
+  edges = ((key[1:] != key[:-1]).iselection() + 1)
+  edges = [0] + list(edges) + [len(key)]
+  groups = []
+  for begin, end in zip(edges[:-1], edges[1:]):
+    f, p = divmod(int(key[begin]), npanels)
+    groups.append((f, p, begin, end))
+  return perm, groups
+
 
 def filter_shadowed_reflections(experiments, reflections,
-                                experiment_goniometer=False):
+                                experiment_goniometer=False,
+                                angle_bin_width=None,
+                                nproc=1):
+  '''
+  Find the reflections which lie in the shadow of the goniometer.
+
+  For each experiment the reflections are sorted by frame and panel once.
+  The shadow polygons are only projected for the frames with reflections
+  on them, and are cached by scan angle, then the point in polygon tests
+  are done in bulk for each frame and panel. The frames may be split between
+  several processes.
+
+  :param experiments: The experiment list
+  :param reflections: The reflections with calculated pixel positions
+  :param experiment_goniometer: Use the goniometer in the experiment
+  :param angle_bin_width: Reuse the shadow within angle bins of this width
+  :param nproc: The number of processes to use
+  :return: True for the reflections in the shadow
+
+  '''
   from dials.util import is_inside_polygon
-  from scitbx.array_family import flex
+  from dials.array_family import flex
+  from libtbx import easy_mp
   shadowed = flex.bool(reflections.size(), False)
   for expt_id in range(len(experiments)):
     expt = experiments[expt_id]
@@ -14,25 +126,56 @@ def filter_shadowed_reflections(experiments, reflections,
     else:
       masker = imgset.reader().get_format().get_goniometer_shadow_masker()
     detector = expt.detector
-    sel = reflections['id'] == expt_id
-    isel = sel.iselection()
-    x,y,z = reflections['xyzcal.px'].select(isel).parts()
-    start, end = expt.scan.get_array_range()
-    for i in range(start, end):
-      shadow = masker.project_extrema(
-        detector, expt.scan.get_angle_from_array_index(i))
-      img_sel = (z >= i) & (z < (i+1))
-      img_isel = img_sel.iselection()
-      for p_id in range(len(detector)):
-        panel = reflections['panel'].select(img_isel)
-        if shadow[p_id].size() < 4:
+    scan = expt.scan
+
+    # Select the reflections on the images in the scan
+    isel = (reflections['id'] == expt_id).iselection()
+    x, y, z = reflections['xyzcal.px'].select(isel).parts()
+    frame = flex.floor(z).iround()
+    start, end = scan.get_array_range()
+    sel = (frame >= start) & (frame < end)
+    isel = isel.select(sel)
+    x = x.select(sel)
+    y = y.select(sel)
+    frame = frame.select(sel)
+    panel = reflections['panel'].select(isel)
+
+    # Sort the reflections by frame and panel
+    perm, groups = _find_groups(frame, panel, len(detector))
+    isel = isel.select(perm)
+    xy = flex.vec2_double(x.select(perm), y.select(perm))
+
+    def process_groups(groups):
+      shadow_polygons = ShadowPolygonCache(masker, detector, angle_bin_width)
+      result = []
+      for f, p, begin, end in groups:
+        shadow = shadow_polygons(scan.get_angle_from_array_index(f))
+        if shadow[p].size() < 4:
           continue
-        panel_isel = img_isel.select(panel == p_id)
-        inside = is_inside_polygon(
-          shadow[p_id],
-          flex.vec2_double(x.select(isel.select(panel_isel)),
-                           y.select(isel.select(panel_isel))))
-        shadowed.set_selected(panel_isel, inside)
+        inside = is_inside_polygon(shadow[p], xy[begin:end])
+        result.append((isel[begin:end], inside))
+      return result
 
-  return shadowed
+    # Split the frames into contiguous blocks for each process
+    if nproc > 1 and len(groups) > 1:
+      frames = sorted(set(g[0] for g in groups))
+      nblocks = min(nproc, len(frames))
+      block_index = dict((f, i * nblocks // len(frames))
+                         for i, f in enumerate(frames))
+      blocks = [[] for i in range(nblocks)]
+      for g in groups:
+        blocks[block_index[g[0]]].append(g)
+      results = easy_mp.parallel_map(
+        func=process_groups,
+        iterable=blocks,
+        processes=nblocks,
+        method='multiprocessing',
+        preserve_order=True,
+        preserve_exception_message=True)
+      results = [r for result in results for r in result]
+    else:
+      results = process_groups(groups)
+    for indices, inside in results:
+      shadowed.set_selected(indices, inside)
 
+  return shadowed
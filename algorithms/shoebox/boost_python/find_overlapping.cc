@@ -28,6 +28,16 @@ namespace dials { namespace algorithms { namespace shoebox {
         arg("bbox"),
         arg("panel")));
 
+    def("shoebox_overlap_fraction",
+      &shoebox_overlap_fraction_all, (
+        arg("bbox"),
+        arg("overlaps")));
+    def("shoebox_overlap_fraction",
+      &shoebox_overlap_fraction, (
+        arg("bbox"),
+        arg("overlaps"),
+        arg("index")));
+
     class_<OverlapFinder>("OverlapFinder")
       .def("__call__", &OverlapFinder::operator())
       ;
@@ -11,6 +11,7 @@
 #ifndef DIALS_ALGORITHMS_INTEGRATION_FIND_OVERLAPPING_H
 #define DIALS_ALGORITHMS_INTEGRATION_FIND_OVERLAPPING_H
 
+#include <algorithm>
 #include <vector>
 #include <boost/shared_ptr.hpp>
 #include <scitbx/array_family/tiny_types.h>
@@ -234,6 +235,150 @@ namespace dials { namespace algorithms { namespace shoebox {
     }
   };
 
+  namespace detail {
+
+    /**
+     * Get the sorted unique values of a list of coordinates
+     */
+    inline
+    void unique_coords(std::vector<int> &coords) {
+      std::sort(coords.begin(), coords.end());
+      coords.erase(std::unique(coords.begin(), coords.end()), coords.end());
+    }
+
+    /**
+     * Get the index of a coordinate in a sorted list of unique coordinates
+     */
+    inline
+    std::size_t coord_index(const std::vector<int> &coords, int value) {
+      return std::lower_bound(coords.begin(), coords.end(), value) -
+        coords.begin();
+    }
+
+  }
+
+  /**
+   * Compute the fraction of each shoebox which is overlapped by the
+   * shoeboxes adjacent to it. The adjacent bounding boxes are clipped to the
+   * bounding box and the volume of their union is found exactly by splitting
+   * the box into the cells formed by the edges of the clipped boxes, so the
+   * cost depends on the number of neighbours rather than the shoebox volume.
+   * @param bbox The list of bounding boxes
+   * @param overlaps The adjacency list of overlapping bounding boxes
+   * @param index The indices of the reflections to compute
+   * @returns The overlapped fraction for each index
+   */
+  inline
+  af::shared<double> shoebox_overlap_fraction(
+      const af::const_ref<int6> &bbox,
+      const AdjacencyList &overlaps,
+      const af::const_ref<std::size_t> &index) {
+    typedef AdjacencyList::edge_iterator edge_iterator;
+    typedef AdjacencyList::edge_iterator_range edge_iterator_range;
+    DIALS_ASSERT(overlaps.num_vertices() == bbox.size());
+    af::shared<double> result(index.size(), 0);
+    std::vector<int6> clipped;
+    std::vector<int> xc, yc, zc;
+    std::vector<bool> covered;
+    for (std::size_t n = 0; n < index.size(); ++n) {
+      std::size_t i = index[n];
+      DIALS_ASSERT(i < bbox.size());
+      const int6 &b1 = bbox[i];
+      DIALS_ASSERT(b1[1] > b1[0]);
+      DIALS_ASSERT(b1[3] > b1[2]);
+      DIALS_ASSERT(b1[5] > b1[4]);
+
+      // Clip the adjacent bounding boxes to this one
+      clipped.clear();
+      xc.assign(1, b1[0]);
+      yc.assign(1, b1[2]);
+      zc.assign(1, b1[4]);
+      xc.push_back(b1[1]);
+      yc.push_back(b1[3]);
+      zc.push_back(b1[5]);
+      edge_iterator_range edges = overlaps.edges(i);
+      for (edge_iterator it = edges.first; it != edges.second; ++it) {
+        const int6 &b2 = bbox[it->second];
+        int6 c(
+          std::max(b2[0], b1[0]), std::min(b2[1], b1[1]),
+          std::max(b2[2], b1[2]), std::min(b2[3], b1[3]),
+          std::max(b2[4], b1[4]), std::min(b2[5], b1[5]));
+        DIALS_ASSERT(c[1] > c[0]);
+        DIALS_ASSERT(c[3] > c[2]);
+        DIALS_ASSERT(c[5] > c[4]);
+        clipped.push_back(c);
+        xc.push_back(c[0]); xc.push_back(c[1]);
+        yc.push_back(c[2]); yc.push_back(c[3]);
+        zc.push_back(c[4]); zc.push_back(c[5]);
+      }
+      if (clipped.empty()) {
+        continue;
+      }
+
+      // Mark the cells covered by any of the clipped boxes
+      detail::unique_coords(xc);
+      detail::unique_coords(yc);
+      detail::unique_coords(zc);
+      std::size_t nx = xc.size() - 1;
+      std::size_t ny = yc.size() - 1;
+      std::size_t nz = zc.size() - 1;
+      covered.assign(nx * ny * nz, false);
+      for (std::size_t m = 0; m < clipped.size(); ++m) {
+        const int6 &c = clipped[m];
+        std::size_t i0 = detail::coord_index(xc, c[0]);
+        std::size_t i1 = detail::coord_index(xc, c[1]);
+        std::size_t j0 = detail::coord_index(yc, c[2]);
+        std::size_t j1 = detail::coord_index(yc, c[3]);
+        std::size_t k0 = detail::coord_index(zc, c[4]);
+        std::size_t k1 = detail::coord_index(zc, c[5]);
+        for (std::size_t k = k0; k < k1; ++k) {
+          for (std::size_t j = j0; j < j1; ++j) {
+            for (std::size_t ii = i0; ii < i1; ++ii) {
+              covered[ii + nx * (j + ny * k)] = true;
+            }
+          }
+        }
+      }
+
+      // Sum the volume of the covered cells
+      double volume = 0;
+      for (std::size_t k = 0; k < nz; ++k) {
+        for (std::size_t j = 0; j < ny; ++j) {
+          for (std::size_t ii = 0; ii < nx; ++ii) {
+            if (covered[ii + nx * (j + ny * k)]) {
+              volume += (double)(xc[ii+1] - xc[ii]) *
+                        (double)(yc[j+1] - yc[j]) *
+                        (double)(zc[k+1] - zc[k]);
+            }
+          }
+        }
+      }
+      double total = (double)(b1[1] - b1[0]) *
+                     (double)(b1[3] - b1[2]) *
+                     (double)(b1[5] - b1[4]);
+      result[n] = volume / total;
+    }
+    return result;
+  }
+
+  /**
+   * Compute the fraction of each shoebox which is overlapped by the
+   * shoeboxes adjacent to it.
+   * @param bbox The list of bounding boxes
+   * @param overlaps The adjacency list of overlapping bounding boxes
+   * @returns The overlapped fraction for each bounding box
+   */
+  inline
+  af::shared<double> shoebox_overlap_fraction_all(
+      const af::const_ref<int6> &bbox,
+      const AdjacencyList &overlaps) {
+    af::shared<std::size_t> index(bbox.size());
+    for (std::size_t i = 0; i < index.size(); ++i) {
+      index[i] = i;
+    }
+    return shoebox_overlap_fraction(bbox, overlaps, index.const_ref());
+  }
+
 }}} // namespace dials::algorithms::shoebox
 
 #endif // DIALS_ALGORITHMS_INTEGRATION_FIND_OVERLAPPING_H
@@ -468,11 +468,12 @@ class SpotFinderFactory(object):
   '''
 
   @staticmethod
-  def from_parameters(params=None, datablock=None):
+  def from_parameters(params=None, datablock=None, frame_cache=None):
     '''
     Given a set of parameters, construct the spot finder
 
     :param params: The input parameters
+    :param frame_cache: A frame cache to read the images through
     :returns: The spot finder instance
 
     '''
@@ -535,7 +536,8 @@ def from_parameters(params=None, datablock=None):
       min_spot_size             = params.spotfinder.filter.min_spot_size,
       max_spot_size             = params.spotfinder.filter.max_spot_size,
       no_shoeboxes_2d           = no_shoeboxes_2d,
-      min_chunksize             = params.spotfinder.mp.min_chunksize)
+      min_chunksize             = params.spotfinder.mp.min_chunksize,
+      frame_cache               = frame_cache)
 
   @staticmethod
   def configure_threshold(params, datablock):
@@ -44,7 +44,8 @@ def __init__(self,
                mask,
                region_of_interest,
                max_strong_pixel_fraction,
-               compute_mean_background):
+               compute_mean_background,
+               frame_cache=None):
     '''
     Initialise the class
 
@@ -53,11 +54,13 @@ def __init__(self,
     :param mask: The image mask
     :param region_of_interest: A region of interest to process
     :param max_strong_pixel_fraction: The maximum fraction of pixels allowed
+    :param frame_cache: A frame cache to read the images through
 
     '''
     self.threshold_function = threshold_function
     self.imageset = imageset
     self.mask = mask
+    self.frame_cache = frame_cache
     self.region_of_interest = region_of_interest
     self.max_strong_pixel_fraction = max_strong_pixel_fraction
     self.compute_mean_background = compute_mean_background
@@ -73,10 +76,7 @@ def __call__(self, index):
     :param index: The index of the image
 
     '''
-    from dials.model.data import PixelList
     from dxtbx.imageset import ImageSweep
-    from dials.array_family import flex
-    from math import ceil
 
     # Parallel reading of HDF5 from the same handle is not allowed. Python
     # multiprocessing is a bit messed up and used fork on linux so need to
@@ -96,20 +96,39 @@ def __call__(self, index):
         assert(all(i1+1 == i2 for i1, i2 in zip(ind[0:-1], ind[1:-1])))
       frame = ind[index]
 
+    # Get the image and mask
+    if self.frame_cache is not None:
+      image, mask = self.frame_cache.read(self.imageset, index)
+    else:
+      image = self.imageset.get_corrected_data(index)
+      mask = self.imageset.get_mask(index)
+
+    # Extract the strong pixels
+    return self.extract(frame, image, mask)
+
+  def extract(self, frame, image, mask):
+    '''
+    Extract strong pixels from image data which has already been read
+
+    :param frame: The frame number
+    :param image: The image data for each panel
+    :param mask: The mask for each panel
+
+    '''
+    from dials.model.data import PixelList
+    from dials.array_family import flex
+    from math import ceil
+
     # Create the list of pixel lists
     pixel_list = []
 
-    # Get the image and mask
-    image = self.imageset.get_corrected_data(index)
-    mask = self.imageset.get_mask(index)
-
     # Set the mask
     if self.mask is not None:
       assert(len(self.mask) == len(mask))
       mask = tuple(m1 & m2 for m1, m2 in zip(mask, self.mask))
 
     logger.debug("Number of masked pixels for image %i: %i" %
-                 (index, sum(m.count(False) for m in mask)))
+                 (frame, sum(m.count(False) for m in mask)))
 
     # Add the images to the pixel lists
     num_strong = 0
@@ -188,7 +207,8 @@ def __init__(self,
                compute_mean_background,
                min_spot_size,
                max_spot_size,
-               filter_spots):
+               filter_spots,
+               frame_cache=None):
     '''
     Initialise the class
 
@@ -197,6 +217,7 @@ def __init__(self,
     :param mask: The image mask
     :param region_of_interest: A region of interest to process
     :param max_strong_pixel_fraction: The maximum fraction of pixels allowed
+    :param frame_cache: A frame cache to read the images through
 
     '''
     super(ExtractPixelsFromImage2DNoShoeboxes, self).__init__(
@@ -205,18 +226,21 @@ def __init__(self,
       mask,
       region_of_interest,
       max_strong_pixel_fraction,
-      compute_mean_background)
+      compute_mean_background,
+      frame_cache)
 
     # Save some stuff
     self.min_spot_size = min_spot_size
     self.max_spot_size = max_spot_size
     self.filter_spots = filter_spots
 
-  def __call__(self, index):
+  def extract(self, frame, image, mask):
     '''
-    Extract strong pixels from an image
+    Extract strong spots from image data which has already been read
 
-    :param index: The index of the image
+    :param frame: The frame number
+    :param image: The image data for each panel
+    :param mask: The mask for each panel
 
     '''
     from dials.model.data import PixelListLabeller
@@ -226,7 +250,8 @@ def __call__(self, index):
     pixel_labeller = [PixelListLabeller() for p in range(num_panels)]
 
     # Call the super function
-    result = super(ExtractPixelsFromImage2DNoShoeboxes, self).__call__(index)
+    result = super(ExtractPixelsFromImage2DNoShoeboxes, self).extract(
+      frame, image, mask)
 
     # Add pixel lists to the labeller
     assert len(pixel_labeller) == len(result.pixel_list), "Inconsistent size"
@@ -436,7 +461,8 @@ def __init__(self,
                filter_spots=None,
                no_shoeboxes_2d=False,
                min_chunksize=50,
-               write_hot_pixel_mask=False):
+               write_hot_pixel_mask=False,
+               frame_cache=None):
     '''
     Initialise the class with the strategy
 
@@ -445,6 +471,7 @@ def __init__(self,
     :param mp_method: The multi processing method
     :param nproc: The number of processors
     :param max_strong_pixel_fraction: The maximum number of strong pixels
+    :param frame_cache: A frame cache to read the images through
 
     '''
     # Set the required strategies
@@ -463,6 +490,7 @@ def __init__(self,
     self.no_shoeboxes_2d = no_shoeboxes_2d
     self.min_chunksize = min_chunksize
     self.write_hot_pixel_mask = write_hot_pixel_mask
+    self.frame_cache = frame_cache
 
   def __call__(self, imageset):
     '''
@@ -552,7 +580,8 @@ def _find_spots(self, imageset):
         mask                      = self.mask,
         max_strong_pixel_fraction = self.max_strong_pixel_fraction,
         compute_mean_background   = self.compute_mean_background,
-        region_of_interest        = self.region_of_interest)
+        region_of_interest        = self.region_of_interest,
+        frame_cache               = self.frame_cache)
 
     # The indices to iterate over
     indices = list(range(len(imageset)))
@@ -658,7 +687,8 @@ def _find_spots_2d_no_shoeboxes(self, imageset):
         region_of_interest        = self.region_of_interest,
         min_spot_size             = self.min_spot_size,
         max_spot_size             = self.max_spot_size,
-        filter_spots              = self.filter_spots)
+        filter_spots              = self.filter_spots,
+        frame_cache               = self.frame_cache)
 
     # The indices to iterate over
     indices = list(range(len(imageset)))
@@ -718,13 +748,15 @@ def __init__(self,
                min_spot_size=1,
                max_spot_size=20,
                no_shoeboxes_2d=False,
-               min_chunksize=50):
+               min_chunksize=50,
+               frame_cache=None):
     '''
     Initialise the class.
 
     :param find_spots: The spot finding algorithm
     :param filter_spots: The spot filtering algorithm
     :param scan_range: The scan range to find spots over
+    :param frame_cache: A frame cache to read the images through
 
     '''
 
@@ -747,6 +779,7 @@ def __init__(self,
     self.mp_njobs = mp_njobs
     self.no_shoeboxes_2d = no_shoeboxes_2d
     self.min_chunksize = min_chunksize
+    self.frame_cache = frame_cache
 
   def __call__(self, datablock):
     '''
@@ -830,7 +863,8 @@ def _find_spots_in_imageset(self, imageset):
       filter_spots              = self.filter_spots,
       no_shoeboxes_2d           = self.no_shoeboxes_2d,
       min_chunksize             = self.min_chunksize,
-      write_hot_pixel_mask      = self.write_hot_mask)
+      write_hot_pixel_mask      = self.write_hot_mask,
+      frame_cache               = self.frame_cache)
 
     # Get the max scan range
     if isinstance(imageset, ImageSweep):
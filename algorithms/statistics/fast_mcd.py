@@ -30,28 +30,42 @@ def cov(*args):
   lens = [len(e) for e in args]
   assert all(e == lens[0] for e in lens)
 
+  # centre each vector once, rather than once per pair of vectors. The result
+  # is identical to calling sample_covariance for each pair
+  N = lens[0]
+  centred = [e - flex.mean(e) for e in args]
+
   ncols = len(args)
   cov = flex.double(flex.grid(ncols, ncols))
   for i in range(ncols):
     for j in range(i, ncols):
-      cov[i,j] = sample_covariance(args[i], args[j])
+      cov[i,j] = flex.sum(centred[i] * centred[j]) / (N - 1)
 
   cov.matrix_copy_upper_to_lower_triangle_in_place()
   return cov
 
-def maha_dist_sq(cols, center, cov):
+def observation_matrix(cols):
+  """Form the n x p matrix of observations from the list of p vectors cols"""
+
+  n = len(cols[0])
+  p = len(cols)
+  obs = flex.double(flex.grid(n, p))
+  for i, col in enumerate(cols):
+    obs.matrix_paste_column_in_place(col, i)
+  return obs
+
+def maha_dist_sq(cols, center, cov, obs=None):
   """Calculate squared Mahalanobis distance of all observations (rows in the
   vectors contained in the list cols) from the center vector with respect to
-  the covariance matrix cov"""
+  the covariance matrix cov. If the observation matrix for cols has already
+  been formed it may be passed in as obs"""
 
-  n = len(cols[0])
   p = len(cols)
   assert len(center) == p
 
   # observation matrix
-  obs = flex.double(flex.grid(n, p))
-  for i, col in enumerate(cols):
-    obs.matrix_paste_column_in_place(col, i)
+  if obs is None:
+    obs = observation_matrix(cols)
 
   d2 = maha_dist_sq_cpp(obs, flex.double(center), cov)
   return d2
@@ -165,6 +179,10 @@ def __init__(self, data, alpha=0.5, max_n_groups=5, min_group_size=300,
     self._consistency_fac = mcd_consistency(self._p, self._h / self._n)
     self._finite_samp_fac = mcd_finite_sample(self._p, self._n, self._alpha)
 
+    # observation matrices for the datasets used in concentration steps,
+    # formed once rather than at every step
+    self._obs = {}
+
     # perform calculation
     self._T_raw = None
     self._S_raw = None
@@ -250,33 +268,45 @@ def split_into_groups(self, sample, ngroups):
 
     return groups
 
+  def _observation_matrix(self, data):
+    """Get the observation matrix for one of the datasets, forming it on first
+    use"""
+
+    key = id(data)
+    if key not in self._obs:
+      self._obs[key] = (data, observation_matrix(data))
+    return self._obs[key][1]
+
   def form_initial_subset(self, h, data):
     """Method 2 of subsection 3.1 of R&vD"""
 
-    # permutation of input data for sampling
+    # permutation of input data for sampling. Only the leading rows of the
+    # permutation are used, so select just those rather than permuting all
+    # of the data
     p = flex.random_permutation(len(data[0]))
-    permuted = [col.select(p) for col in data]
 
     # draw random p+1 subset J (or larger if required)
     detS0 = 0.0
     i = 0
     while not detS0 > 0.0:
       subset_size = self._p + 1 + i
-      J = [e[0:subset_size] for e in permuted]
+      rows = p[0:subset_size]
+      J = [e.select(rows) for e in data]
       i += 1
       T0, S0 = self.means_and_covariance(J)
       detS0 = S0.matrix_determinant_via_lu()
 
-    H1 = self.concentration_step(h, data, T0, S0)
+    H1 = self.concentration_step(h, data, T0, S0,
+      obs=self._observation_matrix(data))
     return H1
 
   @staticmethod
-  def concentration_step(h, data, T, S):
+  def concentration_step(h, data, T, S, obs=None):
     """Practical application of Theorem 1 of R&vD"""
 
-    d2s = maha_dist_sq(data, T, S)
-    p = flex.sort_permutation(d2s)
-    H1 = [col.select(p)[0:h] for col in data]
+    d2s = maha_dist_sq(data, T, S, obs=obs)
+    rows = flex.sort_permutation(d2s)[0:h]
+    H1 = [col.select(rows) for col in data]
     return H1
 
   def small_dataset_estimate(self):
@@ -294,7 +324,8 @@ def small_dataset_estimate(self):
       detScurr, Tcurr, Scurr = detS1, T1, S1
       for j in xrange(self._k1): # take maximum of k1 steps
 
-        Hnew = self.concentration_step(self._h, self._data, Tcurr, Scurr)
+        Hnew = self.concentration_step(self._h, self._data, Tcurr, Scurr,
+          obs=self._observation_matrix(self._data))
         Tnew, Snew = self.means_and_covariance(Hnew)
         detSnew = Snew.matrix_determinant_via_lu()
 
@@ -312,7 +343,8 @@ def small_dataset_estimate(self):
     for i in xrange(10):
       detCurr, Tcurr, Scurr = trials[i]
       for j in xrange(self._k3): # take maximum of k3 steps
-        Hnew = self.concentration_step(self._h, self._data, Tcurr, Scurr)
+        Hnew = self.concentration_step(self._h, self._data, Tcurr, Scurr,
+          obs=self._observation_matrix(self._data))
         Tnew, Snew = self.means_and_covariance(Hnew)
         detNew = Snew.matrix_determinant_via_lu()
         if detNew == detCurr:
@@ -361,7 +393,8 @@ def large_dataset_estimate(self):
         detScurr, Tcurr, Scurr = detS1, T1, S1
         for j in xrange(self._k1): # take k1 steps
 
-          Hnew = self.concentration_step(h_sub, group, Tcurr, Scurr)
+          Hnew = self.concentration_step(h_sub, group, Tcurr, Scurr,
+            obs=self._observation_matrix(group))
           Tnew, Snew = self.means_and_covariance(Hnew)
           detSnew = Snew.matrix_determinant_via_lu()
 
@@ -386,7 +419,8 @@ def large_dataset_estimate(self):
       detScurr, Tcurr, Scurr = trial
       for j in xrange(self._k2): # take k2 steps
 
-        Hnew = self.concentration_step(h_mrgd, sampled, Tcurr, Scurr)
+        Hnew = self.concentration_step(h_mrgd, sampled, Tcurr, Scurr,
+          obs=self._observation_matrix(sampled))
         Tnew, Snew = self.means_and_covariance(Hnew)
         detSnew = Snew.matrix_determinant_via_lu()
         detScurr, Tcurr, Scurr = detSnew, Tnew, Snew
@@ -417,7 +451,8 @@ def large_dataset_estimate(self):
     for i in xrange(n_reps):
       detCurr, Tcurr, Scurr = mrgd_trials[i]
       for j in xrange(k4): # take maximum of k4 steps
-        Hnew = self.concentration_step(self._h, self._data, Tcurr, Scurr)
+        Hnew = self.concentration_step(self._h, self._data, Tcurr, Scurr,
+          obs=self._observation_matrix(self._data))
         Tnew, Snew = self.means_and_covariance(Hnew)
         detNew = Snew.matrix_determinant_via_lu()
         if detNew == detCurr:
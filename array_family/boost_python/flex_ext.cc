@@ -14,8 +14,10 @@
 #include <scitbx/boost_python/container_conversions.h>
 #include <scitbx/array_family/boost_python/c_grid_flex_conversions.h>
 #include <dials/array_family/scitbx_shared_and_versa.h>
+#include <dials/array_family/sort_index.h>
 #include <dials/model/data/ray.h>
 #include <dials/config.h>
+#include <dials/error.h>
 
 namespace dials { namespace af { namespace boost_python {
 
@@ -46,6 +48,30 @@ namespace dials { namespace af { namespace boost_python {
     return "double";
   }
 
+  /**
+   * Get the permutation which sorts the keys lexicographically.
+   * @param keys A sequence of flex.double arrays, most significant first
+   * @param reverse Sort in descending order
+   * @returns The sort permutation
+   */
+  af::shared<std::size_t> lexsort_permutation(
+      boost::python::object keys,
+      bool reverse) {
+    std::size_t nkeys = boost::python::len(keys);
+    DIALS_ASSERT(nkeys > 0);
+    std::vector< af::const_ref<double> > refs;
+    for (std::size_t i = 0; i < nkeys; ++i) {
+      refs.push_back(extract< af::const_ref<double> >(keys[i])());
+      DIALS_ASSERT(refs[i].size() == refs[0].size());
+    }
+    af::shared<std::size_t> index(refs[0].size());
+    for (std::size_t i = 0; i < index.size(); ++i) {
+      index[i] = i;
+    }
+    sort_index_lexicographic(index.begin(), index.end(), refs, reverse);
+    return index;
+  }
+
   BOOST_PYTHON_MODULE(dials_array_family_flex_ext)
   {
     export_flex_int6();
@@ -60,6 +86,9 @@ namespace dials { namespace af { namespace boost_python {
     export_flex_binner();
 
     def("get_real_type", &get_real_type<ProfileFloatType>);
+    def("lexsort_permutation", &lexsort_permutation, (
+      arg("keys"),
+      arg("reverse")=false));
 
     scitbx::af::boost_python::c_grid_flex_conversions<bool, af::c_grid<4> >();
     scitbx::af::boost_python::c_grid_flex_conversions<double, af::c_grid<4> >();
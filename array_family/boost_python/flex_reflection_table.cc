@@ -11,6 +11,10 @@
 #include <boost/python.hpp>
 #include <boost/python/def.hpp>
 #include <numeric>
+#include <map>
+#include <vector>
+#include <boost/unordered_map.hpp>
+#include <boost/functional/hash.hpp>
 #include <dials/array_family/boost_python/flex_table_suite.h>
 #include <dials/array_family/reflection_table.h>
 #include <dials/model/data/shoebox.h>
@@ -573,6 +577,159 @@ namespace dials { namespace af { namespace boost_python {
     return result;
   }
 
+  /**
+   * A key to match predicted and reference reflections
+   */
+  struct reference_match_key {
+    cctbx::miller::index<> h;
+    bool entering;
+    int id;
+    std::size_t panel;
+
+    reference_match_key(
+        cctbx::miller::index<> h_,
+        bool entering_,
+        int id_,
+        std::size_t panel_)
+      : h(h_),
+        entering(entering_),
+        id(id_),
+        panel(panel_) {}
+
+    bool operator==(const reference_match_key &other) const {
+      return h == other.h
+          && entering == other.entering
+          && id == other.id
+          && panel == other.panel;
+    }
+  };
+
+  /**
+   * Hash function for the reference match key
+   */
+  struct reference_match_key_hash {
+    std::size_t operator()(const reference_match_key &key) const {
+      std::size_t seed = 0;
+      boost::hash_combine(seed, key.h[0]);
+      boost::hash_combine(seed, key.h[1]);
+      boost::hash_combine(seed, key.h[2]);
+      boost::hash_combine(seed, key.entering);
+      boost::hash_combine(seed, key.id);
+      boost::hash_combine(seed, key.panel);
+      return seed;
+    }
+  };
+
+  /**
+   * Match reflections with reference reflections sharing the same miller
+   * index, entering flag, experiment id and panel. Where there are several
+   * candidates, each reflection is paired with the nearest reference
+   * reflection and each reference reflection keeps the nearest of the
+   * reflections paired with it.
+   * @param self The predicted reflections
+   * @param other The reference reflections
+   * @returns A tuple of matching indices into self and other
+   */
+  template <typename T>
+  boost::python::tuple match_with_reference_indices(T self, T other) {
+
+    // Check contents
+    DIALS_ASSERT(self.contains("miller_index"));
+    DIALS_ASSERT(self.contains("entering"));
+    DIALS_ASSERT(self.contains("id"));
+    DIALS_ASSERT(self.contains("panel"));
+    DIALS_ASSERT(self.contains("xyzcal.px"));
+    DIALS_ASSERT(other.contains("miller_index"));
+    DIALS_ASSERT(other.contains("entering"));
+    DIALS_ASSERT(other.contains("id"));
+    DIALS_ASSERT(other.contains("panel"));
+    DIALS_ASSERT(other.contains("xyzcal.px"));
+
+    af::const_ref< cctbx::miller::index<> > h1 = self["miller_index"];
+    af::const_ref<bool> e1 = self["entering"];
+    af::const_ref<int> i1 = self["id"];
+    af::const_ref<std::size_t> p1 = self["panel"];
+    af::const_ref< vec3<double> > x1 = self["xyzcal.px"];
+    af::const_ref< cctbx::miller::index<> > h2 = other["miller_index"];
+    af::const_ref<bool> e2 = other["entering"];
+    af::const_ref<int> i2 = other["id"];
+    af::const_ref<std::size_t> p2 = other["panel"];
+    af::const_ref< vec3<double> > x2 = other["xyzcal.px"];
+
+    // Group the reflections by key
+    typedef boost::unordered_map<
+      reference_match_key,
+      std::size_t,
+      reference_match_key_hash> lookup_type;
+    lookup_type lookup;
+    std::vector< std::vector<std::size_t> > group_a;
+    std::vector< std::vector<std::size_t> > group_b;
+    for (std::size_t i = 0; i < h1.size(); ++i) {
+      reference_match_key key(h1[i], e1[i], i1[i], p1[i]);
+      std::pair<lookup_type::iterator, bool> item =
+        lookup.insert(std::make_pair(key, group_a.size()));
+      if (item.second) {
+        group_a.push_back(std::vector<std::size_t>());
+        group_b.push_back(std::vector<std::size_t>());
+      }
+      group_a[item.first->second].push_back(i);
+    }
+    for (std::size_t i = 0; i < h2.size(); ++i) {
+      reference_match_key key(h2[i], e2[i], i2[i], p2[i]);
+      lookup_type::const_iterator item = lookup.find(key);
+      if (item != lookup.end()) {
+        group_b[item->second].push_back(i);
+      }
+    }
+
+    // Resolve the matches within each group
+    std::vector< std::pair<std::size_t, std::size_t> > matches;
+    for (std::size_t g = 0; g < group_a.size(); ++g) {
+      const std::vector<std::size_t> &a = group_a[g];
+      const std::vector<std::size_t> &b = group_b[g];
+      if (b.size() == 0) {
+        continue;
+      } else if (a.size() == 1 && b.size() == 1) {
+        matches.push_back(std::make_pair(a[0], b[0]));
+      } else {
+        std::map< std::size_t, std::pair<std::size_t, double> > matched;
+        for (std::size_t ia = 0; ia < a.size(); ++ia) {
+          std::size_t i = a[ia];
+          std::size_t jmin = b[0];
+          double dmin = (x1[i] - x2[b[0]]).length_sq();
+          for (std::size_t ib = 1; ib < b.size(); ++ib) {
+            double d = (x1[i] - x2[b[ib]]).length_sq();
+            if (d < dmin) {
+              jmin = b[ib];
+              dmin = d;
+            }
+          }
+          std::map< std::size_t, std::pair<std::size_t, double> >::iterator
+            it = matched.find(jmin);
+          if (it == matched.end()) {
+            matched[jmin] = std::make_pair(i, dmin);
+          } else if (dmin < it->second.second) {
+            it->second = std::make_pair(i, dmin);
+          }
+        }
+        for (std::map< std::size_t, std::pair<std::size_t, double> >::iterator
+            it = matched.begin(); it != matched.end(); ++it) {
+          matches.push_back(std::make_pair(it->second.first, it->first));
+        }
+      }
+    }
+
+    // Return the matches ordered by index in self
+    std::sort(matches.begin(), matches.end());
+    af::shared<std::size_t> sind(matches.size());
+    af::shared<std::size_t> oind(matches.size());
+    for (std::size_t i = 0; i < matches.size(); ++i) {
+      sind[i] = matches[i].first;
+      oind[i] = matches[i].second;
+    }
+    return boost::python::make_tuple(sind, oind);
+  }
+
   /**
    * Struct to facilitate wrapping reflection table type
    */
@@ -625,6 +782,8 @@ namespace dials { namespace af { namespace boost_python {
           &split_indices_by_experiment_id<flex_table_type>)
         .def("compute_phi_range",
           &compute_phi_range<flex_table_type>)
+        .def("match_with_reference_indices",
+          &match_with_reference_indices<flex_table_type>)
         ;
 
       // Create the flags enum in the reflection table scope
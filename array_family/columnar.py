@@ -0,0 +1,541 @@
+#
+# columnar.py
+#
+#  Copyright (C) 2017 Diamond Light Source
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+'''
+A columnar on-disk container for reflection tables.
+
+The file is laid out as a sequence of blocks, each of which is terminated by
+its own footer::
+
+  MAGIC
+  column buffer 0
+  column buffer 1
+  ...
+  footer (JSON)
+  footer length (8 bytes, little endian) + MAGIC
+  [further blocks]
+
+Each column is stored as one contiguous buffer. Plain numeric columns are
+written as raw machine words (vector columns are stored component by
+component) and any other column type (e.g. shoebox, std_string) is written as
+the flex pickle of that column. The footer describes the name, type, encoding,
+offset and size of every column so that a reader can mmap the file and decode
+only the columns it needs.
+
+A file written in one go contains a single block. Files written incrementally
+contain one block per call to ChunkedWriter.append; each footer records the
+end of the previous block so the file is readable after every append. Blocks
+may optionally carry a size_t index giving the row of the full table that
+each of their rows belongs to.
+
+'''
+from __future__ import absolute_import, division
+
+import logging
+logger = logging.getLogger(__name__)
+
+#: The magic bytes at the start and end of a columnar reflection file
+MAGIC = 'DIALSCOL'
+
+#: The format version written into the footer
+VERSION = 1
+
+# The size of the trailer (footer length + magic)
+_TRAILER_SIZE = 8 + len(MAGIC)
+
+# Column buffers are aligned to this many bytes
+_ALIGNMENT = 8
+
+
+def _split(buf, n):
+  '''
+  Split a buffer into n equal sized parts.
+
+  '''
+  assert len(buf) % n == 0
+  size = len(buf) // n
+  return [buf[i*size:(i+1)*size] for i in range(n)]
+
+
+class _Codec(object):
+  '''
+  Encode and decode a column type to and from raw bytes.
+
+  '''
+
+  def __init__(self, encode, decode):
+    self.encode = encode
+    self.decode = decode
+
+
+def _codecs():
+  '''
+  Get the raw codecs for each supported column type.
+
+  '''
+  from dials.array_family import flex
+
+  def encode_parts(column):
+    return ''.join(p.copy_to_byte_str() for p in column.parts())
+
+  def encode_miller_index(column):
+    return ''.join(
+      p.iround().copy_to_byte_str()
+      for p in column.as_vec3_double().parts())
+
+  return {
+    'bool' : _Codec(
+      lambda c: c.as_int().copy_to_byte_str(),
+      lambda b: flex.int_from_byte_str(b) != 0),
+    'int' : _Codec(
+      lambda c: c.copy_to_byte_str(),
+      flex.int_from_byte_str),
+    'size_t' : _Codec(
+      lambda c: c.copy_to_byte_str(),
+      flex.size_t_from_byte_str),
+    'double' : _Codec(
+      lambda c: c.copy_to_byte_str(),
+      flex.double_from_byte_str),
+    'vec2_double' : _Codec(
+      encode_parts,
+      lambda b: flex.vec2_double(*map(flex.double_from_byte_str, _split(b, 2)))),
+    'vec3_double' : _Codec(
+      encode_parts,
+      lambda b: flex.vec3_double(*map(flex.double_from_byte_str, _split(b, 3)))),
+    'mat3_double' : _Codec(
+      lambda c: c.as_double().copy_to_byte_str(),
+      lambda b: flex.mat3_double(flex.double_from_byte_str(b))),
+    'int6' : _Codec(
+      lambda c: c.as_int().copy_to_byte_str(),
+      lambda b: flex.int6(flex.int_from_byte_str(b))),
+    'miller_index' : _Codec(
+      encode_miller_index,
+      lambda b: flex.miller_index(*map(flex.int_from_byte_str, _split(b, 3)))),
+  }
+
+
+def encode_column(column):
+  '''
+  Encode a column as a single contiguous buffer.
+
+  :param column: The column data
+  :return: A tuple (type name, encoding, buffer)
+
+  '''
+  import cPickle as pickle
+  name = type(column).__name__
+  codecs = _codecs()
+  if name in codecs:
+    return name, 'raw', codecs[name].encode(column)
+  return name, 'pickle', pickle.dumps(column, pickle.HIGHEST_PROTOCOL)
+
+
+def decode_column(name, encoding, buf):
+  '''
+  Decode a column from its buffer.
+
+  :param name: The column type name
+  :param encoding: The column encoding
+  :param buf: The column buffer
+  :return: The column data
+
+  '''
+  import cPickle as pickle
+  if encoding == 'raw':
+    return _codecs()[name].decode(buf)
+  elif encoding == 'pickle':
+    return pickle.loads(buf)
+  raise RuntimeError('Unknown column encoding: %s' % encoding)
+
+
+def is_columnar_file(filename):
+  '''
+  Check if the file is a columnar reflection file.
+
+  :param filename: The filename
+  :return: True/False
+
+  '''
+  try:
+    with open(filename, 'rb') as infile:
+      return infile.read(len(MAGIC)) == MAGIC
+  except IOError:
+    return False
+
+
+def _write_block(outfile, table, previous=None, index=None):
+  '''
+  Write the table as a block at the current position of the file.
+
+  Columns are encoded and written one at a time so that at most one column
+  buffer is held in memory in addition to the table itself.
+
+  :param outfile: The output file object
+  :param table: The reflection table
+  :param previous: The end offset of the previous block
+  :param index: The size_t row index of the block in the full table
+
+  '''
+  import json
+  import struct
+  import sys
+
+  def write_buffer(buf):
+    padding = -outfile.tell() % _ALIGNMENT
+    outfile.write('\0' * padding)
+    offset = outfile.tell()
+    outfile.write(buf)
+    return offset
+
+  columns = []
+  for key, column in table.cols():
+    name, encoding, buf = encode_column(column)
+    columns.append({
+      'name'     : key,
+      'type'     : name,
+      'encoding' : encoding,
+      'offset'   : write_buffer(buf),
+      'nbytes'   : len(buf),
+    })
+    del buf
+  footer = {
+    'version'   : VERSION,
+    'byteorder' : sys.byteorder,
+    'nrows'     : len(table),
+    'columns'   : columns,
+    'previous'  : previous,
+  }
+  if index is not None:
+    assert len(index) == len(table)
+    buf = index.copy_to_byte_str()
+    footer['index'] = {
+      'offset' : write_buffer(buf),
+      'nbytes' : len(buf),
+    }
+  footer = json.dumps(footer)
+  outfile.write(footer)
+  outfile.write(struct.pack('<Q', len(footer)))
+  outfile.write(MAGIC)
+  return outfile.tell()
+
+
+def dump(table, filename):
+  '''
+  Write the reflection table as a columnar file.
+
+  :param table: The reflection table
+  :param filename: The output filename
+
+  '''
+  with open(filename, 'wb') as outfile:
+    outfile.write(MAGIC)
+    _write_block(outfile, table)
+
+
+class ChunkedWriter(object):
+  '''
+  Append reflection tables to a columnar file one block at a time.
+
+  The file is flushed after each block so that everything written before a
+  crash can still be read back.
+
+  '''
+
+  def __init__(self, filename):
+    '''
+    Create the file.
+
+    :param filename: The output filename
+
+    '''
+    self.filename = filename
+    self.nblocks = 0
+    self.nrows = 0
+    self._end = None
+    self._outfile = open(filename, 'wb')
+    self._outfile.write(MAGIC)
+
+  def append(self, table, index=None):
+    '''
+    Append a block of reflections.
+
+    :param table: The reflection table
+    :param index: The size_t row index of the block in the full table
+
+    '''
+    assert self._outfile is not None, "Writer is closed"
+    self._end = _write_block(self._outfile, table, self._end, index)
+    self._outfile.flush()
+    self.nblocks += 1
+    self.nrows += len(table)
+
+  def close(self):
+    '''
+    Close the file.
+
+    '''
+    if self._outfile is not None:
+      self._outfile.close()
+      self._outfile = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+
+class Reader(object):
+  '''
+  Read columns from a columnar reflection file.
+
+  The file is memory mapped so that only the pages belonging to the requested
+  columns are read from disk. If the file contains more than one block then
+  the columns of each block are concatenated in the order they were written.
+  A file written by a ChunkedWriter may contain no blocks at all.
+
+  '''
+
+  def __init__(self, filename):
+    '''
+    Open the file and read the footers.
+
+    :param filename: The input filename
+
+    '''
+    import mmap
+    with open(filename, 'rb') as infile:
+      self._mmap = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+      if self._mmap[0:len(MAGIC)] != MAGIC:
+        raise RuntimeError('%s is not a columnar reflection file' % filename)
+      self._blocks = []
+      if len(self._mmap) == len(MAGIC):
+        end = None
+      else:
+        end = self._find_last_block_end(filename)
+      while end is not None:
+        footer = self._read_footer(filename, end)
+        self._blocks.insert(0, footer)
+        end = footer.get('previous')
+    except Exception:
+      self.close()
+      raise
+    self.filename = filename
+    self.nrows = sum(b['nrows'] for b in self._blocks)
+    self._order = []
+    self._types = {}
+    for block in self._blocks:
+      for c in block['columns']:
+        if str(c['name']) not in self._types:
+          self._order.append(str(c['name']))
+          self._types[str(c['name'])] = c['type']
+      block['columns'] = dict((c['name'], c) for c in block['columns'])
+
+  def _find_last_block_end(self, filename):
+    '''
+    Find the end of the last complete block.
+
+    If the file was truncated while a block was being written (e.g. because
+    the writing process crashed) then search backwards for the last valid
+    trailer so that the completed blocks can still be read.
+
+    '''
+    end = len(self._mmap)
+    while True:
+      try:
+        self._read_footer(filename, end)
+        break
+      except Exception:
+        pos = self._mmap.rfind(MAGIC, len(MAGIC), end - 1)
+        if pos < 0:
+          raise RuntimeError('%s contains no complete blocks' % filename)
+        end = pos + len(MAGIC)
+    if end != len(self._mmap):
+      logger.warn('%s is truncated; reading the complete blocks only' % filename)
+    return end
+
+  def _read_footer(self, filename, end):
+    '''
+    Read the footer of the block ending at the given offset.
+
+    '''
+    import json
+    import struct
+    import sys
+    if (end < len(MAGIC) + _TRAILER_SIZE or
+        self._mmap[end-len(MAGIC):end] != MAGIC):
+      raise RuntimeError('%s is not a columnar reflection file' % filename)
+    footer_size, = struct.unpack(
+      '<Q', self._mmap[end-_TRAILER_SIZE:end-len(MAGIC)])
+    footer_end = end - _TRAILER_SIZE
+    footer = json.loads(self._mmap[footer_end-footer_size:footer_end])
+    if footer['version'] > VERSION:
+      raise RuntimeError('Unsupported columnar file version: %d' %
+                         footer['version'])
+    if footer['byteorder'] != sys.byteorder:
+      raise RuntimeError('Columnar file byte order (%s) does not match host' %
+                         footer['byteorder'])
+    return footer
+
+  @property
+  def nblocks(self):
+    '''
+    :return: The number of blocks in the file
+
+    '''
+    return len(self._blocks)
+
+  def keys(self):
+    '''
+    :return: The column names in any block in the order they were written
+
+    '''
+    return list(self._order)
+
+  def types(self):
+    '''
+    :return: A dictionary of column name to column type
+
+    '''
+    return dict(self._types)
+
+  def block_keys(self, block):
+    '''
+    :param block: The block index
+    :return: The column names in a single block
+
+    '''
+    return [str(k) for k in self._blocks[block]['columns']]
+
+  def _buffer(self, item):
+    return self._mmap[item['offset']:item['offset']+item['nbytes']]
+
+  def block_column(self, block, key):
+    '''
+    Decode a single column from a single block.
+
+    :param block: The block index
+    :param key: The column name
+    :return: The column data
+
+    '''
+    b = self._blocks[block]
+    if key not in b['columns']:
+      raise KeyError('Column %s not in block %d of %s' % (
+        key, block, self.filename))
+    c = b['columns'][key]
+    result = decode_column(c['type'], c['encoding'], self._buffer(c))
+    assert len(result) == b['nrows']
+    return result
+
+  def block_index(self, block):
+    '''
+    Get the row index of a single block.
+
+    :param block: The block index
+    :return: The size_t row index or None
+
+    '''
+    from dials.array_family import flex
+    b = self._blocks[block]
+    if 'index' not in b:
+      return None
+    return flex.size_t_from_byte_str(self._buffer(b['index']))
+
+  def column(self, key):
+    '''
+    Decode a single column. The rows of any block which does not contain the
+    column are given the default value for the column type.
+
+    :param key: The column name
+    :return: The column data
+
+    '''
+    from dials.array_family import flex
+    if key not in self._types:
+      raise KeyError('Column %s not in %s' % (key, self.filename))
+    blocks = [b['columns'] for b in self._blocks]
+    if all(key in columns for columns in blocks):
+      result = self.block_column(0, key)
+      for i in range(1, self.nblocks):
+        result.extend(self.block_column(i, key))
+    else:
+      table = flex.reflection_table(self.nrows)
+      start = 0
+      for i in range(self.nblocks):
+        nrows = self._blocks[i]['nrows']
+        if key in blocks[i]:
+          block = flex.reflection_table()
+          block[str(key)] = self.block_column(i, key)
+          table.set_selected(flex.size_t_range(start, start + nrows), block)
+        start += nrows
+      result = table[str(key)]
+    assert len(result) == self.nrows
+    return result
+
+  def index(self):
+    '''
+    Get the row index of all the blocks.
+
+    :return: The size_t row index or None if any block has no index
+
+    '''
+    from dials.array_family import flex
+    result = flex.size_t()
+    for i in range(self.nblocks):
+      index = self.block_index(i)
+      if index is None:
+        return None
+      result.extend(index)
+    return result
+
+  def read(self, columns=None):
+    '''
+    Read a reflection table containing the requested columns.
+
+    :param columns: The list of columns to read (default all)
+    :return: The reflection table
+
+    '''
+    from dials.array_family import flex
+    if columns is None:
+      columns = self._order
+    missing = [key for key in columns if key not in self._order]
+    if len(missing) > 0:
+      raise KeyError('Columns not in %s: %s' % (
+        self.filename, ', '.join(missing)))
+    result = flex.reflection_table(self.nrows)
+    for key in columns:
+      result[str(key)] = self.column(key)
+    return result
+
+  def close(self):
+    '''
+    Close the memory map.
+
+    '''
+    self._mmap.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+
+def load(filename, columns=None):
+  '''
+  Read a reflection table from a columnar file.
+
+  :param filename: The input filename
+  :param columns: The list of columns to read (default all)
+  :return: The reflection table
+
+  '''
+  with Reader(filename) as reader:
+    return reader.read(columns)
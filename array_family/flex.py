@@ -151,12 +151,13 @@ def from_predictions_multi(experiments,
     return result
 
   @staticmethod
-  def from_observations(datablock, params=None):
+  def from_observations(datablock, params=None, frame_cache=None):
     '''
     Construct a reflection table from observations.
 
     :param datablock: The datablock
     :param params: The input parameters
+    :param frame_cache: A frame cache to read the images through
     :return: The reflection table of observations
 
     '''
@@ -178,7 +179,8 @@ def from_observations(datablock, params=None):
     logger.info('Configuring spot finder from input parameters')
     find_spots = SpotFinderFactory.from_parameters(
       datablock=datablock,
-      params=params)
+      params=params,
+      frame_cache=frame_cache)
 
     # Find the spots
     return find_spots(datablock)
@@ -194,12 +196,37 @@ def from_pickle(filename):
     '''
     import cPickle as pickle
     from libtbx import smart_open
+    from dials.array_family import columnar
+
+    if columnar.is_columnar_file(filename):
+      return columnar.load(filename)
 
     with smart_open.for_reading(filename, 'rb') as infile:
       result = pickle.load(infile)
       assert(isinstance(result, reflection_table))
       return result
 
+  @staticmethod
+  def from_file(filename, columns=None):
+    '''
+    Read the reflection table from either a columnar or a pickle file.
+
+    For columnar files only the requested columns are read from disk.
+
+    :param filename: The input filename
+    :param columns: The list of columns to read (default all)
+    :return: The reflection table
+
+    '''
+    from dials.array_family import columnar
+
+    if columnar.is_columnar_file(filename):
+      return columnar.load(filename, columns=columns)
+    result = reflection_table.from_pickle(filename)
+    if columns is not None:
+      result = result.select(flex.std_string(columns))
+    return result
+
   @staticmethod
   def from_h5(filename):
     '''
@@ -315,6 +342,16 @@ def as_pickle(self, filename):
     with smart_open.for_writing(filename, 'wb') as outfile:
       pickle.dump(self, outfile, protocol=pickle.HIGHEST_PROTOCOL)
 
+  def as_columnar(self, filename):
+    '''
+    Write the reflection table as a columnar file.
+
+    :param filename: The output filename
+
+    '''
+    from dials.array_family import columnar
+    columnar.dump(self, filename)
+
   def as_h5(self, filename):
     '''
     Write the reflection table as a HDF5 file.
@@ -341,41 +378,75 @@ def sort(self, name, reverse=False, order=None):
     '''
     Sort the reflection table by a key.
 
-    :param name: The name of the column
+    To sort by several columns in turn, give a list of column names. In this
+    case order is either None or a list with the component order (or None)
+    for each column, e.g. to sort by id, then miller index and then the z
+    component of the calculated position:
+
+      table.sort(['id', 'miller_index', 'xyzcal.px'], order=[None, None, [2]])
+
+    :param name: The name of the column or a list of column names
     :param reverse: Reverse the sort order
     :param order: For multi element items specify order
 
     '''
-    import __builtin__
-    if type(self[name]) in [
+    if isinstance(name, basestring):
+      names = [name]
+      orders = [order]
+    else:
+      names = list(name)
+      if order is None:
+        orders = [None] * len(names)
+      else:
+        orders = list(order)
+      assert len(orders) == len(names)
+    if len(names) == 1 and orders[0] is None and type(self[names[0]]) not in [
         vec2_double,
         vec3_double,
         mat3_double,
         int6,
         miller_index ]:
-      data = self[name]
-      if order is None:
-        perm = flex.size_t(
-          __builtin__.sorted(
-            range(len(self)),
-            key=lambda x: data[x],
-            reverse=reverse))
-      else:
-        assert len(order) == len(data[0])
-        def compare(x, y):
-          a = tuple(x[i] for i in order)
-          b = tuple(y[i] for i in order)
-          return cmp(a, b)
-        perm = flex.size_t(
-          __builtin__.sorted(
-            range(len(self)),
-            key=lambda x: data[x],
-            cmp=compare,
-            reverse=reverse))
+      perm = flex.sort_permutation(self[names[0]], reverse=reverse)
     else:
-      perm = flex.sort_permutation(self[name], reverse=reverse)
+      keys = []
+      for n, o in zip(names, orders):
+        keys.extend(self._sort_keys(n, o))
+      perm = lexsort_permutation(keys, reverse=reverse)
     self.reorder(perm)
 
+  def _sort_keys(self, name, order=None):
+    '''
+    Get the components of a column as a list of flex.double sort keys.
+
+    :param name: The name of the column
+    :param order: The components to use and their order
+    :return: The list of keys
+
+    '''
+    data = self[name]
+    if type(data) in [vec2_double, vec3_double]:
+      keys = list(data.parts())
+    elif type(data) == miller_index:
+      keys = list(data.as_vec3_double().parts())
+    elif type(data) == int6:
+      keys = [k.as_double() for k in data.parts()]
+    elif type(data) == mat3_double:
+      n = len(data)
+      elements = data.as_double()
+      if n > 0:
+        elements.reshape(flex.grid(n, 9))
+        elements = elements.matrix_transpose().as_1d()
+      keys = [elements[i*n:(i+1)*n] for i in range(9)]
+    elif type(data) == flex.double:
+      keys = [data]
+    elif type(data) == flex.bool:
+      keys = [data.as_int().as_double()]
+    else:
+      keys = [data.as_double()]
+    if order is not None:
+      keys = [keys[i] for i in order]
+    return keys
+
   def match(self, other):
     '''
     Match reflections with another set of reflections.
@@ -398,73 +469,15 @@ def match_with_reference(self, other):
     :return: The matches
 
     '''
-    from collections import defaultdict
-    import __builtin__
     logger.info("Matching reference spots with predicted reflections")
     logger.info(' %d observed reflections input' % len(other))
     logger.info(' %d reflections predicted' % len(self))
 
-    # Get the miller index, entering flag and turn number for
-    # Both sets of reflections
-    i1 = self['id']
-    h1 = self['miller_index']
-    e1 = self['entering'].as_int()
-    x1, y1, z1 = self['xyzcal.px'].parts()
-    p1 = self['panel']
-
-    i2 = other['id']
-    h2 = other['miller_index']
-    e2 = other['entering'].as_int()
-    x2, y2, z2 = other['xyzcal.px'].parts()
-    p2 = other['panel']
-
-    class Match(object):
-      def __init__(self):
-        self.a = []
-        self.b = []
-
-    # Create the match lookup
-    lookup = defaultdict(Match)
-    for i in range(len(self)):
-      item = h1[i] + (e1[i], i1[i], p1[i])
-      lookup[item].a.append(i)
-
-    # Add matches from input reflections
-    for i in range(len(other)):
-      item = h2[i] + (e2[i], i2[i], p2[i])
-      if item in lookup:
-        lookup[item].b.append(i)
-
-    # Create the list of matches
-    match1 = []
-    match2 = []
-    for item, value in lookup.iteritems():
-      if len(value.b) == 0:
-        continue
-      elif len(value.a) == 1 and len(value.b) == 1:
-        match1.append(value.a[0])
-        match2.append(value.b[0])
-      else:
-        matched = {}
-        for i in value.a:
-          d = []
-          for j in value.b:
-            dx = x1[i]-x2[j]
-            dy = y1[i]-y2[j]
-            dz = z1[i]-z2[j]
-            d.append((i,j,dx**2 + dy**2 + dz**2))
-          i, j, d = __builtin__.min(d, key=lambda x: x[2])
-          if j not in matched:
-            matched[j] = (i, d)
-          elif d < matched[j][1]:
-            matched[j] = (i, d)
-        for key1, value1 in matched.iteritems():
-          match1.append(value1[0])
-          match2.append(key1)
+    # Match on miller index, entering flag, experiment id and panel, taking
+    # the nearest reflection where there are several candidates
+    sind, oind = self.match_with_reference_indices(other)
 
     # Select everything which matches
-    sind = flex.size_t(match1)
-    oind = flex.size_t(match2)
     s2 = self.select(sind)
     o2 = other.select(oind)
     h1 = s2['miller_index']
@@ -889,46 +902,44 @@ def find_overlaps(self, experiments=None, border=0):
     # Return the overlaps
     return overlaps
 
-  def compute_shoebox_overlap_fraction(self, overlaps):
+  def compute_shoebox_overlap_fraction(self, overlaps, nproc=1):
     '''
     Compute the fraction of shoebox overlapping.
 
+    The volume of the union of the adjacent shoeboxes is computed natively
+    from the bounding boxes, optionally splitting the reflections between
+    several processes.
+
     :param overlaps: The list of overlaps
+    :param nproc: The number of processes to use
     :return: The fraction of shoebox overlapped with other reflections
 
     '''
+    from dials.algorithms.shoebox import shoebox_overlap_fraction
     from dials.array_family import flex
-    result = flex.double(len(self))
     bbox = self['bbox']
-    for i in range(len(self)):
-      b1 = bbox[i]
-      xs = b1[1] - b1[0]
-      ys = b1[3] - b1[2]
-      zs = b1[5] - b1[4]
-      assert(xs > 0)
-      assert(ys > 0)
-      assert(zs > 0)
-      mask = flex.bool(flex.grid(zs,ys,xs),False)
-      for edge in overlaps.adjacent_vertices(i):
-        b2 = bbox[edge]
-        x0 = b2[0]-b1[0]
-        x1 = b2[1]-b1[0]
-        y0 = b2[2]-b1[2]
-        y1 = b2[3]-b1[2]
-        z0 = b2[4]-b1[4]
-        z1 = b2[5]-b1[4]
-        if x0 < 0: x0 = 0
-        if y0 < 0: y0 = 0
-        if z0 < 0: z0 = 0
-        if x1 > xs: x1 = xs
-        if y1 > ys: y1 = ys
-        if z1 > zs: z1 = zs
-        assert(x1 > x0)
-        assert(y1 > y0)
-        assert(z1 > z0)
-        m2 = flex.bool(flex.grid(z1-z0,y1-y0,x1-x0),True)
-        mask[z0:z1,y0:y1,x0:x1] = m2
-      result[i] = (1.0*mask.count(True)) / mask.size()
+    if nproc <= 1 or len(self) < nproc:
+      return shoebox_overlap_fraction(bbox, overlaps)
+
+    # Split the reflections into a contiguous block for each process
+    from libtbx import easy_mp
+    blocks = []
+    for i in range(nproc):
+      i0 = i * len(self) // nproc
+      i1 = (i + 1) * len(self) // nproc
+      blocks.append(flex.size_t_range(i0, i1))
+    def compute_block(index):
+      return shoebox_overlap_fraction(bbox, overlaps, index)
+    results = easy_mp.parallel_map(
+      func=compute_block,
+      iterable=blocks,
+      processes=nproc,
+      method='multiprocessing',
+      preserve_order=True,
+      preserve_exception_message=True)
+    result = flex.double()
+    for r in results:
+      result.extend(r)
     return result
 
 
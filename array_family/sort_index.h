@@ -12,6 +12,7 @@
 #define DIALS_ARRAY_FAMILY_SORT_INDEX_H
 
 #include <algorithm>
+#include <vector>
 
 namespace dials { namespace af {
 
@@ -40,6 +41,45 @@ namespace dials { namespace af {
     std::sort(begin, end, index_less<RandomAccessIterator>(v));
   }
 
+  /**
+   * Functor to compare indices lexicographically over several keys.
+   */
+  template <typename KeyType>
+  struct index_lexicographic_less {
+    index_lexicographic_less(const std::vector<KeyType> &keys, bool reverse)
+      : keys_(keys),
+        reverse_(reverse) {}
+
+    template <class IndexType>
+    bool operator() (const IndexType& x, const IndexType& y) const {
+      for (std::size_t i = 0; i < keys_.size(); ++i) {
+        if (keys_[i][x] < keys_[i][y]) {
+          return !reverse_;
+        }
+        if (keys_[i][y] < keys_[i][x]) {
+          return reverse_;
+        }
+      }
+      return false;
+    }
+    const std::vector<KeyType> &keys_;
+    bool reverse_;
+  };
+
+  /**
+   * Given a list of keys return a list of indices sorted lexicographically by
+   * the first key, then the second key, etc. The sort is stable.
+   * @param keys The list of keys
+   * @param reverse Sort in descending order
+   * @returns A sorted list of indices
+   */
+  template <typename IndexIterator, typename KeyType>
+  void sort_index_lexicographic(IndexIterator begin, IndexIterator end,
+      const std::vector<KeyType> &keys, bool reverse) {
+    std::stable_sort(begin, end,
+      index_lexicographic_less<KeyType>(keys, reverse));
+  }
+
 }}
 
 #endif /* DIALS_ARRAY_FAMILY_SORT_INDEX_H */
@@ -11,7 +11,14 @@
 '''
 
 phil_scope= libtbx.phil.parse("""
-""")
+mp {
+  nproc = 1
+    .type = int(value_min=1)
+    .help = "The number of processes to use."
+}
+
+include scope dials.algorithms.shadowing.filter.phil_scope
+""", process_includes=True)
 
 
 def run(args):
@@ -44,7 +51,9 @@ def run(args):
 
   imagesets = experiments.imagesets()
   reflections = reflections[0]
-  shadowed = filter_shadowed_reflections(experiments, reflections)
+  shadowed = filter_shadowed_reflections(experiments, reflections,
+    angle_bin_width=params.shadowing.angle_bin_width,
+    nproc=params.mp.nproc)
 
   print "# shadowed reflections: %i/%i (%.2f%%)" %(
     shadowed.count(True), shadowed.size(),
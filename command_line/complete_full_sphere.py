@@ -22,7 +22,14 @@
   .type = bool
   .help = "Consider shadowing in calculating overall completeness"
 
-''')
+mp {
+  nproc = 1
+    .type = int(value_min=1)
+    .help = "The number of processes to use."
+}
+
+include scope dials.algorithms.shadowing.filter.phil_scope
+''', process_includes=True)
 
 class Script(object):
   '''A class for running the script.'''
@@ -47,6 +54,7 @@ def __init__(self):
 
   def run(self):
     params, options = self.parser.parse_args(show_diff_phil=True)
+    self.params = params
     from dials.util import log
 
     log.config(info="dials.complete_full_sphere.log",
@@ -213,7 +221,9 @@ def predict_to_miller_set_with_shadow(self, expt, resolution):
     experiments.append(expt)
     predicted['id'] = flex.int(predicted.size(), 0)
     shadowed = filter_shadowed_reflections(experiments, predicted,
-                                           experiment_goniometer=True)
+      experiment_goniometer=True,
+      angle_bin_width=self.params.shadowing.angle_bin_width,
+      nproc=self.params.mp.nproc)
     predicted = predicted.select(~shadowed)
 
     hkl = predicted['miller_index']
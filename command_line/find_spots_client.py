@@ -10,6 +10,30 @@ def work(host, port, filename, params):
   conn.request('GET', path)
   return conn.getresponse().read()
 
+def work_batch(host, port, request, params):
+  '''
+  Send a batch request to the server, yielding the results for each image as
+  they are streamed back.
+
+  :param host: The server host
+  :param port: The server port
+  :param request: A dictionary with filenames, template and image_range or
+                  filename and image_range
+  :param params: The list of spot finding parameters
+  '''
+  import json
+  import urllib2
+  request = dict(request)
+  request['params'] = list(params)
+  response = urllib2.urlopen(
+    'http://%s:%s/batch' % (host, port), json.dumps(request))
+  try:
+    for line in response:
+      if line.strip():
+        yield json.loads(line)
+  finally:
+    response.close()
+
 def _nproc():
   from libtbx.introspection import number_of_processors
   return number_of_processors(return_value_if_unknown=-1)
@@ -51,21 +75,28 @@ def response_to_xml(d):
   return '<response>\n%s\n</response>' %response
 
 def work_all(host, port, filenames, params, plot=False, table=False,
-             json_file=None, grid=None, nproc=None):
+             json_file=None, grid=None, nproc=None, batch=None):
   import json
-  from multiprocessing.pool import ThreadPool as thread_pool
-  if nproc is None:
-    nproc=_nproc()
-  pool = thread_pool(processes=nproc)
-  threads = { }
-  for filename in filenames:
-    threads[filename] = pool.apply_async(work, (host, port, filename, params))
-  results = []
-  for filename in filenames:
-    response = threads[filename].get()
-    d = json.loads(response)
-    results.append(d)
-    print response_to_xml(d)
+  if batch is not None:
+    results = []
+    for d in work_batch(host, port, batch, params):
+      results.append(d)
+      print response_to_xml(d)
+    results.sort(key=lambda d: d['index'])
+  else:
+    from multiprocessing.pool import ThreadPool as thread_pool
+    if nproc is None:
+      nproc=_nproc()
+    pool = thread_pool(processes=nproc)
+    threads = { }
+    for filename in filenames:
+      threads[filename] = pool.apply_async(work, (host, port, filename, params))
+    results = []
+    for filename in filenames:
+      response = threads[filename].get()
+      d = json.loads(response)
+      results.append(d)
+      print response_to_xml(d)
 
   if json_file is not None:
     'Writing results to %s' %json_file
@@ -145,6 +176,13 @@ def stop(host, port, nproc):
       stopped = stopped + 1
   return stopped
 
+def server_stats(host, port):
+  import httplib
+  import json
+  conn = httplib.HTTPConnection(host, port)
+  conn.request('GET', '/stats')
+  return json.loads(conn.getresponse().read())
+
 import libtbx.phil
 phil_scope = libtbx.phil.parse("""\
 nproc = Auto
@@ -161,6 +199,15 @@ def stop(host, port, nproc):
   .type = path
 grid = None
   .type = ints(size=2, value_min=1)
+batch = False
+  .type = bool
+  .help = "Send all images to the server in a single request"
+template = None
+  .type = str
+  .help = "A filename template (e.g. image_#####.cbf) to process as a batch"
+image_range = None
+  .type = ints(size=2, value_min=1)
+  .help = "The image range for a template or a multi-image file"
 """)
 
 if __name__ == '__main__':
@@ -192,6 +239,10 @@ def stop(host, port, nproc):
   if len(unhandled) and unhandled[0] == 'stop':
     stopped = stop(params.host, params.port, params.nproc)
     print 'Stopped %d findspots processes' % stopped
+  elif len(unhandled) and unhandled[0] == 'stats':
+    stats = server_stats(params.host, params.port)
+    for key in sorted(stats):
+      print '%s: %s' % (key, stats[key])
   elif len(unhandled) and unhandled[0] == 'ping':
     from urllib2 import urlopen
     url = 'http://%s:%i' %(params.host, params.port)
@@ -202,6 +253,22 @@ def stop(host, port, nproc):
     except Exception:
       print "Failure"
       sys.exit(1)
+  elif params.template is not None or params.batch:
+    if params.template is not None:
+      if params.image_range is None:
+        raise RuntimeError('image_range is required with template')
+      batch = {
+        'template': params.template,
+        'image_range': params.image_range }
+    elif len(filenames) == 1 and params.image_range is not None:
+      batch = {
+        'filename': os.path.abspath(filenames[0]),
+        'image_range': params.image_range }
+    else:
+      batch = {'filenames': [os.path.abspath(f) for f in filenames]}
+    work_all(params.host, params.port, filenames, unhandled, plot=params.plot,
+             table=params.table, json_file=params.json,
+             grid=params.grid, batch=batch)
   else:
     if len(filenames) == 1:
       response = work(params.host, params.port, filenames[0], unhandled)
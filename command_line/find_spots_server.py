@@ -1,8 +1,8 @@
 from __future__ import absolute_import, division
 import time
 import BaseHTTPServer as server_base
-from multiprocessing import Process
-from multiprocessing import current_process
+import SocketServer
+import socket
 import os
 import sys
 
@@ -53,6 +53,21 @@
 
   dials.find_spots_client /path/to/image.cbf min_spot_size=2 d_min=2
 
+To find spots on many images with a single request, with the results for
+each image streamed back as it finishes::
+
+  dials.find_spots_client batch=True /path/to/image_*.cbf
+  dials.find_spots_client template=/path/to/image_#####.cbf image_range=1,3600
+  dials.find_spots_client batch=True /path/to/data_master.h5 image_range=1,3600
+
+The batch endpoint itself is a POST to /batch with a JSON body containing
+either filenames, template and image_range, or filename and image_range, plus
+an optional list of params. The response is newline-delimited JSON.
+
+To show the request queue depth and latency statistics of the server::
+
+  dials.find_spots_client stats [host=hostname] [port=1234]
+
 To stop the server::
 
   dials.find_spots_client stop [host=hostname] [port=1234]
@@ -61,11 +76,28 @@
 
 stop = False
 
-def work(filename, cl=None):
-  if cl is None:
-    cl = []
-  import libtbx.phil
-  phil_scope = libtbx.phil.parse('''\
+# Per-process caches of parsed parameters, format classes and spot finders.
+# The server keeps a pool of worker processes alive for its whole lifetime so
+# these are reused across requests.
+_parameter_cache = {}
+_format_cache = {}
+_spot_finder_cache = {}
+_imageset_cache = {}
+
+def parse_parameters(cl):
+  '''
+  Parse the command line parameters, caching the result.
+
+  :param cl: The list of command line parameters
+  :return: A tuple (server params, spot finding params, unhandled)
+
+  '''
+  import copy
+  key = tuple(cl)
+  if key not in _parameter_cache:
+    import libtbx.phil
+    from dials.command_line.find_spots import phil_scope as find_spots_phil_scope
+    phil_scope = libtbx.phil.parse('''\
 index = False
   .type = bool
 integrate = False
@@ -73,29 +105,119 @@ def work(filename, cl=None):
 indexing_min_spots = 10
   .type = int(value_min=1)
 ''')
+    interp = phil_scope.command_line_argument_interpreter()
+    params, unhandled = interp.process_and_fetch(
+      cl, custom_processor='collect_remaining')
+    server_params = params.extract()
+    interp = find_spots_phil_scope.command_line_argument_interpreter()
+    phil_scope, unhandled = interp.process_and_fetch(
+      unhandled, custom_processor='collect_remaining')
+    logger.info('The following spotfinding parameters have been modified:')
+    logger.info(find_spots_phil_scope.fetch_diff(source=phil_scope).as_str())
+    params = phil_scope.extract()
+    # no need to write the hot mask in the server/client
+    params.spotfinder.write_hot_mask = False
+    _parameter_cache[key] = (server_params, params, unhandled)
+  server_params, params, unhandled = _parameter_cache[key]
+  return server_params, copy.deepcopy(params), list(unhandled)
+
+def import_datablock(filename):
+  '''
+  Import a datablock from a single image, reusing the format class found for
+  previous images with the same directory and extension.
+
+  :param filename: The image filename
+  :return: The datablock
+
+  '''
+  from dxtbx.datablock import DataBlockFactory
+  from dxtbx.format.Registry import Registry
+  key = (os.path.dirname(filename), os.path.splitext(filename)[1])
+  format_class = _format_cache.get(key)
+  if format_class is None or not format_class.understand(filename):
+    format_class = Registry.find(filename)
+    _format_cache[key] = format_class
+  imageset = format_class.get_imageset([filename])
+  return DataBlockFactory.from_imageset(imageset)[0]
+
+def get_spot_finder(cl, params, datablock):
+  '''
+  Get the spot finder for the parameters and detector, creating and caching it
+  if necessary.
+
+  :param cl: The list of command line parameters
+  :param params: The spot finding parameters
+  :param datablock: The datablock
+  :return: The spot finder
+
+  '''
+  from dials.algorithms.spot_finding.factory import SpotFinderFactory
+  from dials.util.masking import CachedMaskGenerator
+  from libtbx import Auto
+  imageset = datablock.extract_imagesets()[0]
+  detector = imageset.get_detector()
+  key = (
+    tuple(cl),
+    imageset.get_format_class(),
+    detector[0].get_type(),
+    tuple(panel.get_gain() for panel in detector))
+  if key not in _spot_finder_cache:
+    if params.spotfinder.filter.min_spot_size is Auto:
+      if detector[0].get_type() == 'SENSOR_PAD':
+        params.spotfinder.filter.min_spot_size = 3
+      else:
+        params.spotfinder.filter.min_spot_size = 6
+    find_spots = SpotFinderFactory.from_parameters(
+      datablock=datablock,
+      params=params)
+    find_spots.mask_generator = CachedMaskGenerator(params.spotfinder.filter)
+    _spot_finder_cache[key] = find_spots
+  return _spot_finder_cache[key]
+
+def import_frame(filename, frame):
+  '''
+  Import a datablock containing a single frame of a multi-image file (e.g.
+  HDF5). The full imageset is opened once per worker and kept open for the
+  following frames.
+
+  :param filename: The image filename
+  :param frame: The image number (starting at 1)
+  :return: The datablock
+
+  '''
+  from dxtbx.datablock import DataBlock, DataBlockFactory
+  if filename not in _imageset_cache:
+    datablock = DataBlockFactory.from_filenames([filename])[0]
+    _imageset_cache.clear()
+    _imageset_cache[filename] = datablock.extract_imagesets()[0]
+  imageset = _imageset_cache[filename]
+  scan = imageset.get_scan()
+  if scan is not None:
+    offset = frame - 1 - scan.get_array_range()[0]
+  else:
+    offset = frame - 1
+  if offset < 0 or offset >= len(imageset):
+    raise RuntimeError("Frame %d is not in file %s" % (frame, filename))
+  return DataBlock([imageset[offset:offset+1]])
+
+def work(filename, cl=None, frame=None):
+  if cl is None:
+    cl = []
   if not os.access(filename, os.R_OK):
     raise RuntimeError("Server does not have read access to file %s" %filename)
-  interp = phil_scope.command_line_argument_interpreter()
-  params, unhandled = interp.process_and_fetch(
-    cl, custom_processor='collect_remaining')
-  index = params.extract().index
-  integrate = params.extract().integrate
-  indexing_min_spots = params.extract().indexing_min_spots
-
-  from dials.command_line.find_spots import phil_scope as find_spots_phil_scope
-  from dxtbx.datablock import DataBlockFactory
+  server_params, params, unhandled = parse_parameters(cl)
+  index = server_params.index
+  integrate = server_params.integrate
+  indexing_min_spots = server_params.indexing_min_spots
+
   from dials.array_family import flex
-  interp = find_spots_phil_scope.command_line_argument_interpreter()
-  phil_scope, unhandled = interp.process_and_fetch(
-    unhandled, custom_processor='collect_remaining')
-  logger.info('The following spotfinding parameters have been modified:')
-  logger.info(find_spots_phil_scope.fetch_diff(source=phil_scope).as_str())
-  params = phil_scope.extract()
-  # no need to write the hot mask in the server/client
-  params.spotfinder.write_hot_mask = False
-  datablock = DataBlockFactory.from_filenames([filename])[0]
+  if frame is None:
+    datablock = import_datablock(filename)
+  else:
+    datablock = import_frame(filename, frame)
   t0 = time.time()
-  reflections = flex.reflection_table.from_observations(datablock, params)
+  find_spots = get_spot_finder(cl, params, datablock)
+  reflections = find_spots(datablock)
   t1 = time.time()
   logger.info('Spotfinding took %.2f seconds' %(t1-t0))
   from dials.algorithms.spot_finding import per_image_analysis
@@ -226,9 +348,142 @@ def work(filename, cl=None):
 
   return stats
 
+def timed_work(filename, cl=None):
+  '''
+  Run work() in a worker process and record when it started and finished.
+
+  '''
+  start_time = time.time()
+  try:
+    return work(filename, cl), start_time, time.time()
+  except Exception, e:
+    return {'error': str(e)}, start_time, time.time()
+
+def template_filenames(template, image_range):
+  '''
+  Expand a filename template such as /path/to/image_#####.cbf for an
+  inclusive image range.
+
+  :param template: The filename template
+  :param image_range: The first and last image numbers
+  :return: The list of filenames
+
+  '''
+  import re
+  matches = list(re.finditer('#+', template))
+  if len(matches) == 0:
+    raise RuntimeError("No # characters in template %s" % template)
+  start, end = matches[-1].span()
+  first, last = image_range
+  return [
+    template[:start] + str(i).zfill(end - start) + template[end:]
+    for i in range(first, last + 1)]
+
+def batch_tasks(request):
+  '''
+  Get the list of tasks for a batch request. The request is a dictionary
+  containing one of:
+
+   - filenames: a list of image filenames
+   - template and image_range: a filename template and inclusive image range
+   - filename and image_range: a multi-image file (e.g. HDF5) and an
+     inclusive frame range
+
+  and optionally a list of spot finding parameters in params.
+
+  :param request: The request dictionary
+  :return: A list of (index, image, filename, frame, params) tuples
+
+  '''
+  params = [str(p) for p in request.get('params', [])]
+  if 'filenames' in request:
+    items = [(str(f), None) for f in request['filenames']]
+  elif 'template' in request:
+    items = [
+      (f, None) for f in template_filenames(
+        str(request['template']), request['image_range'])]
+  elif 'filename' in request:
+    filename = str(request['filename'])
+    first, last = request.get('image_range', (1, 1))
+    items = [(filename, i) for i in range(first, last + 1)]
+  else:
+    raise RuntimeError("Batch request needs filenames, template or filename")
+  tasks = []
+  for index, (filename, frame) in enumerate(items):
+    if frame is None:
+      image = filename
+    else:
+      image = '%s:%d' % (filename, frame)
+    tasks.append((index, image, filename, frame, params))
+  return tasks
+
+def timed_batch_work(task):
+  '''
+  Run work() in a worker process for one image of a batch request.
+
+  '''
+  index, image, filename, frame, params = task
+  start_time = time.time()
+  try:
+    stats = work(filename, params, frame=frame)
+  except Exception, e:
+    stats = {'error': str(e)}
+  return index, image, stats, start_time, time.time()
+
+class ServerStatistics(object):
+  '''
+  Request queue and latency statistics for the server.
+
+  '''
+
+  def __init__(self, nproc):
+    import threading
+    self.lock = threading.Lock()
+    self.nproc = nproc
+    self.start_time = time.time()
+    self.pending = 0
+    self.completed = 0
+    self.failed = 0
+    self.total_latency = 0
+    self.max_latency = 0
+    self.total_wait = 0
+
+  def submit(self, n=1):
+    ''' Record requests being submitted to the worker pool. '''
+    with self.lock:
+      self.pending += n
+
+  def finish(self, latency, wait, failed=False):
+    ''' Record a request having finished. '''
+    with self.lock:
+      self.pending -= 1
+      self.completed += 1
+      if failed:
+        self.failed += 1
+      self.total_latency += latency
+      self.max_latency = max(self.max_latency, latency)
+      self.total_wait += wait
+
+  def as_dict(self):
+    ''' Return the statistics as a dictionary. '''
+    with self.lock:
+      n = max(self.completed, 1)
+      return {
+        'nproc'           : self.nproc,
+        'uptime'          : time.time() - self.start_time,
+        'queue_depth'     : max(0, self.pending - self.nproc),
+        'in_progress'     : min(self.pending, self.nproc),
+        'completed'       : self.completed,
+        'failed'          : self.failed,
+        'mean_latency'    : self.total_latency / n,
+        'max_latency'     : self.max_latency,
+        'mean_queue_wait' : self.total_wait / n,
+      }
+
 class handler(server_base.BaseHTTPRequestHandler):
   def do_GET(s):
     '''Respond to a GET request.'''
+    import json
     s.send_response(200)
     s.send_header('Content-type', 'text/xml')
     s.end_headers()
@@ -236,25 +491,85 @@ def do_GET(s):
       global stop
       stop = True
       return
+    if s.path == '/stats':
+      s.wfile.write(json.dumps(s.server.statistics.as_dict()))
+      return
     filename = s.path.split(';')[0]
     params = s.path.split(';')[1:]
-    proc = current_process().name
 
     d = {'image': filename}
 
+    statistics = s.server.statistics
+    submit_time = time.time()
+    statistics.submit()
     try:
-      stats = work(filename, params)
+      stats, start_time, end_time = s.server.pool.apply_async(
+        timed_work, (filename, params)).get()
       d.update(stats)
-
+      statistics.finish(
+        end_time - submit_time, start_time - submit_time, 'error' in stats)
     except Exception, e:
       d['error'] = str(e)
+      statistics.finish(time.time() - submit_time, 0, True)
 
-    import json
     response = json.dumps(d)
     s.wfile.write(response)
 
     return
 
+  def do_POST(s):
+    '''
+    Respond to a batch request. The request body is a JSON dictionary as
+    described in batch_tasks(). The results for each image are streamed back
+    as newline-delimited JSON as soon as they are available, in the order in
+    which they finish.
+
+    '''
+    import json
+    if s.path != '/batch':
+      s.send_error(404)
+      return
+    try:
+      length = int(s.headers.getheader('content-length', 0))
+      tasks = batch_tasks(json.loads(s.rfile.read(length)))
+    except Exception, e:
+      s.send_error(400, str(e))
+      return
+    s.send_response(200)
+    s.send_header('Content-type', 'application/x-ndjson')
+    s.end_headers()
+
+    statistics = s.server.statistics
+    submit_time = time.time()
+    statistics.submit(len(tasks))
+    results = s.server.pool.imap_unordered(timed_batch_work, tasks)
+    connected = True
+    for index, image, stats, start_time, end_time in results:
+      statistics.finish(
+        end_time - submit_time, start_time - submit_time, 'error' in stats)
+      if not connected:
+        continue
+      d = {'image': image, 'index': index}
+      d.update(stats)
+      try:
+        s.wfile.write(json.dumps(d) + '\n')
+        s.wfile.flush()
+      except socket.error:
+        # The client has gone away; keep draining the results so that the
+        # statistics stay consistent
+        connected = False
+
+class server_class(SocketServer.ThreadingMixIn, server_base.HTTPServer):
+  '''
+  HTTP server handling each request in a thread. The spot finding itself is
+  done by a persistent pool of worker processes.
+
+  '''
+  daemon_threads = True
+
+  # Wake up periodically so that a stop request is acted on promptly
+  timeout = 0.5
+
 def serve(httpd):
   try:
     while not stop:
@@ -274,16 +589,19 @@ def serve(httpd):
 
 
 def main(nproc, port):
-  server_class = server_base.HTTPServer
+  from multiprocessing import Pool
+  pool = Pool(processes=nproc)
   httpd = server_class(('', port), handler)
+  httpd.pool = pool
+  httpd.statistics = ServerStatistics(nproc)
   print time.asctime(), 'Serving %d processes on port %d' % (nproc, port)
 
-  for j in range(nproc - 1):
-    proc = Process(target=serve, args=(httpd,))
-    proc.daemon = True
-    proc.start()
-  serve(httpd)
-  httpd.server_close()
+  try:
+    serve(httpd)
+  finally:
+    httpd.server_close()
+    pool.terminate()
+    pool.join()
   print time.asctime(), 'done'
 
 if __name__ == '__main__':
@@ -51,8 +51,39 @@
       .type = str
       .help = "The image template"
 
+    write_images = True
+      .type = bool
+      .help = "Write the received images to the output directory. The images"
+              "are written in a background thread so that receiving the"
+              "stream is not held up. If False, only the metadata is written"
+              "and the images cannot be read back from the datablock."
+
+    statistics = None
+      .type = str
+      .help = "Write the spot finding statistics for each image to this file,"
+              "as one JSON object per line"
+
   }
 
+  spotfinding {
+
+    enable = False
+      .type = bool
+      .help = "Find spots on each image as it is received and report the"
+              "statistics for each image as they are computed"
+
+    nproc = 1
+      .type = int(value_min=1)
+      .help = "The number of spot finding processes"
+
+    resolution_analysis = True
+      .type = bool
+      .help = "Estimate the resolution of each image from the spots"
+
+  }
+
+  include scope dials.algorithms.spot_finding.factory.phil_scope
+
   verbosity = 1
     .type = int(value_min=0)
     .help = "The verbosity level"
@@ -69,7 +100,7 @@
 
   }
 
-''')
+''', process_includes=True)
 
 
 
@@ -95,7 +126,8 @@ def run(self):
     from dials.util import log
     import libtbx
     from uuid import uuid4
-    from dials.util.stream import ZMQStream, Decoder
+    from dials.util.stream import ZMQStream, Decoder, ImageWriter
+    from dials.util.stream import StreamSpotFinder, SpotFinderWorkerPool
     from os.path import join, exists
     import os
     import json
@@ -144,42 +176,85 @@ def run(self):
       params.output.directory,
       params.output.image_template)
     imageset = None
-    while True:
-
-      # Get the frames from zmq
-      frames = stream.receive()
-
-      # Decode the frames
-      obj = decoder.decode(frames)
-
-      # Process the object
-      if obj.is_header():
-        filename = join(params.output.directory, "metadata.json")
-        with open(filename, "w") as outfile:
-          json.dump(obj.header, outfile)
-        imageset = obj.as_imageset(filename)
-        datablocks = [DataBlock([imageset])]
-        self.write_datablocks(datablocks, params)
-      elif obj.is_image():
-        assert imageset is not None
-        filename = join(
-          params.output.directory,
-          params.output.image_template % obj.count)
-        with open(filename, "wb") as outfile:
-          outfile.write(obj.data)
-        filename = join(
-          params.output.directory,
-          "%s.info" % (params.output.image_template % obj.count))
-        with open(filename, "w") as outfile:
-          json.dump(obj.info, outfile)
-      elif obj.is_endofseries():
-        assert imageset is not None
-        break
-      else:
-        raise RuntimeError("Unknown object")
-
-    # Close the stream
-    stream.close()
+    writer = None
+    workers = None
+    if params.output.write_images:
+      writer = ImageWriter(
+        params.output.directory,
+        params.output.image_template)
+    statistics = None
+    if params.spotfinding.enable and params.output.statistics:
+      statistics = open(params.output.statistics, "w")
+    try:
+      while True:
+
+        # Get the frames from zmq
+        frames = stream.receive()
+
+        # Decode the frames
+        obj = decoder.decode(frames)
+
+        # Process the object
+        if obj.is_header():
+          filename = join(params.output.directory, "metadata.json")
+          with open(filename, "w") as outfile:
+            json.dump(obj.header, outfile)
+          imageset = obj.as_imageset(filename)
+          datablocks = [DataBlock([imageset])]
+          self.write_datablocks(datablocks, params)
+          if params.spotfinding.enable:
+            workers = SpotFinderWorkerPool(
+              StreamSpotFinder(
+                imageset,
+                params,
+                params.spotfinding.resolution_analysis),
+              params.spotfinding.nproc)
+        elif obj.is_image():
+          assert imageset is not None
+          if workers is not None:
+            workers.submit(obj)
+          if writer is not None:
+            writer.write(obj)
+        elif obj.is_endofseries():
+          assert imageset is not None
+          break
+        else:
+          raise RuntimeError("Unknown object")
+
+        # Report the spot finding results which are ready
+        if workers is not None:
+          self.report_statistics(workers.results(), statistics)
+
+      # Wait for the remaining images
+      if workers is not None:
+        self.report_statistics(workers.close(), statistics)
+      if writer is not None:
+        writer.close()
+    finally:
+      if statistics is not None:
+        statistics.close()
+
+      # Close the stream
+      stream.close()
+
+  def report_statistics(self, results, outfile=None):
+    '''
+    Log the spot finding statistics for each image and optionally write them
+    to file.
+
+    '''
+    import json
+    for count, stats, error in results:
+      if error is not None:
+        logger.warning("Spot finding failed on image %d: %s" % (count, error))
+        continue
+      message = "Image %d: %d spots" % (count, stats['n_spots_total'])
+      if stats.get('estimated_d_min', -1) > 0:
+        message += ", estimated d_min %.2f" % stats['estimated_d_min']
+      logger.info(message)
+      if outfile is not None:
+        outfile.write(json.dumps(stats) + "\n")
+        outfile.flush()
 
   def write_datablocks(self, datablocks, params):
     '''
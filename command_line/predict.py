@@ -50,6 +50,14 @@
     .help = "Minimum d-spacing of predicted reflections"
 
     include scope dials.algorithms.profile_model.factory.phil_scope
+
+  mp {
+    nproc = 1
+      .type = int(value_min=1)
+      .help = "The number of processes to use."
+  }
+
+  include scope dials.algorithms.shadowing.filter.phil_scope
 ''', process_includes=True)
 
 
@@ -119,7 +127,9 @@ def run(self):
       from dials.algorithms.shadowing.filter import filter_shadowed_reflections
 
       shadowed = filter_shadowed_reflections(experiments, predicted_all,
-                                             experiment_goniometer=True)
+        experiment_goniometer=True,
+        angle_bin_width=params.shadowing.angle_bin_width,
+        nproc=params.mp.nproc)
       predicted_all = predicted_all.select(~shadowed)
 
     try:
@@ -71,6 +71,18 @@
     nproc = 1
       .type = int(value_min=1)
       .help = "The number of processes to use."
+    mpi {
+      method = *striping client_server
+        .type = choice
+        .help = "striping: each rank processes every Nth image, where N is the"
+                "number of ranks. client_server: rank 0 hands out batches of"
+                "images to the other ranks as they become free, so ranks that"
+                "draw cheap images (e.g. blanks) are not left idle."
+      batch_size = 1
+        .type = int(value_min=1)
+        .help = "For client_server, the number of images handed out to a rank"
+                "per request."
+    }
   }
 '''
 
@@ -319,9 +331,25 @@ def do_work(item):
       rank = comm.Get_rank() # each process in MPI has a unique id, 0-indexed
       size = comm.Get_size() # size: number of processes running in this job
 
-      for i, item in enumerate(iterable):
-        if (i+rank)%size == 0:
-          do_work(item)
+      start_time = time()
+      timer = BusyTimer(
+        do_work,
+        log_errors=params.mp.mpi.method == 'client_server')
+      if params.mp.mpi.method == 'client_server' and size > 1:
+        if rank == 0:
+          mpi_serve(comm, len(iterable), params.mp.mpi.batch_size)
+        else:
+          mpi_client(comm, iterable, timer)
+      else:
+        for i, item in enumerate(iterable):
+          if (i+rank)%size == 0:
+            timer(item)
+      stats = comm.gather(
+        (rank, timer.count, timer.failed, timer.busy, time() - start_time),
+        root=0)
+      if rank == 0:
+        logger.info(mpi_utilisation_table(stats))
+      timer.raise_error()
     else:
       easy_mp.parallel_map(
         func=do_work,
@@ -335,6 +363,108 @@ def do_work(item):
     logger.info("")
     logger.info("Total Time Taken = %f seconds" % (time() - st))
 
+class BusyTimer(object):
+  '''
+  Wrap a work function and record the time spent in it.
+
+  Errors are not raised straight away, so that an MPI rank always goes on to
+  request more work and to report its statistics; otherwise the other ranks
+  would wait for it forever. Abort and Sorry, and any other error unless
+  log_errors is set, are fatal: the remaining items are skipped and the error
+  is raised by raise_error once the ranks have finished together. If
+  log_errors is set, other errors are logged and the next item is processed.
+
+  '''
+
+  def __init__(self, func, log_errors=False):
+    self.func = func
+    self.log_errors = log_errors
+    self.count = 0
+    self.failed = 0
+    self.busy = 0
+    self.error = None
+
+  def __call__(self, item):
+    import sys
+    from time import time
+    if self.error is not None:
+      return
+    st = time()
+    try:
+      return self.func(item)
+    except (Abort, Sorry):
+      self.error = sys.exc_info()
+      self.failed += 1
+    except Exception, e:
+      if self.log_errors:
+        logger.error("Error processing %s: %s" % (item[0], str(e)))
+      else:
+        self.error = sys.exc_info()
+      self.failed += 1
+    finally:
+      self.busy += time() - st
+      self.count += 1
+
+  def raise_error(self):
+    '''
+    Raise the fatal error, if any, with its original traceback.
+
+    '''
+    if self.error is not None:
+      raise self.error[0], self.error[1], self.error[2]
+
+def mpi_serve(comm, nitems, batch_size):
+  '''
+  Hand out batches of item indices to the client ranks on request, then tell
+  each client to stop.
+
+  '''
+  from mpi4py import MPI
+  batches = [range(i, min(i + batch_size, nitems))
+             for i in range(0, nitems, batch_size)]
+  for batch in batches:
+    client = comm.recv(source=MPI.ANY_SOURCE)
+    comm.send(batch, dest=client)
+  for i in range(comm.Get_size() - 1):
+    client = comm.recv(source=MPI.ANY_SOURCE)
+    comm.send(None, dest=client)
+
+def mpi_client(comm, iterable, work):
+  '''
+  Request batches of item indices from rank 0 and process them until there are
+  none left.
+
+  '''
+  rank = comm.Get_rank()
+  while True:
+    comm.send(rank, dest=0)
+    batch = comm.recv(source=0)
+    if batch is None:
+      break
+    for i in batch:
+      work(iterable[i])
+
+def mpi_utilisation_table(stats):
+  '''
+  Format the per-rank processing statistics.
+
+  :param stats: A list of (rank, nitems, nfailed, busy time, wall time) tuples
+  :return: The table as a string
+
+  '''
+  from libtbx.table_utils import format as table
+  rows = [["Rank", "# Images", "# Failed", "Busy time", "Wall time",
+           "Utilisation"]]
+  for rank, count, failed, busy, wall in sorted(stats):
+    if wall > 0:
+      utilisation = "%.1f%%" % (100 * busy / wall)
+    else:
+      utilisation = "-"
+    rows.append([str(rank), str(count), str(failed), "%.2f" % busy,
+                 "%.2f" % wall, utilisation])
+  return "MPI rank utilisation:\n%s" % table(
+    rows, has_header=True, justify="right", prefix=" ")
+
 class Processor(object):
   def __init__(self, params):
     self.params = params
@@ -393,8 +523,11 @@ def find_spots(self, datablock):
     logger.info('Finding Strong Spots')
     logger.info('*' * 80)
 
-    # Find the strong spots
-    observed = flex.reflection_table.from_observations(datablock, self.params)
+    # Find the strong spots. The decoded images are cached for integration
+    from dials.util.frame_cache import FrameCache
+    frame_cache = FrameCache.from_params(self.params.integration.frame_cache)
+    observed = flex.reflection_table.from_observations(
+      datablock, self.params, frame_cache=frame_cache)
 
     # Reset z coordinates for dials.image_viewer; see Issues #226 for details
     xyzobs = observed['xyzobs.px.value']
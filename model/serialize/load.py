@@ -25,9 +25,12 @@ def reflections(infile):
 
   '''
   import cPickle as pickle
+  from dials.array_family import columnar
 
   # If the input is a string then open and read from that file
   if isinstance(infile, str):
+    if columnar.is_columnar_file(infile):
+      return columnar.load(infile)
     with open(infile, 'rb') as infile:
       return pickle.load(infile)
 
@@ -31,14 +31,20 @@
     "$D/test/algorithms/integration/profile/tst_single_sampler.py",
     "$D/test/algorithms/integration/tst_corrections.py",
     "$D/test/algorithms/integration/tst_interface.py",
+    "$D/test/algorithms/integration/tst_overlaps_filter.py",
     "$D/test/algorithms/integration/tst_profile_fitting_rs.py",
     "$D/test/algorithms/integration/tst_summation.py",
     "$D/test/algorithms/integration/tst_filter_overlaps.py",
+    "$D/test/algorithms/integration/tst_checkpoint.py",
+    "$D/test/algorithms/integration/tst_processor_stream.py",
+    "$D/test/algorithms/integration/tst_prefetch.py",
     "$D/test/algorithms/polygon/clip/tst_clipping.py",
     "$D/test/algorithms/polygon/tst_spatial_interpolation.py",
     "$D/test/algorithms/profile_model/tst_profile_model.py",
     "$D/test/algorithms/profile_model/tst_ewald_sphere_sampler.py",
     "$D/test/algorithms/refinement/tst_beam_parameters.py",
+    "$D/test/algorithms/refinement/tst_build_up_worker_pool.py",
+    "$D/test/algorithms/refinement/tst_centroid_outlier.py",
     "$D/test/algorithms/refinement/tst_crystal_parameters.py",
     "$D/test/algorithms/refinement/tst_detector_parameters.py",
     "$D/test/algorithms/refinement/tst_finite_diffs.py",
@@ -85,6 +91,7 @@
     "$D/test/algorithms/spot_prediction/tst_scan_varying_reflection_predictor.py",
     "$D/test/algorithms/spot_prediction/tst_spot_prediction.py",
     "$D/test/algorithms/spot_prediction/tst_stills_reflection_predictor.py",
+    "$D/test/algorithms/shadowing/tst_filter.py",
     "$D/test/algorithms/statistics/tst_fast_mcd.py",
     "$D/test/algorithms/scaling/tst_observation_manager.py",
     "$D/test/algorithms/scaling/tst_scale_parameterisation.py",
@@ -145,6 +152,10 @@
     "$D/test/util/tst_nexus.py",
     "$D/test/util/tst_nexus_multi_experiment.py",
     "$D/test/util/tst_masking.py",
+    "$D/test/util/tst_mp.py",
+    "$D/test/util/tst_frame_cache.py",
+    "$D/test/util/tst_stream.py",
+    "$D/test/util/tst_image_viewer_frame_index.py",
     "$D/test/algorithms/indexing/tst_phi_scan.py",
     ["$D/test/algorithms/indexing/tst_index.py", "1"],
     ["$D/test/algorithms/indexing/tst_index.py", "2"],
@@ -168,6 +179,7 @@
     ["$D/test/command_line/tst_discover_better_experimental_model.py", "2"],
     ["$D/test/command_line/tst_discover_better_experimental_model.py", "3"],
     "$D/test/algorithms/indexing/tst_compare_orientation_matrices.py",
+    "$D/test/algorithms/indexing/tst_real_space_grid_search.py",
     "$D/test/algorithms/indexing/tst_symmetry.py",
     #"$D/scratch/rjg/unit_cell_refinement.py",
     ] + discover("dials")
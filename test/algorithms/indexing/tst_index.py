@@ -625,6 +625,30 @@ def exercise_18():
                             expected_rmsds, expected_hall_symbol)
   assert len(result.indexed_reflections) > 1300, len(result.indexed_reflections)
 
+def exercise_19():
+  # check the choice of crystal model does not depend on the number of
+  # processes used to refine the candidate solutions
+  data_dir = os.path.join(dials_regression, "indexing_test_data", "i04_weak_data")
+  pickle_path = os.path.join(data_dir, "full.pickle")
+  sweep_path = os.path.join(data_dir, "datablock_orig.json")
+  expected_unit_cell = uctbx.unit_cell(
+    (58, 58, 150, 90, 90, 90))
+  expected_rmsds = (0.05, 0.04, 0.0005)
+  expected_hall_symbol = ' P 1'
+
+  unit_cells = []
+  for nproc in (1, 3):
+    extra_args = ["bin_size_fraction=0.25",
+                  "scan_range=1,20",
+                  "scan_range=250,270",
+                  "scan_range=520,540",
+                  "indexing.nproc=%d" % nproc]
+    result = run_one_indexing(pickle_path, sweep_path, extra_args,
+                              expected_unit_cell, expected_rmsds,
+                              expected_hall_symbol)
+    unit_cells.append(result.crystal_model.get_unit_cell().parameters())
+  assert approx_equal(unit_cells[0], unit_cells[1])
+
 def run(args):
   if not libtbx.env.has_module("dials_regression"):
     print "Skipping exercise_index_3D_FFT_simple: dials_regression not present"
@@ -633,7 +657,7 @@ def run(args):
   exercises = (exercise_1, exercise_2, exercise_3, exercise_4, exercise_5,
                exercise_6, exercise_7, exercise_8, exercise_9, exercise_10,
                exercise_11, exercise_12, exercise_13, exercise_14, exercise_15,
-               exercise_16, exercise_17, exercise_18)
+               exercise_16, exercise_17, exercise_18, exercise_19)
   if len(args):
     args = [int(arg) for arg in args]
     for arg in args: assert arg > 0
@@ -0,0 +1,55 @@
+from __future__ import absolute_import, division
+from libtbx.test_utils import approx_equal
+
+def exercise_search_vectors():
+  from scitbx.array_family import flex
+  from scitbx import matrix
+  from dials.algorithms.indexing.real_space_grid_search import search_vectors
+
+  directions = flex.vec3_double([(1,0,0), (0,1,0), (0,0.6,0.8)])
+  lengths = [10, 25.5]
+  vectors = search_vectors(directions, lengths)
+  expected = []
+  for d in directions:
+    for l in lengths:
+      expected.append((matrix.col(d) * l).elems)
+  assert len(vectors) == len(expected)
+  for v, e in zip(vectors, expected):
+    assert approx_equal(v, e)
+
+def exercise_compute_functional():
+  import math
+  import random
+  from scitbx.array_family import flex
+  from dials.algorithms.indexing.real_space_grid_search import \
+    compute_functional_parallel
+
+  random.seed(0)
+  rlp = flex.vec3_double(
+    [(random.uniform(-0.5, 0.5), random.uniform(-0.5, 0.5),
+      random.uniform(-0.5, 0.5)) for i in range(500)])
+  vectors = flex.vec3_double(
+    [(random.uniform(-50, 50), random.uniform(-50, 50),
+      random.uniform(-50, 50)) for i in range(450)])
+
+  # The functional for each vector evaluated one at a time
+  expected = flex.double([
+    flex.sum(flex.cos(2 * math.pi * rlp.dot(v))) for v in vectors])
+
+  for nproc in (1, 3):
+    values = compute_functional_parallel(rlp, vectors, nproc=nproc)
+    assert len(values) == len(vectors)
+    assert approx_equal(values, expected)
+
+  # The ranking is the same
+  values = compute_functional_parallel(rlp, vectors, nproc=2)
+  assert list(flex.sort_permutation(values, reverse=True)) == \
+         list(flex.sort_permutation(expected, reverse=True))
+
+def run():
+  exercise_search_vectors()
+  exercise_compute_functional()
+  print 'OK'
+
+if __name__ == '__main__':
+  run()
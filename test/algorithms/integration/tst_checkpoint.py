@@ -0,0 +1,51 @@
+from __future__ import absolute_import, division
+
+def exercise_checkpoint_directory():
+  import os
+  import tempfile
+  import shutil
+  from dials.array_family import flex
+  from dials.algorithms.integration.processor import Result
+  from dials.algorithms.integration.checkpoint import CheckpointDirectory
+
+  directory = tempfile.mkdtemp()
+  try:
+    checkpoint = CheckpointDirectory(directory, 'key1')
+    assert checkpoint.completed() == []
+
+    # Save a couple of jobs
+    for index in [0, 2]:
+      reflections = flex.reflection_table()
+      reflections['id'] = flex.int([index] * 3)
+      reflections['intensity.sum.value'] = flex.double([1, 2, 3])
+      result = Result(index, reflections, data={'index' : index})
+      result.read_time = 1.0
+      checkpoint.save(result)
+
+    # Reopen with the same key and check they are reused
+    checkpoint = CheckpointDirectory(directory, 'key1')
+    assert checkpoint.completed() == [0, 2]
+    result = checkpoint.load(2)
+    assert result.index == 2
+    assert result.data == {'index' : 2}
+    assert result.read_time == 1.0
+    assert list(result.reflections['id']) == [2, 2, 2]
+    assert list(result.reflections['intensity.sum.value']) == [1, 2, 3]
+
+    # An incomplete job is ignored
+    os.remove(os.path.join(directory, 'job_000000.pickle'))
+    assert checkpoint.completed() == [2]
+
+    # Changing the key discards the checkpoints
+    checkpoint = CheckpointDirectory(directory, 'key2')
+    assert checkpoint.completed() == []
+    assert os.listdir(directory) == ['checkpoint.json']
+  finally:
+    shutil.rmtree(directory)
+
+def run():
+  exercise_checkpoint_directory()
+  print 'OK'
+
+if __name__ == '__main__':
+  run()
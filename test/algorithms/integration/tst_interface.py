@@ -7,6 +7,8 @@ def run(self):
     self.tst_split_blocks_1_frame()
     self.tst_split_blocks_non_overlapping()
     self.tst_split_blocks_overlapping()
+    self.tst_add_jobs()
+    self.tst_adaptive_job_frames()
 
   def tst_split_blocks_1_frame(self):
     from dials.array_family import flex
@@ -233,6 +235,76 @@ def tst_split_blocks_overlapping(self):
 
     print 'OK'
 
+  def tst_add_jobs(self):
+    from dials.algorithms.integration.integrator import JobList
+    from scitbx.array_family import shared
+
+    jobs = JobList()
+    jobs.add((0, 1), (0, 100), shared.tiny_int_2([
+      (0, 10),
+      (5, 40),
+      (30, 70),
+      (60, 100)]))
+    assert len(jobs) == 4
+    assert tuple(jobs[0].frames()) == (0, 10)
+    assert tuple(jobs[1].frames()) == (5, 40)
+    assert tuple(jobs[2].frames()) == (30, 70)
+    assert tuple(jobs[3].frames()) == (60, 100)
+    for i in range(len(jobs)):
+      assert tuple(jobs[i].expr()) == (0, 1)
+
+    # Jobs must cover the frames and overlap
+    jobs = JobList()
+    try:
+      jobs.add((0, 1), (0, 100), shared.tiny_int_2([(0, 10), (20, 100)]))
+      passed = False
+    except Exception:
+      passed = True
+    assert passed
+
+    print 'OK'
+
+  def tst_adaptive_job_frames(self):
+    from dials.algorithms.integration.processor import adaptive_job_frames
+
+    # Uniform blocks are unchanged without a budget or target
+    frames = adaptive_job_frames(
+      (0, 100), [1]*100, [1]*100, half_size=10)
+    assert frames == [(i, i+20) for i in range(0, 90, 10)]
+
+    # Cheap uniform blocks are merged up to the target cost
+    frames = adaptive_job_frames(
+      (0, 100), [1]*100, [1]*100, half_size=10, target=50)
+    assert all(f1 - f0 <= 50 for f0, f1 in frames)
+    assert frames[0][0] == 0 and frames[-1][1] == 100
+    assert len(frames) < 9
+
+    # Expensive frames are split into smaller blocks
+    cost = [1]*100
+    for i in range(40, 50):
+      cost[i] = 100
+    frames = adaptive_job_frames(
+      (0, 100), [1]*100, cost, half_size=25, min_half=2, target=100)
+    assert all(sum(cost[f0:f1]) <= 200 or f1 - f0 < 8 for f0, f1 in frames)
+    assert frames[0][0] == 0 and frames[-1][1] == 100
+    for (a0, a1), (b0, b1) in zip(frames[:-1], frames[1:]):
+      assert b0 > a0 and b0 < a1 and b1 > a1
+
+    # Blocks needing too much memory are split
+    memory = [10]*100
+    for i in range(60, 80):
+      memory[i] = 1000
+    frames = adaptive_job_frames(
+      (0, 100), memory, [1]*100, half_size=50, min_half=5, budget=500)
+    for f0, f1 in frames:
+      assert max(memory[f0:f1]) <= 500 or f1 - f0 < 20
+
+    # A single frame gives a single job
+    frames = adaptive_job_frames((0, 1), [1], [1], half_size=5)
+    assert frames == [(0, 1)]
+
+    print 'OK'
+
 
 class TestReflectionManager(object):
 
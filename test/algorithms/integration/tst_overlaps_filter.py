@@ -0,0 +1,91 @@
+from __future__ import absolute_import, division
+
+class Test(object):
+
+  def __init__(self):
+    from dxtbx.model import Detector
+    from dxtbx.model.experiment_list import ExperimentList, Experiment
+
+    # A detector with two panels
+    detector = Detector()
+    for i in range(2):
+      panel = detector.add_panel()
+      panel.set_image_size((100, 100))
+    self.experiments = ExperimentList()
+    self.experiments.append(Experiment(detector=detector))
+
+    # Pairs of reflections with overlapping foregrounds and overlapping
+    # foreground and background, and reflections at the same position on
+    # another panel, on another frame and off the edge of the panel
+    self.reflections = self.make_reflections([
+      (0, 10, 10, 0),
+      (0, 12, 12, 0),
+      (1, 10, 10, 0),
+      (0, 10, 10, 5),
+      (0, -5, -5, 0),
+      (0, 60, 60, 0),
+      (0, 66, 60, 0)])
+    self.expected_foreground_foreground = [
+      False, False, True, True, True, True, True]
+    self.expected_foreground_background = [
+      False, False, True, True, True, False, False]
+
+  def make_reflections(self, positions, size=10, foreground=(3, 7)):
+    from dials.array_family import flex
+    from dials.model.data import Shoebox
+    from dials.algorithms.shoebox import MaskCode
+    code_fgd = MaskCode.Foreground | MaskCode.Valid
+    code_bgd = MaskCode.Background | MaskCode.Valid
+    shoeboxes = flex.shoebox()
+    for panel, x0, y0, z0 in positions:
+      shoebox = Shoebox(panel, (x0, x0 + size, y0, y0 + size, z0, z0 + 1))
+      mask = flex.int(flex.grid(1, size, size), code_bgd)
+      for j in range(*foreground):
+        for i in range(*foreground):
+          mask[0, j, i] = code_fgd
+      shoebox.mask = mask
+      shoeboxes.append(shoebox)
+    reflections = flex.reflection_table()
+    reflections['id'] = flex.int(len(shoeboxes), 0)
+    reflections['shoebox'] = shoeboxes
+    return reflections
+
+  def run(self):
+    self.tst_foreground_foreground()
+    self.tst_foreground_background()
+    self.tst_remove_overlaps()
+
+  def tst_foreground_foreground(self):
+    from dials.algorithms.integration import \
+      foreground_foreground_overlaps_filter
+    keep = foreground_foreground_overlaps_filter(
+      self.experiments[0].detector, self.reflections['shoebox'])
+    assert list(keep) == self.expected_foreground_foreground
+    print 'OK'
+
+  def tst_foreground_background(self):
+    from dials.algorithms.integration import \
+      foreground_background_overlaps_filter
+    keep = foreground_background_overlaps_filter(
+      self.experiments[0].detector, self.reflections['shoebox'])
+    assert list(keep) == self.expected_foreground_background
+    print 'OK'
+
+  def tst_remove_overlaps(self):
+    from dials.array_family import flex
+    from dials.algorithms.integration.overlaps_filter import \
+      OverlapsFilterMultiExpt
+    reflections = self.reflections.copy()
+    reflections['index'] = flex.int(range(len(reflections)))
+    overlaps_filter = OverlapsFilterMultiExpt(reflections, self.experiments)
+    overlaps_filter.remove_foreground_foreground_overlaps()
+    overlaps_filter.remove_foreground_background_overlaps()
+    assert list(overlaps_filter.refl['index']) == [2, 3, 4]
+    print 'OK'
+
+
+if __name__ == '__main__':
+  from dials.test import cd_auto
+  with cd_auto(__file__):
+    test = Test()
+    test.run()
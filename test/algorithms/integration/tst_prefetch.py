@@ -0,0 +1,78 @@
+from __future__ import absolute_import, division
+
+class ImageSet(object):
+  '''
+  A minimal imageset returning an image and mask for each index.
+
+  '''
+
+  def __init__(self, n, fail=None):
+    self.n = n
+    self.fail = fail
+
+  def __len__(self):
+    return self.n
+
+  def get_corrected_data(self, index):
+    from scitbx.array_family import flex
+    if index == self.fail:
+      raise RuntimeError('Failed to read image %d' % index)
+    return (flex.double(10, index),)
+
+  def get_mask(self, index):
+    from scitbx.array_family import flex
+    return (flex.bool(10, index % 2 == 0),)
+
+def exercise_prefetch():
+  from scitbx.array_family import flex
+  from dials.algorithms.integration.prefetch import ImagePrefetcher
+
+  # Check the images are the same in order for each depth
+  lookup = (flex.bool(10, True),)
+  for depth in [0, 1, 3, 20]:
+    images = ImagePrefetcher(ImageSet(10), depth=depth, mask=lookup)
+    count = 0
+    for i, (image, mask) in enumerate(images):
+      assert len(image) == 1 and len(mask) == 1
+      assert image[0].all_eq(i)
+      assert mask[0].all_eq(i % 2 == 0)
+      count += 1
+    assert count == 10
+    assert images.read_time >= 0
+    assert images.wait_time >= 0
+    assert images._thread is None
+
+  # Check stopping early stops the thread
+  images = ImagePrefetcher(ImageSet(100), depth=2)
+  iterator = iter(images)
+  next(iterator)
+  iterator.close()
+  assert images._thread is None
+
+  print 'OK'
+
+def exercise_prefetch_error():
+  from dials.algorithms.integration.prefetch import ImagePrefetcher
+
+  # Check errors are raised in the consumer
+  for depth in [0, 2]:
+    images = ImagePrefetcher(ImageSet(10, fail=5), depth=depth)
+    count = 0
+    try:
+      for image, mask in images:
+        count += 1
+      passed = False
+    except RuntimeError:
+      passed = True
+    assert passed
+    assert count == 5
+    assert images._thread is None
+
+  print 'OK'
+
+def run():
+  exercise_prefetch()
+  exercise_prefetch_error()
+
+if __name__ == '__main__':
+  run()
@@ -0,0 +1,106 @@
+from __future__ import absolute_import, division
+
+class Test(object):
+
+  def __init__(self):
+    from dxtbx.model.experiment_list import ExperimentListFactory
+    from dials.algorithms.profile_model.gaussian_rs import Model
+    import libtbx.load_env
+    from dials.array_family import flex
+    from os.path import join
+    from math import pi
+    try:
+      dials_regression = libtbx.env.dist_path('dials_regression')
+    except KeyError, e:
+      print 'SKIP: dials_regression not configured'
+      exit(0)
+
+    path = join(dials_regression, "centroid_test_data", "experiments.json")
+
+    exlist = ExperimentListFactory.from_json_file(path)
+    exlist[0].profile = Model(
+      None,
+      n_sigma=3,
+      sigma_b=0.024*pi/180.0,
+      sigma_m=0.044*pi/180.0)
+
+    rlist = flex.reflection_table.from_predictions(exlist[0])
+    rlist['id'] = flex.int(len(rlist), 0)
+    rlist.compute_bbox(exlist)
+    self.rlist = rlist
+    self.exlist = exlist
+
+  def run(self):
+    self.tst_empty_result()
+    self.tst_merge_stream()
+
+  def make_processor(self, reflections, filename):
+    from dials.algorithms.integration.processor import Parameters
+    from dials.algorithms.integration.processor import Processor3D
+    params = Parameters()
+    params.block.size = 2
+    params.block.units = 'frames'
+    params.stream.filename = filename
+    return Processor3D(self.exlist, reflections, params)
+
+  def tst_empty_result(self):
+    import os
+    filename = 'tst_processor_stream_empty.refl'
+
+    # Every job returns no reflections so nothing is written to the stream
+    processor = self.make_processor(self.rlist[0:0], filename)
+    reflections, data, time_info = processor.process()
+    assert len(reflections) == 0
+    assert processor.manager.writer.nblocks == 0
+    os.remove(filename)
+    print 'OK'
+
+  def tst_merge_stream(self):
+    import os
+    from dials.array_family import flex
+    from dials.algorithms.integration.processor import NullTask
+    filename = 'tst_processor_stream.refl'
+    processor = self.make_processor(self.rlist.copy(), filename)
+    manager = processor.manager
+    manager.initialize()
+    assert len(manager) >= 3
+
+    # Return the reflections of each job with a value identifying the job.
+    # The second job returns no reflections and only the even jobs add an
+    # extra column.
+    for index in range(len(manager)):
+      reflections = manager.manager.split(index)
+      if index == 1:
+        reflections = reflections[0:0]
+      reflections['intensity.sum.value'] = flex.double(
+        len(reflections), index + 1)
+      if index % 2 == 0:
+        reflections['extra'] = flex.int(len(reflections), 7)
+      manager.accumulate(NullTask(index, reflections)())
+    manager.finalize()
+    assert manager.finished()
+
+    # The columns are merged into the rows of the jobs which returned them
+    reflections, data = manager.result()
+    assert 'extra' in reflections
+    for index in range(len(manager)):
+      rows = manager.manager.indices(index)
+      intensity = reflections['intensity.sum.value'].select(rows)
+      extra = reflections['extra'].select(rows)
+      if index == 1:
+        assert intensity.all_eq(0)
+      else:
+        assert intensity.all_eq(index + 1)
+      if index % 2 == 0:
+        assert extra.all_eq(7)
+      else:
+        assert extra.all_eq(0)
+    os.remove(filename)
+    print 'OK'
+
+
+if __name__ == '__main__':
+  from dials.test import cd_auto
+  with cd_auto(__file__):
+    test = Test()
+    test.run()
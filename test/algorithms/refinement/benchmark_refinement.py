@@ -0,0 +1,322 @@
+#!/usr/bin/env cctbx.python
+
+#
+#  Copyright (C) (2017) Diamond Light Source
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+#
+
+"""
+Benchmark refinement using synthetic experiments and reflections.
+
+The experimental models are built with the same PHIL driven helpers as the
+refinement tests. Reflections are predicted from the ideal geometry, resampled
+to the requested number of observations and jittered, then the crystal is
+misset before refinement. For each combination of detector, scan-static or
+scan-varying model and number of reflections the time taken for the separate
+stages of refinement is recorded:
+
+  setup             building the refiner, including the first prediction and
+                    outlier rejection
+  predict           one prediction of all observations
+  gradients         one calculation of the gradients for all matches
+  outlier_rejection one outlier rejection over all observations
+  build_up          one accumulation of the normal equations
+  solve             one solution of the normal equations
+  refine            the complete refinement run
+
+The results are written to a JSON file so that runs can be compared, e.g.:
+
+  dials.python benchmark_refinement.py nref=1000,100000 panels=1,64 \\
+    output=benchmark.json
+
+"""
+
+from __future__ import absolute_import, division
+import sys
+from time import time
+
+from libtbx.phil import parse
+from scitbx import matrix
+from dials.array_family import flex
+
+import dials.test.algorithms.refinement.setup_geometry as setup_geometry
+
+benchmark_phil_str = '''
+benchmark
+{
+  nref = 1000 10000 100000 1000000
+    .type = ints(value_min=1)
+    .help = "The numbers of reflections to benchmark"
+
+  panels = 1 64
+    .type = ints(value_min=1)
+    .help = "The numbers of panels of the detector. Each must be a square"
+            "number; the detector is split into an n x n array of panels"
+
+  scan_varying = False True
+    .type = strings
+    .help = "Whether to benchmark scan-static and/or scan-varying refinement"
+
+  d_min = 2.0
+    .type = float(value_min=0)
+    .help = "The resolution limit of the generated reflections"
+
+  max_iterations = 5
+    .type = int(value_min=1)
+    .help = "The number of refinement iterations, fixed so that runs can be"
+            "compared"
+
+  jacobian_chunk_size = 10000
+    .type = int(value_min=1)
+    .help = "Accumulate the normal equations in chunks of this many"
+            "reflections, so that large cases fit in memory"
+
+  repeats = 3
+    .type = int(value_min=1)
+    .help = "The number of times each stage is timed. The fastest is reported"
+
+  output = refinement_benchmark.json
+    .type = path
+}
+'''
+
+master_phil = parse('''
+include scope dials.test.algorithms.refinement.geometry_phil
+%s
+''' % benchmark_phil_str, process_includes=True)
+
+
+def make_multi_panel_detector(detector, n):
+  '''Split a single panel detector into an n x n array of coplanar panels
+  filling the same area'''
+
+  from dxtbx.model import Panel, Detector
+  reference = detector[0]
+  px_size = tuple(e / n for e in reference.get_pixel_size())
+  image_size = reference.get_image_size()
+  ref_panel_size = reference.get_image_size_mm()
+  fast = matrix.col(reference.get_fast_axis())
+  slow = matrix.col(reference.get_slow_axis())
+  multi_panel_detector = Detector()
+  for i in range(n):
+    for j in range(n):
+      origin = (matrix.col(reference.get_origin()) +
+                i * ref_panel_size[0] / n * fast +
+                j * ref_panel_size[1] / n * slow)
+      multi_panel_detector.add_panel(Panel(
+        type="PAD",
+        name="Panel%d" % (i * n + j),
+        fast_axis=fast,
+        slow_axis=slow,
+        origin=origin,
+        pixel_size=px_size,
+        image_size=image_size,
+        trusted_range=(0, 1.e6),
+        thickness=0.0,
+        material=""))
+  return multi_panel_detector
+
+
+def make_experiments(models, npanels):
+  '''Build an experiment list with a 180 degree scan from copies of the
+  models'''
+
+  from copy import deepcopy
+  from dxtbx.model import ScanFactory
+  from dxtbx.model.experiment_list import ExperimentList, Experiment
+  n = int(round(npanels ** 0.5))
+  assert n * n == npanels, "The number of panels must be a square number"
+  detector = deepcopy(models.detector)
+  if n > 1:
+    detector = make_multi_panel_detector(detector, n)
+  scan = ScanFactory().make_scan(image_range=(1, 1800),
+                                 exposure_times=0.1,
+                                 oscillation=(0, 0.1),
+                                 epochs=range(1800),
+                                 deg=True)
+  experiments = ExperimentList()
+  experiments.append(Experiment(
+    beam=deepcopy(models.beam), detector=detector,
+    goniometer=deepcopy(models.goniometer), scan=scan,
+    crystal=deepcopy(models.crystal), imageset=None))
+  return experiments
+
+
+def generate_reflections(experiments, nref, d_min):
+  '''Predict the reflections for the ideal geometry, then resample them to
+  nref observations with some random error in the observed positions'''
+
+  from dials.algorithms.spot_prediction import IndexGenerator
+  from dials.algorithms.spot_prediction import ray_intersection
+  from dials.algorithms.refinement.prediction import \
+    ScansRayPredictor, ExperimentsPredictor
+  from cctbx.sgtbx import space_group, space_group_symbols
+
+  experiment = experiments[0]
+  index_generator = IndexGenerator(experiment.crystal.get_unit_cell(),
+    space_group(space_group_symbols(1).hall()).type(), d_min)
+  indices = index_generator.to_array()
+  sweep_range = experiment.scan.get_oscillation_range(deg=False)
+  refs = ScansRayPredictor(experiments, sweep_range)(indices)
+  refs = refs.select(ray_intersection(experiment.detector, refs))
+  refs['id'] = flex.int(len(refs), 0)
+  refs = ExperimentsPredictor(experiments)(refs)
+
+  # resample to the requested number of observations
+  refs = refs.select(flex.random_size_t(nref, len(refs)))
+
+  # observed positions with errors of up to half a pixel and half an image
+  px_size = experiment.detector[0].get_pixel_size()
+  im_width = experiment.scan.get_oscillation(deg=False)[1]
+  sd = (px_size[0] / 2., px_size[1] / 2., im_width / 2.)
+  x, y, z = refs['xyzcal.mm'].parts()
+  x += (flex.random_double(nref) - 0.5) * 2 * sd[0]
+  y += (flex.random_double(nref) - 0.5) * 2 * sd[1]
+  z += (flex.random_double(nref) - 0.5) * 2 * sd[2]
+  refs['xyzobs.mm.value'] = flex.vec3_double(x, y, z)
+  refs['xyzobs.mm.variance'] = flex.vec3_double(
+    flex.double(nref, sd[0]**2),
+    flex.double(nref, sd[1]**2),
+    flex.double(nref, sd[2]**2))
+  return refs
+
+
+def misset_crystal(experiments, angle=0.1):
+  '''Rotate the crystal by a small angle (in degrees) about each axis'''
+
+  crystal = experiments[0].crystal
+  U = matrix.sqr(crystal.get_U())
+  for axis in ((1, 0, 0), (0, 1, 0), (0, 0, 1)):
+    R = matrix.col(axis).axis_and_angle_as_r3_rotation_matrix(angle, deg=True)
+    U = R * U
+  crystal.set_U(U)
+
+
+def best_time(func, repeats):
+  '''Call func repeatedly and return the shortest time taken'''
+
+  times = []
+  for i in range(repeats):
+    st = time()
+    func()
+    times.append(time() - st)
+  return min(times)
+
+
+def run_case(models, npanels, scan_varying, nref, params):
+  '''Benchmark refinement for one case and return a dictionary of results'''
+
+  from dials.algorithms.refinement.refiner import phil_scope, RefinerFactory
+  experiments = make_experiments(models, npanels)
+  reflections = generate_reflections(experiments, nref, params.d_min)
+  misset_crystal(experiments)
+
+  refine_params = phil_scope.fetch(source=parse('')).extract()
+  refine_params.refinement.parameterisation.scan_varying = scan_varying
+  if npanels > 1:
+    refine_params.refinement.parameterisation.detector.panels = 'multiple'
+  refine_params.refinement.refinery.engine = 'LevMar'
+  refine_params.refinement.refinery.max_iterations = params.max_iterations
+  refine_params.refinement.refinery.jacobian_chunk_size = \
+    params.jacobian_chunk_size
+
+  timings = {}
+  st = time()
+  refiner = RefinerFactory.from_parameters_data_experiments(
+    refine_params, reflections, experiments, verbosity=0)
+  timings['setup'] = time() - st
+
+  target = refiner._target
+  refinery = refiner._refinery
+  refman = refiner._refman
+  repeats = params.repeats
+
+  timings['predict'] = best_time(target.predict, repeats)
+  timings['gradients'] = best_time(
+    lambda: target.calculate_gradients(callback=lambda result: None), repeats)
+  outlier_detector = refman._outlier_detector
+  if outlier_detector is not None:
+    timings['outlier_rejection'] = best_time(
+      lambda: outlier_detector(refman.get_obs().copy()), repeats)
+  timings['build_up'] = best_time(refinery.build_up, repeats)
+
+  # the normal equations can only be solved once, so build them up again
+  # before each solution
+  solve_times = []
+  for i in range(repeats):
+    refinery.build_up()
+    st = time()
+    refinery.solve()
+    solve_times.append(time() - st)
+  timings['solve'] = min(solve_times)
+
+  # a fresh refiner for the complete run, so that it starts from the misset
+  # geometry
+  refiner = RefinerFactory.from_parameters_data_experiments(
+    refine_params, reflections, experiments, verbosity=0)
+  st = time()
+  history = refiner.run()
+  timings['refine'] = time() - st
+
+  return {
+    'panels' : npanels,
+    'scan_varying' : scan_varying,
+    'nref' : nref,
+    'nmatches' : refiner._target.get_num_matches(),
+    'nparam' : len(refiner._pred_param),
+    'nsteps' : history.get_nrows(),
+    'timings' : timings,
+  }
+
+
+def run(args):
+
+  import json
+  import platform
+  working_phil = master_phil.fetch(
+    sources=[master_phil.command_line_argument_interpreter().process(arg)
+             for arg in args])
+  params = working_phil.extract()
+  bparams = params.benchmark
+
+  models = setup_geometry.Extract(master_phil, cmdline_args=args)
+  flex.set_random_seed(params.geometry.parameters.random_seed)
+
+  scan_varying = []
+  for value in bparams.scan_varying:
+    assert value.lower() in ('true', 'false')
+    scan_varying.append(value.lower() == 'true')
+
+  stages = ['setup', 'predict', 'gradients', 'outlier_rejection', 'build_up',
+            'solve', 'refine']
+  print "%6s %5s %8s %6s" % ('panels', 'sv', 'nref', 'nparam'),
+  print " ".join("%10s" % s[:10] for s in stages)
+
+  results = []
+  for npanels in bparams.panels:
+    for sv in scan_varying:
+      for nref in bparams.nref:
+        result = run_case(models, npanels, sv, nref, bparams)
+        results.append(result)
+        print "%6d %5s %8d %6d" % (npanels, sv, nref, result['nparam']),
+        print " ".join("%10.3f" % result['timings'].get(s, float('nan'))
+                       for s in stages)
+        sys.stdout.flush()
+
+  output = {
+    'platform' : platform.platform(),
+    'python' : platform.python_version(),
+    'random_seed' : params.geometry.parameters.random_seed,
+    'max_iterations' : bparams.max_iterations,
+    'repeats' : bparams.repeats,
+    'results' : results,
+  }
+  with open(bparams.output, 'w') as outfile:
+    json.dump(output, outfile, indent=2, sort_keys=True)
+  print "Results written to %s" % bparams.output
+
+
+if __name__ == '__main__':
+  run(sys.argv[1:])
@@ -0,0 +1,118 @@
+from __future__ import absolute_import, division
+
+class Target(object):
+  '''
+  A target with a linear model of the residuals, so the residuals and
+  Jacobian for any block of matches can be calculated without prediction.
+
+  '''
+
+  def __init__(self, nref, nparam):
+    from scitbx.array_family import flex
+    flex.set_random_seed(0)
+    self.nref = nref
+    self.gradients = flex.random_double(nref * nparam)
+    self.gradients.reshape(flex.grid(nref, nparam))
+    self.obs = flex.random_double(nref)
+    self.weights = flex.random_double(nref) + 1
+    self.x = flex.double(nparam, 0)
+
+    # Every other observation is a match
+    self.used = flex.bool([i % 2 == 0 for i in range(nref)])
+
+  def get_matches_iselection(self):
+    return self.used.iselection()
+
+  def predict_for_matches(self, isel):
+    from scitbx.array_family import flex
+    assert self.used.select(isel).all_eq(True)
+    calc = flex.double([
+      sum(self.gradients[i, j] * self.x[j] for j in range(len(self.x)))
+      for i in isel])
+    return isel, calc - self.obs.select(isel)
+
+  def compute_residuals_and_gradients(self, block):
+    from scitbx.array_family import flex
+    isel, residuals = block
+    nparam = len(self.x)
+    jacobian = flex.double(flex.grid(len(isel), nparam))
+    for k, i in enumerate(isel):
+      for j in range(nparam):
+        jacobian[k, j] = self.gradients[i, j]
+    return residuals, jacobian, self.weights.select(isel)
+
+class Refinery(object):
+
+  def __init__(self, target):
+    self._target = target
+    self.x = None
+
+  def set_parameter_values(self):
+    self._target.x = self.x
+
+def exercise_map():
+  from scitbx.array_family import flex
+  from dials.algorithms.refinement.engine import BuildUpWorkerPool
+  target = Target(1000, 4)
+  refinery = Refinery(target)
+  pool = BuildUpWorkerPool(refinery, 3)
+  try:
+    for step in range(3):
+      x = flex.double([step + 1, -1, 0.5, step])
+      target.x = x
+      matches = target.predict_for_matches(target.get_matches_iselection())
+      isel = matches[0]
+
+      # The blocks are consecutive slices of the matches
+      blocks = [isel[start:min(start + 90, len(isel))]
+                for start in range(0, len(isel), 90)]
+      expected = [target.compute_residuals_and_gradients(
+        target.predict_for_matches(block)) for block in blocks]
+      results = []
+      def callback(residuals, jacobian, weights):
+        results.append((residuals, jacobian, weights))
+      pool.map(x, blocks, callback)
+      assert len(results) == len(expected)
+      for result, reference in zip(results, expected):
+        for a, b in zip(result, reference):
+          assert a.all() == b.all()
+          assert list(a) == list(b)
+  finally:
+    pool.close()
+  print 'OK'
+
+def exercise_dump_and_load():
+  import os
+  from scitbx import sparse
+  from scitbx.array_family import flex
+  from dials.algorithms.refinement.engine import BuildUpWorkerPool
+  residuals = flex.random_double(10)
+  weights = flex.random_double(10)
+
+  # A dense Jacobian is written as a raw buffer and keeps its shape
+  jacobian = flex.random_double(30)
+  jacobian.reshape(flex.grid(10, 3))
+  filename, header = BuildUpWorkerPool._dump((residuals, jacobian, weights))
+  assert [h[1] for h in header] == ['raw'] * 3
+  result = BuildUpWorkerPool._load(filename, header)
+  assert not os.path.exists(filename)
+  assert list(result[0]) == list(residuals)
+  assert result[1].all() == (10, 3)
+  assert list(result[1]) == list(jacobian)
+  assert list(result[2]) == list(weights)
+
+  # A sparse Jacobian is also supported
+  jacobian = sparse.matrix(10, 3)
+  jacobian[2, 1] = 5
+  filename, header = BuildUpWorkerPool._dump((residuals, jacobian, weights))
+  result = BuildUpWorkerPool._load(filename, header)
+  assert result[1].n_rows == 10 and result[1].n_cols == 3
+  assert list(result[1].as_dense_matrix()) == list(jacobian.as_dense_matrix())
+  print 'OK'
+
+def run():
+  exercise_dump_and_load()
+  exercise_map()
+
+if __name__ == '__main__':
+  run()
@@ -0,0 +1,86 @@
+#!/usr/bin/env cctbx.python
+
+#
+#  Copyright (C) (2017) Diamond Light Source
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+#
+
+"""
+Test that centroid outlier rejection jobs give the same result whether they
+are run serially or in parallel.
+
+"""
+
+from __future__ import absolute_import, division
+from dials.array_family import flex
+
+def make_reflections(nexp=3, npanel=2, nref=400, nout=10):
+  """Make a reflection table with normally distributed residuals for each
+  experiment and panel, plus some gross outliers. Return the table and the
+  indices of the outliers"""
+
+  import scitbx.random
+  from scitbx.random import variate, normal_distribution
+  scitbx.random.set_random_seed(42)
+  g = variate(normal_distribution(0, 1))
+  reflections = flex.reflection_table()
+  expt_id = flex.int()
+  panel = flex.size_t()
+  for i in range(nexp):
+    for j in range(npanel):
+      expt_id.extend(flex.int(nref, i))
+      panel.extend(flex.size_t(nref, j))
+  n = len(expt_id)
+  reflections['id'] = expt_id
+  reflections['panel'] = panel
+  reflections['x_resid'] = g(n)
+  reflections['y_resid'] = g(n)
+  reflections['phi_resid'] = g(n) * 0.01
+  reflections['xyzobs.mm.value'] = flex.vec3_double(n, (0, 0, 0))
+  reflections.set_flags(flex.bool(n, True),
+    reflections.flags.used_in_refinement)
+
+  # gross outliers spread across the jobs
+  outliers = flex.size_t(range(0, n, n // nout))
+  reflections['x_resid'].set_selected(outliers, 100.0)
+  return reflections, outliers
+
+def run():
+
+  from dials.algorithms.refinement.outlier_detection.mcd import MCD
+  reflections, outliers = make_reflections()
+
+  flags = []
+  after = []
+  for nproc in (1, 2):
+    refs = reflections.copy()
+    mcd = MCD(n_trials=50)
+    mcd.set_nproc(nproc)
+    flex.set_random_seed(0)
+    assert mcd(refs)
+    flags.append(refs.get_flags(refs.flags.centroid_outlier))
+    after.append(flex.random_double())
+
+  # the same outliers are found, including all the gross outliers
+  assert (flags[0] == flags[1]).all_eq(True)
+  assert flags[0].select(outliers).all_eq(True)
+
+  # the random number generator is left in the same state
+  assert after[0] == after[1]
+
+  # methods which do not use random numbers leave the generator untouched
+  from dials.algorithms.refinement.outlier_detection.tukey import Tukey
+  for nproc in (1, 2):
+    tukey = Tukey()
+    tukey.set_nproc(nproc)
+    flex.set_random_seed(0)
+    expected = flex.random_double()
+    flex.set_random_seed(0)
+    tukey(reflections.copy())
+    assert flex.random_double() == expected
+  print "OK"
+
+if __name__ == '__main__':
+  run()
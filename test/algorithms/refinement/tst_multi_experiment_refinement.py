@@ -265,6 +265,17 @@
 history = refiner.run()
 print "OK"
 
+# scan static again, accumulating the normal equations in small chunks
+params.refinement.refinery.jacobian_chunk_size=100
+refiner = RefinerFactory.from_parameters_data_experiments(params, obs_refs,
+  experiments, verbosity=0)
+history_chunked = refiner.run()
+assert history_chunked.get_nrows() == history.get_nrows()
+for rmsd, rmsd_chunked in zip(history["rmsd"], history_chunked["rmsd"]):
+  assert approx_equal(rmsd, rmsd_chunked)
+params.refinement.refinery.jacobian_chunk_size=None
+print "OK"
+
 # scan varying
 params.refinement.parameterisation.scan_varying=True
 refiner = RefinerFactory.from_parameters_data_experiments(params, obs_refs,
@@ -272,6 +283,16 @@
 history = refiner.run()
 print "OK"
 
+# scan varying again, calculating the Jacobian in worker processes
+params.refinement.mp.nproc=2
+refiner = RefinerFactory.from_parameters_data_experiments(params, obs_refs,
+  experiments, verbosity=0)
+history_mp = refiner.run()
+assert history_mp.get_nrows() == history.get_nrows()
+for rmsd, rmsd_mp in zip(history["rmsd"], history_mp["rmsd"]):
+  assert approx_equal(rmsd, rmsd_mp)
+print "OK"
+
 #plt = refiner.parameter_correlation_plot(len(history["parameter_correlation"])-1)
 #plt.show()
 
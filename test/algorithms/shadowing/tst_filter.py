@@ -0,0 +1,166 @@
+from __future__ import absolute_import, division
+
+class ShadowMasker(object):
+  '''
+  A shadow which covers part of the first panel, depending on the scan angle,
+  and none of the second panel.
+
+  '''
+
+  def __init__(self):
+    self.calls = 0
+
+  def project_extrema(self, detector, angle):
+    from math import sin, radians
+    from scitbx.array_family import flex
+    self.calls += 1
+    x1 = 50 + 40 * sin(radians(angle))
+    return [
+      flex.vec2_double([(0, 0), (x1, 0), (x1, 100), (0, 100)]),
+      flex.vec2_double()]
+
+class ImageSet(object):
+  '''
+  An imageset whose format provides the shadow masker.
+
+  '''
+
+  def __init__(self, masker):
+    self.masker = masker
+
+  def reader(self):
+    return self
+
+  def get_format(self):
+    return self
+
+  def get_goniometer_shadow_masker(self, goniometer=None):
+    return self.masker
+
+class Experiment(object):
+
+  def __init__(self, scan):
+    from dxtbx.model import Detector
+    self.masker = ShadowMasker()
+    self.imageset = ImageSet(self.masker)
+    self.detector = Detector()
+    for i in range(2):
+      panel = self.detector.add_panel()
+      panel.set_image_size((100, 100))
+    self.goniometer = None
+    self.scan = scan
+
+def make_experiments():
+  from dxtbx.model import ScanFactory
+
+  # Two sweeps of more than 360 degrees starting at different angles
+  experiments = []
+  for phi0 in [0, 32]:
+    scan = ScanFactory.make_scan(
+      image_range=(1, 100),
+      exposure_times=0.1,
+      oscillation=(phi0, 5),
+      epochs=list(range(100)),
+      deg=True)
+    experiments.append(Experiment(scan))
+  return experiments
+
+def make_reflections():
+  import random
+  from dials.array_family import flex
+  random.seed(0)
+  reflections = flex.reflection_table()
+  ids = flex.int()
+  panels = flex.size_t()
+  xyzcal = flex.vec3_double()
+  for i in range(2000):
+    ids.append(random.randint(0, 1))
+    panels.append(random.randint(0, 1))
+
+    # Include reflections off either end of the scan
+    xyzcal.append((
+      random.uniform(0, 100),
+      random.uniform(0, 100),
+      random.uniform(-5, 105)))
+  reflections['id'] = ids
+  reflections['panel'] = panels
+  reflections['xyzcal.px'] = xyzcal
+  return reflections
+
+def reference_filter(experiments, reflections, angle_bin_width=None):
+  '''
+  Test each image of each experiment in turn, projecting the shadow at the
+  centre of the angle bin if a bin width is given.
+
+  '''
+  from math import floor
+  from dials.util import is_inside_polygon
+  from scitbx.array_family import flex
+  shadowed = flex.bool(reflections.size(), False)
+  for expt_id, expt in enumerate(experiments):
+    masker = ShadowMasker()
+    isel = (reflections['id'] == expt_id).iselection()
+    x, y, z = reflections['xyzcal.px'].select(isel).parts()
+    panel = reflections['panel'].select(isel)
+    start, end = expt.scan.get_array_range()
+    for i in range(start, end):
+      angle = expt.scan.get_angle_from_array_index(i)
+      if angle_bin_width is not None:
+        angle = (floor((angle % 360) / angle_bin_width) + 0.5) * angle_bin_width
+      shadow = masker.project_extrema(expt.detector, angle)
+      for p_id in range(len(expt.detector)):
+        if shadow[p_id].size() < 4:
+          continue
+        sel = (z >= i) & (z < (i+1)) & (panel == p_id)
+        inside = is_inside_polygon(
+          shadow[p_id],
+          flex.vec2_double(x.select(sel), y.select(sel)))
+        shadowed.set_selected(isel.select(sel), inside)
+  return shadowed
+
+def exercise_filter_shadowed_reflections():
+  from dials.algorithms.shadowing.filter import filter_shadowed_reflections
+  reflections = make_reflections()
+  for angle_bin_width in [None, 20]:
+    expected = reference_filter(
+      make_experiments(), reflections, angle_bin_width)
+    assert expected.count(True) > 0 and expected.count(False) > 0
+    for nproc in [1, 3]:
+      experiments = make_experiments()
+      shadowed = filter_shadowed_reflections(
+        experiments, reflections,
+        experiment_goniometer=True,
+        angle_bin_width=angle_bin_width,
+        nproc=nproc)
+      assert list(shadowed) == list(expected)
+
+      # The shadow is projected once for each angle modulo 360 or each bin
+      if nproc == 1:
+        for expt in experiments:
+          if angle_bin_width is None:
+            assert 0 < expt.masker.calls <= 72
+          else:
+            assert 0 < expt.masker.calls <= 18
+  print 'OK'
+
+def exercise_shadow_polygon_cache():
+  from dials.algorithms.shadowing.filter import ShadowPolygonCache
+  masker = ShadowMasker()
+  cache = ShadowPolygonCache(masker, None)
+  assert cache(10) is cache(370)
+  assert cache(10) is cache(-350)
+  assert cache(10) is not cache(15)
+  assert masker.calls == 2
+  masker = ShadowMasker()
+  cache = ShadowPolygonCache(masker, None, bin_width=10)
+  assert cache(1) is cache(9) is cache(361)
+  assert cache(1) is not cache(11)
+  assert masker.calls == 2
+  print 'OK'
+
+def run():
+  exercise_shadow_polygon_cache()
+  exercise_filter_shadowed_reflections()
+
+if __name__ == '__main__':
+  run()
@@ -50,6 +50,23 @@ def test_maha():
   print "OK"
   return
 
+def test_cov():
+
+  from scitbx.array_family import flex
+  from dials.algorithms.statistics.fast_mcd import cov, sample_covariance
+
+  # the covariance matrix must be identical to that formed from the sample
+  # covariance of each pair of vectors
+  flex.set_random_seed(42)
+  cols = [flex.random_double(1000) for i in range(3)]
+  cols[1] += cols[0]
+  covmat = cov(*cols)
+  for i in range(3):
+    for j in range(3):
+      assert covmat[i,j] == sample_covariance(cols[i], cols[j])
+  print "OK"
+  return
+
 def test_fast_mcd_small():
 
   from scitbx.array_family import flex
@@ -234,5 +251,6 @@ def test_fast_mcd_large():
 
 if __name__ == "__main__":
   test_maha()
+  test_cov()
   test_fast_mcd_small()
   test_fast_mcd_large()
@@ -22,6 +22,8 @@ def run(self):
     self.tst_select()
     self.tst_set_selected()
     self.tst_serialize()
+    self.tst_columnar()
+    self.tst_columnar_chunked()
     self.tst_delete()
     self.tst_del_selected()
     self.tst_sort()
@@ -33,6 +35,8 @@ def run(self):
     self.tst_split_partials()
     self.tst_split_partials_with_shoebox()
     self.tst_find_overlapping()
+    self.tst_compute_shoebox_overlap_fraction()
+    self.tst_match_with_reference()
 
   def tst_init(self):
     from dials.array_family import flex
@@ -682,6 +686,32 @@ def tst_sort(self):
     table.sort("c", order=(1,2,0))
     assert list(table['c']) == [(1, 1, 1), (2, 1, 1), (3, 1, 1), (3, 2, 1), (2, 4, 2)]
 
+    table.sort("c", reverse=True)
+    assert list(table['c']) == [(3,2,1),(3,1,1),(2,4,2),(2,1,1),(1,1,1)]
+
+    table['d'] = flex.int([1, 0, 1, 0, 1])
+    table['e'] = flex.vec3_double([(0,0,5), (0,0,4), (0,0,3), (0,0,2), (0,0,1)])
+    table.sort(["d", "e"], order=[None, [2]])
+    assert list(table['d']) == [0, 0, 1, 1, 1]
+    assert list(table['e'].parts()[2]) == [2, 4, 1, 3, 5]
+
+    table.sort(["d", "c"])
+    assert list(table['c']) == [(2,1,1),(3,1,1),(1,1,1),(2,4,2),(3,2,1)]
+
+    table['f'] = flex.int6([(2,0,0,0,0,0), (1,0,0,0,0,1), (1,0,0,0,0,0),
+                            (3,0,0,0,0,0), (0,0,0,0,0,0)])
+    table.sort("f")
+    assert list(table['f'].parts()[0]) == [0, 1, 1, 2, 3]
+    assert list(table['f'].parts()[5]) == [0, 0, 1, 0, 0]
+
+    table['g'] = flex.mat3_double([(i,0,0,0,0,0,0,0,j) for i, j in
+                                   [(1,2), (1,1), (0,3), (2,0), (0,4)]])
+    table.sort("g", order=[8])
+    assert [m[8] for m in table['g']] == [0, 1, 2, 3, 4]
+    table.sort("g")
+    assert [(m[0], m[8]) for m in table['g']] == [
+      (0,3), (0,4), (1,1), (1,2), (2,0)]
+
     print "OK"
 
   def tst_flags(self):
@@ -773,6 +803,120 @@ def tst_serialize(self):
     assert(all(a == b for a, b in zip(new_table['col3'], c3)))
     print 'OK'
 
+  def tst_columnar(self):
+
+    from dials.array_family import flex
+    from dials.array_family import columnar
+    from os.path import exists
+    import os
+
+    # Create a table with columns of each of the raw types and a shoebox
+    table = flex.reflection_table()
+    table['a'] = flex.int([1, -2, 3])
+    table['b'] = flex.double([1.5, 2.5, -3.5])
+    table['c'] = flex.size_t([10, 20, 30])
+    table['d'] = flex.bool([True, False, True])
+    table['e'] = flex.vec3_double([(1, 2, 3), (4, 5, 6), (7, 8, 9)])
+    table['f'] = flex.miller_index([(1, -2, 3), (0, 0, 1), (-5, 4, 2)])
+    table['g'] = flex.int6([(0, 1, 2, 3, 4, 5), (1, 2, 3, 4, 5, 6), (2, 3, 4, 5, 6, 7)])
+    table['h'] = flex.std_string(['x', 'y', 'z'])
+    table['i'] = flex.shoebox(flex.size_t(3, 0), flex.int6(3, (0, 2, 0, 2, 0, 1)))
+    table['i'].allocate()
+
+    filename = 'tst_columnar.refl'
+    table.as_columnar(filename)
+    assert exists(filename)
+    assert columnar.is_columnar_file(filename)
+
+    # Read everything back
+    new_table = flex.reflection_table.from_file(filename)
+    assert new_table.is_consistent()
+    assert new_table.nrows() == 3
+    assert new_table.ncols() == table.ncols()
+    for key in table.keys():
+      if key == 'i':
+        assert list(new_table[key].bounding_boxes()) == list(table[key].bounding_boxes())
+      else:
+        assert list(new_table[key]) == list(table[key])
+
+    # Read a subset of columns
+    new_table = flex.reflection_table.from_file(filename, columns=['f', 'e'])
+    assert sorted(new_table.keys()) == ['e', 'f']
+    assert list(new_table['f']) == list(table['f'])
+
+    # The pickle reader also accepts the columnar file
+    new_table = flex.reflection_table.from_pickle(filename)
+    assert new_table.ncols() == table.ncols()
+    os.remove(filename)
+    print 'OK'
+
+  def tst_columnar_chunked(self):
+
+    from dials.array_family import flex
+    from dials.array_family import columnar
+    import os
+
+    # Write three blocks with an index into the full table
+    filename = 'tst_columnar_chunked.refl'
+    writer = columnar.ChunkedWriter(filename)
+    for i in range(3):
+      table = flex.reflection_table()
+      table['a'] = flex.int([i, i])
+      table['b'] = flex.vec3_double([(i, 0, 0), (0, i, 0)])
+      writer.append(table, flex.size_t([i, i + 3]))
+
+      # The file is readable after every block
+      with columnar.Reader(filename) as reader:
+        assert reader.nblocks == i + 1
+        assert reader.nrows == 2 * (i + 1)
+    size = writer._outfile.tell()
+    writer.close()
+
+    with columnar.Reader(filename) as reader:
+      assert list(reader.index()) == [0, 3, 1, 4, 2, 5]
+      assert list(reader.column('a')) == [0, 0, 1, 1, 2, 2]
+
+    # Merge the blocks back into a table
+    table = flex.reflection_table(6)
+    with columnar.Reader(filename) as reader:
+      table.set_selected(reader.index(), reader.read(['a']))
+    assert list(table['a']) == [0, 1, 2, 0, 1, 2]
+
+    # Truncate the last block, the first two blocks are still readable
+    with open(filename, 'r+b') as outfile:
+      outfile.truncate(size - 10)
+    with columnar.Reader(filename) as reader:
+      assert reader.nblocks == 2
+      assert list(reader.column('a')) == [0, 0, 1, 1]
+
+    # A file with no blocks is empty
+    writer = columnar.ChunkedWriter(filename)
+    writer.close()
+    with columnar.Reader(filename) as reader:
+      assert reader.nblocks == 0
+      assert reader.nrows == 0
+      assert reader.keys() == []
+      assert len(reader.index()) == 0
+
+    # Columns which only appear in later blocks are listed and read with
+    # default values for the other blocks
+    writer = columnar.ChunkedWriter(filename)
+    for i in range(3):
+      table = flex.reflection_table()
+      table['a'] = flex.int([i, i])
+      if i > 0:
+        table['c'] = flex.double([i, i])
+      writer.append(table, flex.size_t([i, i + 3]))
+    writer.close()
+    with columnar.Reader(filename) as reader:
+      assert reader.keys() == ['a', 'c']
+      assert sorted(reader.types().keys()) == ['a', 'c']
+      assert reader.block_keys(0) == ['a']
+      assert list(reader.column('c')) == [0, 0, 1, 1, 2, 2]
+      assert list(reader.read()['a']) == [0, 0, 1, 1, 2, 2]
+    os.remove(filename)
+    print 'OK'
+
   def tst_copy(self):
     import copy
     from dials.array_family import flex
@@ -1125,6 +1269,80 @@ def is_overlap(b0, b1, border):
 
     print 'OK'
 
+  def tst_compute_shoebox_overlap_fraction(self):
+    from dials.array_family import flex
+    from random import randint
+    N = 500
+    r = flex.reflection_table(N)
+    r['bbox'] = flex.int6(N)
+    r['panel'] = flex.size_t(N)
+    r['id'] = flex.int(N)
+    r['imageset_id'] = flex.int(N)
+    for i in range(N):
+      x0 = randint(0, 50)
+      y0 = randint(0, 50)
+      z0 = randint(0, 50)
+      r['bbox'][i] = (x0, x0 + randint(1, 10), y0, y0 + randint(1, 10),
+                      z0, z0 + randint(1, 10))
+    overlaps = r.find_overlaps()
+
+    # Compare with the fraction of pixels covered by the adjacent shoeboxes
+    fraction = r.compute_shoebox_overlap_fraction(overlaps)
+    for i in range(N):
+      b1 = r['bbox'][i]
+      covered = set()
+      for j in overlaps.adjacent_vertices(i):
+        b2 = r['bbox'][j]
+        for z in range(max(b1[4], b2[4]), min(b1[5], b2[5])):
+          for y in range(max(b1[2], b2[2]), min(b1[3], b2[3])):
+            for x in range(max(b1[0], b2[0]), min(b1[1], b2[1])):
+              covered.add((x, y, z))
+      volume = (b1[1] - b1[0]) * (b1[3] - b1[2]) * (b1[5] - b1[4])
+      assert abs(fraction[i] - len(covered) / volume) < 1e-7
+
+    # The result is the same when split between processes
+    fraction2 = r.compute_shoebox_overlap_fraction(overlaps, nproc=2)
+    assert list(fraction2) == list(fraction)
+    print 'OK'
+
+  def tst_match_with_reference(self):
+    from dials.array_family import flex
+
+    predicted = flex.reflection_table()
+    predicted['miller_index'] = flex.miller_index([
+      (1,0,0), (1,0,0), (2,0,0), (3,0,0), (4,0,0), (4,0,0)])
+    predicted['entering'] = flex.bool([True, True, True, True, False, False])
+    predicted['id'] = flex.int([0, 0, 0, 0, 0, 1])
+    predicted['panel'] = flex.size_t([0, 0, 0, 0, 0, 0])
+    predicted['xyzcal.px'] = flex.vec3_double([
+      (10,10,1), (50,50,1), (20,20,2), (30,30,3), (40,40,4), (40,40,4)])
+    predicted['flags'] = flex.size_t(6, 0)
+
+    reference = flex.reflection_table()
+    reference['miller_index'] = flex.miller_index([
+      (1,0,0), (2,0,0), (3,0,0), (4,0,0), (5,0,0)])
+    reference['entering'] = flex.bool([True, True, True, True, True])
+    reference['id'] = flex.int([0, 0, 0, 1, 0])
+    reference['panel'] = flex.size_t([0, 0, 0, 0, 0])
+    reference['xyzcal.px'] = flex.vec3_double([
+      (50.5,50,1), (20,20,2.5), (35,30,3), (40,40,4), (0,0,0)])
+    reference['flags'] = flex.size_t(5, 0)
+    reference.set_flags(flex.bool(5, True), reference.flags.strong)
+
+    # The second of the two (1,0,0) predictions is nearest the reference
+    sind, oind = predicted.match_with_reference_indices(reference)
+    assert list(sind) == [1, 2, 3]
+    assert list(oind) == [0, 1, 2]
+
+    # The (3,0,0) match is too far away to be accepted
+    mask, matched, unmatched = predicted.match_with_reference(reference)
+    assert list(mask) == [False, True, True, False, False, False]
+    assert len(matched) == 2
+    assert len(unmatched) == 3
+    assert predicted.get_flags(predicted.flags.reference_spot).count(True) == 2
+    assert predicted.get_flags(predicted.flags.strong).count(True) == 3
+    print 'OK'
+
 
 if __name__ == '__main__':
   from dials.test import cd_auto
@@ -39,6 +39,7 @@ def start_server(server_command):
 
   try:
     exercise_client(port=port)
+    exercise_client_batch(port=port)
 
   finally:
     client_stop_command = "dials.find_spots_client port=%i stop" %port
@@ -130,6 +131,31 @@ def exercise_client(port):
                   for node in xmldoc.getElementsByTagName('d_min')])
   assert d_min == sorted([1.47, 1.55, 1.59, 1.61, 1.61, 1.61, 1.61, 1.62, 1.64]), d_min
 
+def exercise_client_batch(port):
+  data_dir = os.path.join(dials_regression, "centroid_test_data")
+  client_command = " ".join(
+    ["dials.find_spots_client",
+     "port=%i" %port,
+     "min_spot_size=3",
+     "template=%s" %os.path.join(data_dir, "centroid_####.cbf"),
+     "image_range=1,9"]
+  )
+  print client_command
+  result = easy_run.fully_buffered(command=client_command).raise_if_errors()
+  out = "<document>%s</document>" %"\n".join(result.stdout_lines)
+
+  from xml.dom import minidom
+  xmldoc = minidom.parseString(out)
+  images = xmldoc.getElementsByTagName('image')
+  assert len(images) == 9
+  spot_counts = sorted([int(node.childNodes[0].data)
+                 for node in xmldoc.getElementsByTagName('spot_count')])
+  assert spot_counts == sorted([203, 196, 205, 209, 195, 205, 203, 207, 189]), spot_counts
+
+  client_command = "dials.find_spots_client port=%i stats" %port
+  result = easy_run.fully_buffered(command=client_command).raise_if_errors()
+  assert 'completed: ' in "\n".join(result.stdout_lines)
+
 
 if __name__ == '__main__':
   from dials.test import cd_auto
@@ -72,3 +72,124 @@ def test_calculate_batch_ranges(self):
       assert all([x > 0 for x in self._run_ranges_to_set([(0,0)])]), "Should be no zeroth/negative batch"
       assert not has_consecutive_ranges(self._run_ranges(data))
 
+
+def _partial_reflections(profiles=True):
+  """Create a table of reflections, some split into several partial parts"""
+  from dials.array_family import flex
+  import random
+  random.seed(0)
+  table = flex.reflection_table()
+  partial_id = flex.size_t()
+  partiality = flex.double()
+  for p_id in range(200):
+    nparts = random.choice([1, 1, 2, 3, 5])
+    for k in range(nparts):
+      partial_id.append(p_id)
+      if nparts == 1:
+        partiality.append(random.choice([1.0, random.uniform(0.1, 0.99)]))
+      else:
+        partiality.append(random.uniform(0.05, 0.5))
+  # Shuffle so that the parts of each reflection are not adjacent
+  perm = list(range(len(partial_id)))
+  random.shuffle(perm)
+  perm = flex.size_t(perm)
+  n = len(perm)
+  table['partial_id'] = partial_id.select(perm)
+  table['partiality'] = partiality.select(perm)
+  table['intensity.sum.value'] = flex.double(
+    [random.uniform(10, 1000) for i in range(n)])
+  table['intensity.sum.variance'] = flex.double(
+    [random.uniform(10, 100) for i in range(n)])
+  if profiles:
+    table['intensity.prf.value'] = flex.double(
+      [random.uniform(10, 1000) for i in range(n)])
+    table['intensity.prf.variance'] = flex.double(
+      [random.uniform(10, 100) for i in range(n)])
+  return table
+
+def _sum_partial_reflections_reference(data, min_total_partiality=0.5):
+  """Sum the partial reflections one reflection at a time"""
+  from collections import defaultdict
+  from dials.array_family import flex
+  isel = (data['partiality'] < 0.99).iselection()
+  partial_map = defaultdict(list)
+  for j in isel:
+    partial_map[data['partial_id'][j]].append(j)
+  profiles = 'intensity.prf.value' in data
+  delete = flex.size_t()
+  for p_id, parts in partial_map.items():
+    if len(parts) < 2:
+      continue
+    p_tot = sum([data['partiality'][j] for j in parts])
+    if p_tot < min_total_partiality:
+      delete.extend(flex.size_t(parts))
+      continue
+    j0 = parts[0]
+    if profiles:
+      v = data['intensity.prf.value'][j0]
+      var = data['intensity.prf.variance'][j0]
+      w = v * v / var
+      v *= w
+      var *= w
+      tw = w
+    s = data['intensity.sum.value'][j0]
+    svar = data['intensity.sum.variance'][j0]
+    p = data['partiality'][j0]
+    for j in parts[1:]:
+      delete.append(j)
+      s += data['intensity.sum.value'][j]
+      svar += data['intensity.sum.variance'][j]
+      p += data['partiality'][j]
+      if profiles:
+        _v = data['intensity.prf.value'][j]
+        _var = data['intensity.prf.variance'][j]
+        _w = _v * _v / _var
+        v += _w * _v
+        var += _w * _var
+        tw += _w
+    if profiles:
+      data['intensity.prf.value'][j0] = v / tw
+      data['intensity.prf.variance'][j0] = var / tw
+    data['intensity.sum.value'][j0] = s
+    data['intensity.sum.variance'][j0] = svar
+    data['partiality'][j0] = p
+  data.del_selected(delete)
+  return data
+
+@pytest.mark.parametrize("profiles", [True, False])
+def test_sum_partial_reflections(profiles):
+  expected = _sum_partial_reflections_reference(_partial_reflections(profiles))
+  result = export_mtz.sum_partial_reflections(_partial_reflections(profiles))
+  assert len(result) == len(expected)
+  assert list(result['partial_id']) == list(expected['partial_id'])
+  for key in expected.keys():
+    assert list(result[key]) == list(expected[key]), key
+
+  # Check that the summed partials are actually combined
+  assert len(result) < len(_partial_reflections(profiles))
+  assert len(set(result['partial_id'])) == len(result)
+
+def test_scale_partial_reflections():
+  table = export_mtz.sum_partial_reflections(_partial_reflections())
+  partiality = table['partiality']
+  value = table['intensity.sum.value']
+  variance = table['intensity.sum.variance']
+  keep = (partiality >= 0.5)
+  expected_value = [
+    v / p if p < 1.0 else v for v, p, k in zip(value, partiality, keep) if k]
+  expected_variance = [
+    v / p if p < 1.0 else v for v, p, k in zip(variance, partiality, keep) if k]
+  nkeep = keep.count(True)
+  result = export_mtz.scale_partial_reflections(table)
+  assert len(result) == nkeep
+  for a, b in zip(result['intensity.sum.value'], expected_value):
+    assert a == pytest.approx(b)
+  for a, b in zip(result['intensity.sum.variance'], expected_variance):
+    assert a == pytest.approx(b)
+
+def test_experiment_row_ranges():
+  from dials.array_family import flex
+  ranges = export_mtz._experiment_row_ranges(flex.int([0, 0, 0, 2, 2, 3]), 5)
+  assert ranges == [(0, 3), (0, 0), (3, 5), (5, 6), (0, 0)]
+  assert export_mtz._experiment_row_ranges(flex.int(), 2) == [(0, 0), (0, 0)]
+  assert export_mtz._experiment_row_ranges(flex.int([1]), 2) == [(0, 0), (0, 1)]
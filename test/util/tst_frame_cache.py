@@ -0,0 +1,179 @@
+from __future__ import absolute_import, division
+
+class LookupItem(object):
+
+  def __init__(self, filename=None):
+    self.filename = filename
+
+class ExternalLookup(object):
+
+  def __init__(self):
+    self.mask = LookupItem()
+    self.gain = LookupItem()
+    self.pedestal = LookupItem()
+
+class ImageSet(object):
+  '''
+  A minimal imageset reading frames from a single file.
+
+  '''
+
+  def __init__(self, path, n):
+    from dxtbx.model import Detector
+    self.path = path
+    self.n = n
+    self.reads = 0
+    self.detector = Detector()
+    panel = self.detector.add_panel()
+    panel.set_image_size((10, 10))
+    panel.set_trusted_range((-1, 1000))
+    self.external_lookup = ExternalLookup()
+
+  def __len__(self):
+    return self.n
+
+  def indices(self):
+    return list(range(self.n))
+
+  def get_path(self, index):
+    return self.path
+
+  def get_detector(self, index=None):
+    return self.detector
+
+  def get_corrected_data(self, index):
+    from scitbx.array_family import flex
+    self.reads += 1
+    return (flex.double(flex.grid(10, 10), index),)
+
+  def get_mask(self, index):
+    from scitbx.array_family import flex
+    return (flex.bool(flex.grid(10, 10), index % 2 == 0),)
+
+def exercise_frame_cache():
+  import os
+  import shutil
+  import tempfile
+  from dials.util.frame_cache import FrameCache
+
+  directory = tempfile.mkdtemp()
+  try:
+    path = os.path.join(directory, 'image.h5')
+    open(path, 'w').close()
+    imageset = ImageSet(path, 5)
+
+    # The first read decodes the frames, the second uses the cache
+    cache = FrameCache(os.path.join(directory, 'cache'), max_size=1e9)
+    for i in range(5):
+      image, mask = cache.read(imageset, i)
+      assert image[0].all_eq(i)
+      assert mask[0].all_eq(i % 2 == 0)
+    assert imageset.reads == 5
+    assert cache.hits == 0 and cache.misses == 5
+
+    # Another process sharing the directory sees the same frames
+    cache = FrameCache(os.path.join(directory, 'cache'), max_size=1e9)
+    for i in range(5):
+      image, mask = cache.read(imageset, i)
+      assert image[0].all_eq(i)
+      assert mask[0].all_eq(i % 2 == 0)
+    assert imageset.reads == 5
+    assert cache.hits == 5 and cache.misses == 0
+    assert cache.hit_rate() == 1.0
+
+    # Frames from another file are not confused with these
+    other = ImageSet(os.path.join(directory, 'other.h5'), 5)
+    assert cache.key(other, 0) != cache.key(imageset, 0)
+    assert cache.key(imageset, 1) != cache.key(imageset, 0)
+    assert cache.get(other, 0) is None
+
+    # Changing the trusted range changes the mask so the frame is not reused
+    key = cache.key(imageset, 0)
+    imageset.detector[0].set_trusted_range((0, 500))
+    assert cache.key(imageset, 0) != key
+    hits = cache.hits
+    cache.read(imageset, 0)
+    assert imageset.reads == 6
+    assert cache.hits == hits
+    imageset.detector[0].set_trusted_range((-1, 1000))
+    assert cache.key(imageset, 0) == key
+
+    # Rewriting an external lookup file under the same name changes the key
+    mask_path = os.path.join(directory, 'mask.pickle')
+    with open(mask_path, 'w') as outfile:
+      outfile.write('mask')
+    imageset.external_lookup.mask = LookupItem(mask_path)
+    key = cache.key(imageset, 0)
+    assert key == cache.key(imageset, 0)
+    with open(mask_path, 'w') as outfile:
+      outfile.write('new mask')
+    assert cache.key(imageset, 0) != key
+    imageset.external_lookup.mask = LookupItem()
+
+    # The least recently used frames are removed when the cache is full
+    size = os.path.getsize(cache._filename(cache.key(imageset, 0)))
+    cache = FrameCache(os.path.join(directory, 'small'), max_size=2.5*size)
+    for i in range(5):
+      cache.read(imageset, i)
+    names = [n for n in os.listdir(cache.directory) if n.endswith('.frame')]
+    assert len(names) == 2
+    assert cache.get(imageset, 4) is not None
+  finally:
+    shutil.rmtree(directory)
+
+  print 'OK'
+
+def exercise_spot_finding_with_frame_cache():
+  import os
+  import shutil
+  import tempfile
+  import libtbx.load_env
+  try:
+    dials_regression = libtbx.env.dist_path('dials_regression')
+  except KeyError:
+    print 'SKIP: dials_regression not configured'
+    return
+
+  from dxtbx.datablock import DataBlockFactory
+  from dials.array_family import flex
+  from dials.command_line.find_spots import phil_scope
+  from dials.util.frame_cache import FrameCache
+
+  paths = [os.path.join(
+    dials_regression, "centroid_test_data/centroid_%04d.cbf" % i)
+    for i in range(1, 4)]
+
+  def find_spots(frame_cache=None):
+    datablock = DataBlockFactory.from_filenames(paths)[0]
+    params = phil_scope.extract()
+    return flex.reflection_table.from_observations(
+      datablock, params, frame_cache=frame_cache)
+
+  def assert_same_spots(a, b):
+    assert len(a) == len(b) and len(a) > 0
+    assert list(a['bbox']) == list(b['bbox'])
+    assert a['xyzobs.px.value'].as_double().all_eq(
+      b['xyzobs.px.value'].as_double())
+    assert a['intensity.sum.value'].all_eq(b['intensity.sum.value'])
+
+  # Spots found reading through the cache are the same as those found
+  # reading the images directly, whether or not the frames are cached
+  directory = tempfile.mkdtemp()
+  try:
+    expected = find_spots()
+    cache = FrameCache(os.path.join(directory, 'cache'), max_size=1e9)
+    assert_same_spots(find_spots(cache), expected)
+    assert cache.misses == len(paths) and cache.hits == 0
+    assert_same_spots(find_spots(cache), expected)
+    assert cache.hits == len(paths)
+  finally:
+    shutil.rmtree(directory)
+
+  print 'OK'
+
+def run():
+  exercise_frame_cache()
+  exercise_spot_finding_with_frame_cache()
+
+if __name__ == '__main__':
+  run()
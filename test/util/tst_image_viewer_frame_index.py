@@ -0,0 +1,75 @@
+from __future__ import absolute_import, division
+
+def make_reflections():
+  import random
+  from dials.array_family import flex
+  random.seed(0)
+  reflections = flex.reflection_table()
+  bbox = flex.int6()
+  xyzcal = flex.vec3_double()
+  ids = flex.int()
+  panels = flex.size_t()
+  for i in range(500):
+    z0 = random.randint(-2, 20)
+    z1 = z0 + random.randint(1, 4)
+    bbox.append((0, 5, 0, 5, z0, z1))
+    xyzcal.append((2.5, 2.5, random.uniform(-2, 22)))
+
+    # Include unindexed reflections and several panels
+    ids.append(random.randint(-1, 3))
+    panels.append(random.randint(0, 5))
+  reflections['bbox'] = bbox
+  reflections['xyzcal.px'] = xyzcal
+  reflections['id'] = ids
+  reflections['panel'] = panels
+  return reflections
+
+def exercise_bbox_selection():
+  from dials.util.image_viewer.frame_index import ReflectionFrameIndex
+  reflections = make_reflections()
+  index = ReflectionFrameIndex(reflections)
+  x0, x1, y0, y1, z0, z1 = reflections['bbox'].parts()
+  for n in range(3):
+    for i_frame in range(-4, 26):
+      expected = (~((i_frame >= z1) | ((i_frame + n) < z0))).iselection()
+      selection = index.bbox_selection(i_frame, i_frame + n)
+      assert sorted(selection) == list(expected)
+
+      # On each frame the reflections are ordered by experiment and panel
+      if n == 0:
+        keys = [(reflections['id'][i], reflections['panel'][i])
+                for i in selection]
+        assert keys == sorted(keys)
+  print 'OK'
+
+def exercise_prediction_selection():
+  from dials.array_family import flex
+  from dials.util.image_viewer.frame_index import ReflectionFrameIndex
+  reflections = make_reflections()
+  index = ReflectionFrameIndex(reflections)
+  frame_numbers = reflections['xyzcal.px'].parts()[2]
+  for i_frame in range(-4, 26):
+    expected = ((frame_numbers >= i_frame) &
+                (frame_numbers < (i_frame + 1))).iselection()
+    selection = index.prediction_selection(i_frame)
+    assert sorted(selection) == list(expected)
+
+  # An empty table has nothing on any frame
+  index = ReflectionFrameIndex(reflections[0:0])
+  assert len(index.bbox_selection(0, 5)) == 0
+  assert len(index.prediction_selection(0)) == 0
+
+  # Without a bbox column only the predictions are indexed
+  del reflections['bbox']
+  index = ReflectionFrameIndex(reflections)
+  assert not index.has_bbox_index()
+  assert index.has_prediction_index()
+  assert isinstance(index.prediction_selection(0), flex.size_t)
+  print 'OK'
+
+def run():
+  exercise_bbox_selection()
+  exercise_prediction_selection()
+
+if __name__ == '__main__':
+  run()
@@ -1,4 +1,5 @@
 from __future__ import absolute_import, division
+from iotbx.phil import parse
 
 def exercise_polygon():
   from dials.util import is_inside_polygon
@@ -12,6 +13,33 @@ def exercise_polygon():
   points = flex.vec2_double(((0.3, 0.8), (0.3, 1.5), (-8,9), (0.00001, 0.9999)))
   assert list(is_inside_polygon(poly, points)) == [True, False, False, True]
 
+def exercise_cached_mask_generator():
+  import os
+  import libtbx.load_env
+  try:
+    dials_regression = libtbx.env.dist_path('dials_regression')
+  except KeyError, e:
+    print 'SKIP: dials_regression not configured'
+    exit(0)
+
+  from dxtbx.datablock import DataBlockFactory
+  from dials.util.masking import phil_scope
+  from dials.util.masking import MaskGenerator, CachedMaskGenerator
+  params = phil_scope.fetch(source=parse('border=5 d_min=2')).extract()
+  generator = MaskGenerator(params)
+  cached = CachedMaskGenerator(params)
+  for i in range(1, 4):
+    path = os.path.join(
+      dials_regression, "centroid_test_data/centroid_%04d.cbf" % i)
+    datablock = DataBlockFactory.from_filenames([path])[0]
+    imageset = datablock.extract_imagesets()[0]
+    mask1 = generator.generate(imageset)
+    mask2 = cached.generate(imageset)
+    assert len(mask1) == len(mask2)
+    for m1, m2 in zip(mask1, mask2):
+      assert m1.all_eq(m2)
+  assert (cached.misses, cached.hits) == (1, 2)
+
 def exercise_dynamic_shadowing():
   import os
   import libtbx.load_env
@@ -44,6 +72,7 @@ def exercise_dynamic_shadowing():
 
 def run():
   exercise_polygon()
+  exercise_cached_mask_generator()
   exercise_dynamic_shadowing()
   print 'OK'
 
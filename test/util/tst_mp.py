@@ -0,0 +1,29 @@
+from __future__ import absolute_import, division
+
+def exercise_shared_memory_table():
+  import os
+  from dials.array_family import flex
+  from dials.util.mp import SharedMemoryTable
+  import cPickle as pickle
+
+  table = flex.reflection_table()
+  table['id'] = flex.int([0, 1, 2])
+  table['miller_index'] = flex.miller_index([(1,0,0), (0,1,0), (0,0,1)])
+  table['xyzcal.px'] = flex.vec3_double([(1,2,3), (4,5,6), (7,8,9)])
+
+  # Only the handle goes through the pickle
+  handle = pickle.loads(pickle.dumps(SharedMemoryTable(table), protocol=2))
+  assert len(handle) == 3
+  assert os.path.exists(handle.filename)
+  result = handle.load()
+  assert not os.path.exists(handle.filename)
+  assert list(result['id']) == list(table['id'])
+  assert list(result['miller_index']) == list(table['miller_index'])
+  assert list(result['xyzcal.px']) == list(table['xyzcal.px'])
+
+def run():
+  exercise_shared_memory_table()
+  print 'OK'
+
+if __name__ == '__main__':
+  run()
@@ -0,0 +1,63 @@
+from __future__ import absolute_import, division
+
+class Image(object):
+  '''
+  A minimal image message with uncompressed data.
+
+  '''
+
+  def __init__(self, count, array):
+    self.count = count
+    self.data = array.tostring()
+    self.info = {
+      'shape' : list(array.shape),
+      'type' : str(array.dtype),
+      'encoding' : '<',
+    }
+
+def make_array(count):
+  import numpy
+  array = numpy.arange(20, dtype=numpy.uint32).reshape(4, 5) + count
+  array[0, 0] = 0xffffffff
+  return array
+
+def exercise_decode_image_data():
+  from dials.util.stream import decode_image_data
+  image = Image(1, make_array(1))
+  data = decode_image_data(image.data, image.info)
+  assert data.all() == (4, 5)
+  assert list(data)[1:] == list(range(2, 21))
+
+  # Saturated pixels become negative
+  assert data[0] == -1
+  print 'OK'
+
+def exercise_image_writer():
+  import json
+  import os
+  import shutil
+  import tempfile
+  from dials.util.stream import ImageWriter
+  directory = tempfile.mkdtemp()
+  try:
+    writer = ImageWriter(directory, "%05d.image")
+    images = [Image(i, make_array(i)) for i in range(5)]
+    for image in images:
+      writer.write(image)
+    writer.close()
+    for image in images:
+      filename = os.path.join(directory, "%05d.image" % image.count)
+      with open(filename, "rb") as infile:
+        assert infile.read() == image.data
+      with open("%s.info" % filename) as infile:
+        assert json.load(infile) == image.info
+  finally:
+    shutil.rmtree(directory)
+  print 'OK'
+
+def run():
+  exercise_decode_image_data()
+  exercise_image_writer()
+
+if __name__ == '__main__':
+  run()
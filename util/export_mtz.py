@@ -2,7 +2,6 @@
 
 from __future__ import absolute_import, division, print_function
 
-from collections import defaultdict
 from math import floor, ceil, sqrt, sin, cos, pi, log
 import time
 
@@ -65,81 +64,89 @@ def sum_partial_reflections(integrated_data, min_total_partiality=0.5):
   if len(isel) == 0:
     return integrated_data
 
-  delete = flex.size_t()
-  partial_map = defaultdict(list)
-
-  # create map of partial_id to reflections j
-
-  for j in isel:
-    partial_map[integrated_data['partial_id'][j]].append(j)
-
-  # now work through this map - get total partiality for every reflection;
-  # here only consider reflections with > 1 component; if total partiality
-  # less than min_total_partiality discard all parts.
-
-  partial_ids = []
-
-  for p_id in partial_map:
-    if len(partial_map[p_id]) > 1:
-      partial_ids.append(p_id)
-
-  # work through multipart partials; compute those weighted values I need
-  # if total partiality less than min, delete. if summing, delete extra parts
+  # group the parts by partial_id with a stable sort, so that within each
+  # group the parts stay in table order and the first part is kept
+
+  partial_id = integrated_data['partial_id'].select(isel)
+  perm = flex.sort_permutation(partial_id, stable=True)
+  isel = isel.select(perm)
+  partial_id = partial_id.select(perm)
+
+  # find the start and size of each group; only consider reflections with > 1
+  # component
+
+  starts = flex.size_t([0])
+  if len(partial_id) > 1:
+    starts.extend(
+      (partial_id[1:] != partial_id[:-1]).iselection() + 1)
+  ends = starts[1:]
+  ends.append(len(partial_id))
+  sizes = ends - starts
+  multi = (sizes > 1).iselection()
+  if len(multi) == 0:
+    return integrated_data
+  starts = starts.select(multi)
+  sizes = sizes.select(multi)
 
   we_got_profiles = 'intensity.prf.value' in integrated_data
   logger.info('Profile fitted reflections: %s' % we_got_profiles)
 
-  for p_id in partial_ids:
-    p_tot = sum([integrated_data['partiality'][j] for j in partial_map[p_id]])
-    if p_tot < min_total_partiality:
-      for j in partial_map[p_id]:
-        delete.append(j)
-      continue
-
-    j0 = partial_map[p_id][0]
-    jrest = partial_map[p_id][1:]
-
-    # FIXME revisiting this calculation am not sure it is correct - why
-    # weighting by (I/sig(I))^2 not just 1/variance?
-    if we_got_profiles:
-      prf_value = integrated_data['intensity.prf.value'][j0]
-      prf_variance = integrated_data['intensity.prf.variance'][j0]
-      weight = prf_value * prf_value / prf_variance
-      prf_value *= weight
-      prf_variance *= weight
-      total_weight = weight
-    sum_value = integrated_data['intensity.sum.value'][j0]
-    sum_variance = integrated_data['intensity.sum.variance'][j0]
-    partiality = integrated_data['partiality'][j0]
-
-    # weight profile fitted intensity and variance computed from weights
-    # proportional to (I/sig(I))^2; schedule for deletion spare parts
-
-    for j in jrest:
-      delete.append(j)
+  # accumulate the parts of every group at once, one part at a time, so the
+  # sums are evaluated in the same order as summing each group in turn
+
+  # FIXME revisiting this calculation am not sure it is correct - why
+  # weighting by (I/sig(I))^2 not just 1/variance?
+  def part_weights(j):
+    prf_value = integrated_data['intensity.prf.value'].select(j)
+    prf_variance = integrated_data['intensity.prf.variance'].select(j)
+    return prf_value, prf_variance, prf_value * prf_value / prf_variance
+
+  j0 = isel.select(starts)
+  sum_value = integrated_data['intensity.sum.value'].select(j0)
+  sum_variance = integrated_data['intensity.sum.variance'].select(j0)
+  partiality = integrated_data['partiality'].select(j0)
+  if we_got_profiles:
+    prf_value, prf_variance, total_weight = part_weights(j0)
+    prf_value = prf_value * total_weight
+    prf_variance = prf_variance * total_weight
 
-      sum_value += integrated_data['intensity.sum.value'][j]
-      sum_variance += integrated_data['intensity.sum.variance'][j]
-      partiality += integrated_data['partiality'][j]
+  delete = flex.size_t()
+  for k in range(1, max(sizes)):
+    groups = (sizes > k).iselection()
+    j = isel.select(starts.select(groups) + k)
+    delete.extend(j)
 
-      if we_got_profiles:
-        _prf_value = integrated_data['intensity.prf.value'][j]
-        _prf_variance = integrated_data['intensity.prf.variance'][j]
+    def add(total, values):
+      total.set_selected(groups, total.select(groups) + values)
 
-        _weight = _prf_value * _prf_value / _prf_variance
-        prf_value += _weight * _prf_value
-        prf_variance += _weight * _prf_variance
-        total_weight += _weight
+    add(sum_value, integrated_data['intensity.sum.value'].select(j))
+    add(sum_variance, integrated_data['intensity.sum.variance'].select(j))
+    add(partiality, integrated_data['partiality'].select(j))
 
-    # now write these back into original reflection
+    # weight profile fitted intensity and variance computed from weights
+    # proportional to (I/sig(I))^2
     if we_got_profiles:
-      prf_value /= total_weight
-      prf_variance /= total_weight
-      integrated_data['intensity.prf.value'][j0] = prf_value
-      integrated_data['intensity.prf.variance'][j0] = prf_variance
-    integrated_data['intensity.sum.value'][j0] = sum_value
-    integrated_data['intensity.sum.variance'][j0] = sum_variance
-    integrated_data['partiality'][j0] = partiality
+      _prf_value, _prf_variance, _weight = part_weights(j)
+      add(prf_value, _weight * _prf_value)
+      add(prf_variance, _weight * _prf_variance)
+      add(total_weight, _weight)
+
+  # if total partiality less than min_total_partiality discard all parts,
+  # otherwise write the sums back into the first part and delete the others
+
+  keep = (partiality >= min_total_partiality).iselection()
+  discard = (partiality < min_total_partiality).iselection()
+  delete.extend(j0.select(discard))
+  j0 = j0.select(keep)
+  if we_got_profiles:
+    integrated_data['intensity.prf.value'].set_selected(
+      j0, prf_value.select(keep) / total_weight.select(keep))
+    integrated_data['intensity.prf.variance'].set_selected(
+      j0, prf_variance.select(keep) / total_weight.select(keep))
+  integrated_data['intensity.sum.value'].set_selected(j0, sum_value.select(keep))
+  integrated_data['intensity.sum.variance'].set_selected(
+    j0, sum_variance.select(keep))
+  integrated_data['partiality'].set_selected(j0, partiality.select(keep))
 
   integrated_data.del_selected(delete)
 
@@ -163,16 +170,14 @@ def scale_partial_reflections(integrated_data, min_partiality=0.5):
   if len(isel) == 0:
     return integrated_data
 
-  delete = flex.size_t()
-
-  for j in isel:
-    if integrated_data['partiality'][j] < min_partiality:
-      delete.append(j)
-      continue
-    inv_p = 1.0 / integrated_data['partiality'][j]
-    integrated_data['intensity.sum.value'][j] *= inv_p
-    integrated_data['intensity.sum.variance'][j] *= inv_p
-    integrated_data['partiality'][j] *= 1.0
+  partiality = integrated_data['partiality'].select(isel)
+  delete = isel.select(partiality < min_partiality)
+  keep = partiality >= min_partiality
+  isel = isel.select(keep)
+  inv_p = 1.0 / partiality.select(keep)
+  for key in ['intensity.sum.value', 'intensity.sum.variance']:
+    column = integrated_data[key]
+    column.set_selected(isel, column.select(isel) * inv_p)
 
   integrated_data.del_selected(delete)
 
@@ -600,6 +605,24 @@ def _calculate_batch_offsets(experiments):
   return batch_offsets
 
 
+def _experiment_row_ranges(ids, n_experiments):
+  """Find the range of rows belonging to each experiment.
+
+  The ids must be sorted; returns a list of (start, end) for each experiment,
+  with start == end for experiments without any rows.
+  """
+  ranges = [(0, 0)] * n_experiments
+  if len(ids) == 0:
+    return ranges
+  starts = [0]
+  if len(ids) > 1:
+    starts.extend((ids[1:] != ids[:-1]).iselection() + 1)
+  ends = starts[1:] + [len(ids)]
+  for start, end in zip(starts, ends):
+    ranges[ids[start]] = (start, end)
+  return ranges
+
+
 def export_mtz(integrated_data, experiment_list, hklout, ignore_panels=False,
                include_partials=False, keep_partials=False, scale_partials=True,
                min_isigi=None, force_static_model=False, filter_ice_rings=False,
@@ -665,16 +688,43 @@ def export_mtz(integrated_data, experiment_list, hklout, ignore_panels=False,
   # ✓ decide a sensible BATCH increment to apply to the BATCH value between
   #   experiments and add this
 
+  # Order the reflections by experiment, dropping any which do not belong to
+  # an experiment; only copy the table if it is not already in order
+  ids = integrated_data["id"]
+  if len(ids) > 0:
+    valid = (ids >= 0) & (ids < len(experiment_list))
+    if valid.count(False) > 0:
+      integrated_data = integrated_data.select(valid)
+      ids = integrated_data["id"]
+  if len(ids) > 1 and (ids[1:] < ids[:-1]).count(True) > 0:
+    integrated_data = integrated_data.select(
+      flex.sort_permutation(ids, stable=True))
+    ids = integrated_data["id"]
+  ranges = _experiment_row_ranges(ids, len(experiment_list))
+
+  # Reference the existing columns rather than copying them, and add the
+  # derived columns for all experiments in a single pass
+  nref = len(integrated_data)
+  columns = dict(integrated_data)
+  miller_index_rebase = columns["miller_index"]
+  batch_offset = flex.int(nref, 0)
+  _, _, frac_image_id = integrated_data['xyzcal.px'].parts()
+  rot = flex.double(frac_image_id)
+
   for experiment_index, experiment in enumerate(experiment_list):
-    # Grab our subset of the data
-    experiment.data = dict(integrated_data.select(integrated_data["id"] == experiment_index))
+    start, end = ranges[experiment_index]
+    rows = flex.size_t_range(start, end)
     experiment.batch_offset = batch_offsets[experiment_index]
 
     # Do any crystal transformations for the experiment
     cb_op_to_ref = experiment.crystal.get_space_group().info(
         ).change_of_basis_op_to_reference_setting()
     experiment.crystal = experiment.crystal.change_basis(cb_op_to_ref)
-    experiment.data["miller_index_rebase"] = cb_op_to_ref.apply(experiment.data["miller_index"])
+    if not cb_op_to_ref.is_identity_op() and end > start:
+      if miller_index_rebase is columns["miller_index"]:
+        miller_index_rebase = miller_index_rebase.deep_copy()
+      miller_index_rebase.set_selected(rows,
+        cb_op_to_ref.apply(columns["miller_index"][start:end]))
 
     s0 = experiment.beam.get_s0()
     s0n = matrix.col(s0).normalize().elems
@@ -686,18 +736,22 @@ def export_mtz(integrated_data, experiment_list, hklout, ignore_panels=False,
         image_number=i, 
         force_static_model=force_static_model)
 
-    # Create the batch offset array. This gives us an experiment (id)-dependent 
-    # batch offset to calculate the correct batch from image number.
-    experiment.data["batch_offset"] = flex.int(len(experiment.data["id"]), experiment.batch_offset)
+    # Set the batch offset for the experiment. This gives us an experiment
+    # (id)-dependent batch offset to calculate the correct batch from image
+    # number.
+    batch_offset.set_selected(rows, experiment.batch_offset)
 
-    # Calculate whether we have a ROT value for this experiment, and set the column
-    _, _, frac_image_id = integrated_data['xyzcal.px'].parts()
-    frac_image_id = flex.double(frac_image_id)
-    if experiment.scan:
-      # When getting angle, z_px counts from 0; image_index from 1
-      experiment.data["ROT"] = flex.double([experiment.scan.get_angle_from_image_index(z+1) for z in frac_image_id])
-    else:
-      experiment.data["ROT"] = frac_image_id
+    # Calculate the ROT value for this experiment if it has a scan. When
+    # getting angle, z_px counts from 0; image_index from 1
+    if experiment.scan and end > start:
+      phi0, dphi = experiment.scan.get_oscillation()
+      first = experiment.scan.get_image_range()[0]
+      rot.set_selected(rows,
+        phi0 + ((rot[start:end] + 1) - first) * dphi)
+
+  columns["miller_index_rebase"] = miller_index_rebase
+  columns["batch_offset"] = batch_offset
+  columns["ROT"] = rot
 
   # Update the mtz general information now we've processed the experiments
   mtz_file.set_space_group_info(experiment_list[0].crystal.get_space_group().info())
@@ -705,20 +759,14 @@ def export_mtz(integrated_data, experiment_list, hklout, ignore_panels=False,
   mtz_crystal = mtz_file.add_crystal('XTAL', 'DIALS', unit_cell.parameters())
   mtz_dataset = mtz_crystal.add_dataset('FROMDIALS', experiment_list[0].beam.get_wavelength())
 
-  # Combine all of the experiment data columns before writing
-  merged_data = {k: v.deep_copy() for k, v in experiment_list[0].data.items()}
-  for experiment in experiment_list[1:]:
-    for k, v in experiment.data.items():
-      merged_data[k].extend(v)
   # ALL columns must be the same length
-  assert len(set(len(v) for v in merged_data.values())) == 1, "Column length mismatch"
-  assert len(merged_data["id"] == len(integrated_data["id"])), "Lost rows in split/combine"
+  assert len(set(len(v) for v in columns.values())) == 1, "Column length mismatch"
 
   # Write all the data and columns to the mtz file
-  _write_columns(mtz_file, mtz_dataset, merged_data,
+  _write_columns(mtz_file, mtz_dataset, columns,
     scale_partials=scale_partials)
 
-  logger.info("Saving {} integrated reflections to {}".format(len(merged_data['id']), hklout))
+  logger.info("Saving {} integrated reflections to {}".format(nref, hklout))
   mtz_file.write(hklout)
 
   return mtz_file
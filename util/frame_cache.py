@@ -0,0 +1,261 @@
+#
+# frame_cache.py
+#
+#  Copyright (C) 2017 Diamond Light Source
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+
+from __future__ import absolute_import, division
+import logging
+logger = logging.getLogger(__name__)
+
+from libtbx.phil import parse
+
+phil_scope = parse('''
+  frame_cache
+    .expert_level = 2
+  {
+    enable = False
+      .type = bool
+      .help = "Cache decoded images and masks on the local node so that frames"
+              "read by more than one job (for example where integration"
+              "blocks overlap) are only decoded once."
+
+    directory = None
+      .type = path
+      .help = "The cache directory. By default a directory in /dev/shm (if"
+              "available) or the temporary directory is used."
+
+    max_size = 2.0
+      .type = float(value_min=0)
+      .help = "The maximum size of the cache in GB. The least recently used"
+              "frames are removed when the cache is full."
+  }
+''')
+
+
+def default_frame_cache_directory():
+  '''
+  Get the default cache directory for the current user.
+
+  '''
+  import getpass
+  import os
+  from dials.util.mp import shared_memory_directory
+  return os.path.join(
+    shared_memory_directory(),
+    'dials_frame_cache_%s' % getpass.getuser())
+
+
+def _file_state(path):
+  '''
+  Get the absolute path, modification time and size of a file.
+
+  '''
+  import os
+  path = os.path.abspath(path)
+  try:
+    stat = os.stat(path)
+    return (path, stat.st_mtime, stat.st_size)
+  except OSError:
+    return (path, None, None)
+
+
+class FrameCache(object):
+  '''
+  A node-local cache of decoded images and masks.
+
+  Each frame is pickled to a file in the cache directory, keyed by the image
+  path, the frame number and the external lookup files. Files are written
+  atomically so the cache can be shared by several processes. When the cache
+  exceeds its maximum size the least recently used frames are removed.
+
+  '''
+
+  def __init__(self, directory=None, max_size=2e9):
+    '''
+    Open the cache.
+
+    :param directory: The cache directory
+    :param max_size: The maximum size of the cache in bytes
+
+    '''
+    import os
+    if directory is None:
+      directory = default_frame_cache_directory()
+    self.directory = directory
+    self.max_size = max_size
+    self.hits = 0
+    self.misses = 0
+    if not os.path.isdir(directory):
+      try:
+        os.makedirs(directory)
+      except OSError:
+        if not os.path.isdir(directory):
+          raise
+
+  @classmethod
+  def from_params(Class, params):
+    '''
+    Create the cache from the frame_cache parameters.
+
+    :param params: The frame_cache parameters
+    :return: The cache or None if not enabled
+
+    '''
+    if params is None or not params.enable:
+      return None
+    return Class(params.directory, params.max_size * 1e9)
+
+  def key(self, imageset, index):
+    '''
+    Get the key for a frame.
+
+    The key covers everything the decoded image and mask depend on: the image
+    file and frame, the detector model (e.g. the trusted range used to compute
+    the mask) and the contents of the external mask, gain and pedestal files,
+    so that a stale frame is not returned when any of them has changed.
+
+    :param imageset: The imageset
+    :param index: The index of the image in the imageset
+    :return: The key
+
+    '''
+    import hashlib
+    import json
+    from dxtbx.imageset import ImageSweep
+    path = imageset.get_path(index)
+    if isinstance(imageset, ImageSweep):
+      frame = imageset.get_array_range()[0] + index
+      detector = imageset.get_detector()
+    else:
+      frame = imageset.indices()[index]
+      detector = imageset.get_detector(index)
+    if detector is not None:
+      detector = json.dumps(detector.to_dict(), sort_keys=True)
+    lookup = []
+    external_lookup = getattr(imageset, 'external_lookup', None)
+    if external_lookup is not None:
+      for name in ['mask', 'gain', 'pedestal']:
+        item = getattr(external_lookup, name, None)
+        filename = getattr(item, 'filename', None)
+        if filename:
+          lookup.append(_file_state(filename))
+        else:
+          lookup.append(None)
+    digest = hashlib.sha1(repr((
+      _file_state(path), frame, detector, lookup)))
+    return digest.hexdigest()
+
+  def _filename(self, key):
+    import os
+    return os.path.join(self.directory, '%s.frame' % key)
+
+  def get(self, imageset, index):
+    '''
+    Get a frame from the cache.
+
+    :param imageset: The imageset
+    :param index: The index of the image in the imageset
+    :return: The image and mask or None if not cached
+
+    '''
+    import cPickle as pickle
+    import os
+    filename = self._filename(self.key(imageset, index))
+    try:
+      with open(filename, 'rb') as infile:
+        image, mask = pickle.load(infile)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError):
+      self.misses += 1
+      return None
+    try:
+      os.utime(filename, None)
+    except OSError:
+      pass
+    self.hits += 1
+    return image, mask
+
+  def put(self, imageset, index, image, mask):
+    '''
+    Add a frame to the cache.
+
+    :param imageset: The imageset
+    :param index: The index of the image in the imageset
+    :param image: The image data
+    :param mask: The image mask
+
+    '''
+    import cPickle as pickle
+    import os
+    import tempfile
+    filename = self._filename(self.key(imageset, index))
+    fd, tmp_filename = tempfile.mkstemp(
+      prefix='.tmp_', suffix='.frame', dir=self.directory)
+    try:
+      with os.fdopen(fd, 'wb') as outfile:
+        pickle.dump((image, mask), outfile, protocol=pickle.HIGHEST_PROTOCOL)
+      os.rename(tmp_filename, filename)
+    except Exception:
+      if os.path.exists(tmp_filename):
+        os.remove(tmp_filename)
+      raise
+    self.evict(keep=filename)
+
+  def read(self, imageset, index):
+    '''
+    Get a frame from the cache or read it from the imageset.
+
+    :param imageset: The imageset
+    :param index: The index of the image in the imageset
+    :return: The image and mask
+
+    '''
+    item = self.get(imageset, index)
+    if item is None:
+      item = (imageset.get_corrected_data(index), imageset.get_mask(index))
+      try:
+        self.put(imageset, index, item[0], item[1])
+      except (IOError, OSError) as e:
+        logger.debug('Unable to cache frame %d: %s' % (index, e))
+    return item
+
+  def evict(self, keep=None):
+    '''
+    Remove the least recently used frames until the cache fits in the
+    maximum size.
+
+    :param keep: A file not to remove
+
+    '''
+    import os
+    files = []
+    for name in os.listdir(self.directory):
+      if name.endswith('.frame') and not name.startswith('.tmp_'):
+        filename = os.path.join(self.directory, name)
+        try:
+          stat = os.stat(filename)
+        except OSError:
+          continue
+        files.append((stat.st_mtime, stat.st_size, filename))
+    total = sum(size for mtime, size, filename in files)
+    for mtime, size, filename in sorted(files):
+      if total <= self.max_size:
+        break
+      if filename == keep:
+        continue
+      try:
+        os.remove(filename)
+      except OSError:
+        pass
+      total -= size
+
+  def hit_rate(self):
+    '''
+    Get the fraction of lookups found in the cache.
+
+    '''
+    if self.hits + self.misses == 0:
+      return 0
+    return self.hits / (self.hits + self.misses)
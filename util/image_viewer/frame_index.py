@@ -0,0 +1,174 @@
+from __future__ import absolute_import, division
+from bisect import bisect_left
+from dials.array_family import flex
+
+
+class ReflectionFrameIndex(object):
+  '''
+  An index of the reflections on each frame of a reflection table.
+
+  The index is built once, so that the reflections to draw on a frame can be
+  found without searching the whole table. Reflections are indexed both by
+  the frames covered by their bounding boxes and by the frame of their
+  predicted position. On each frame the reflections are sorted by experiment
+  and then by panel.
+
+  '''
+
+  def __init__(self, reflections):
+    '''
+    Build the index.
+
+    :param reflections: The reflection table
+
+    '''
+    n = len(reflections)
+    if 'id' in reflections:
+      self._experiment = reflections['id'].as_double()
+    else:
+      self._experiment = flex.double(n, 0)
+    if 'panel' in reflections:
+      self._panel = reflections['panel'].as_double()
+    else:
+      self._panel = flex.double(n, 0)
+    self._bbox_rows = None
+    self._bbox_frames = None
+    self._bbox_first = None
+    self._cal_rows = None
+    self._cal_frames = None
+    if 'bbox' in reflections:
+      self._build_bbox_index(reflections['bbox'])
+    if 'xyzcal.px' in reflections:
+      self._build_cal_index(reflections['xyzcal.px'])
+
+  def _sort(self, rows, frames):
+    '''
+    Sort the rows by frame, experiment and panel.
+
+    '''
+    if len(rows) == 0:
+      return rows, frames
+    perm = flex.lexsort_permutation([
+      frames.as_double(),
+      self._experiment.select(rows),
+      self._panel.select(rows)])
+    return rows.select(perm), frames.select(perm)
+
+  def _build_bbox_index(self, bbox):
+    '''
+    List each reflection on every frame covered by its bounding box.
+
+    '''
+    x0, x1, y0, y1, z0, z1 = bbox.parts()
+    nz = z1 - z0
+    all_rows = flex.size_t_range(len(bbox))
+    rows = flex.size_t()
+    frames = flex.int()
+    if len(bbox) > 0:
+      for d in range(flex.max(nz)):
+        sel = nz > d
+        rows.extend(all_rows.select(sel))
+        frames.extend((z0 + d).select(sel))
+    self._bbox_rows, self._bbox_frames = self._sort(rows, frames)
+    self._bbox_first = z0
+
+  def _build_cal_index(self, xyzcal):
+    '''
+    List each reflection on the frame of its predicted position.
+
+    '''
+    z = xyzcal.parts()[2]
+    frames = flex.floor(z).iround()
+    rows = flex.size_t_range(len(xyzcal))
+    self._cal_rows, self._cal_frames = self._sort(rows, frames)
+
+  @staticmethod
+  def _frame_range(frames, first, last):
+    '''
+    Get the slice of the sorted frames from first to last inclusive.
+
+    '''
+    return bisect_left(frames, first), bisect_left(frames, last + 1)
+
+  def has_bbox_index(self):
+    return self._bbox_rows is not None
+
+  def has_prediction_index(self):
+    return self._cal_rows is not None
+
+  def bbox_selection(self, first, last=None):
+    '''
+    Get the reflections whose bounding boxes cover any of a range of frames.
+
+    :param first: The first frame
+    :param last: The last frame (inclusive)
+    :return: The indices of the reflections
+
+    '''
+    assert self.has_bbox_index()
+    if last is None:
+      last = first
+    i0, i1 = self._frame_range(self._bbox_frames, first, first)
+    selection = self._bbox_rows[i0:i1]
+    if last > first:
+
+      # Only add reflections which start on the later frames, so that each
+      # reflection is only listed once
+      j0, j1 = self._frame_range(self._bbox_frames, first + 1, last)
+      rows = self._bbox_rows[j0:j1]
+      starts = self._bbox_first.select(rows) == self._bbox_frames[j0:j1]
+      selection.extend(rows.select(starts))
+    return selection
+
+  def prediction_selection(self, frame):
+    '''
+    Get the reflections whose predicted positions are on a frame.
+
+    :param frame: The frame
+    :return: The indices of the reflections
+
+    '''
+    assert self.has_prediction_index()
+    i0, i1 = self._frame_range(self._cal_frames, frame, frame)
+    return self._cal_rows[i0:i1]
+
+
+_pixel_grids = {}
+
+def _pixel_grid(nx, ny):
+  '''
+  Get the x and y coordinates of the pixels in a ny x nx image, cached by
+  size since most shoeboxes have one of a few sizes.
+
+  '''
+  if (nx, ny) not in _pixel_grids:
+    xs = flex.int()
+    ys = flex.int()
+    row = flex.int(range(nx))
+    for iy in range(ny):
+      xs.extend(row)
+      ys.extend(flex.int(nx, iy))
+    _pixel_grids[(nx, ny)] = (xs, ys)
+  return _pixel_grids[(nx, ny)]
+
+
+def shoebox_pixels_with_codes(shoebox, iz, codes):
+  '''
+  Get the pixels on one frame of a shoebox with any of the given mask codes.
+
+  :param shoebox: The shoebox
+  :param iz: The frame within the shoebox
+  :param codes: The list of mask codes
+  :return: The x and y panel coordinates of the pixels
+
+  '''
+  x0, x1, y0, y1, z0, z1 = shoebox.bbox
+  nx = x1 - x0
+  ny = y1 - y0
+  n = nx * ny
+  mask = shoebox.mask.as_1d()[iz * n:(iz + 1) * n]
+  selection = flex.bool(n, False)
+  for code in codes:
+    selection = selection | (mask == code)
+  xs, ys = _pixel_grid(nx, ny)
+  return xs.select(selection) + x0, ys.select(selection) + y0
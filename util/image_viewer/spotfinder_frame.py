@@ -113,6 +113,12 @@ def __init__ (self, *args, **kwds) :
         d_spacings = 1/reflections[i_ref_list]['rlp'].norms()
         reflections[i_ref_list] = reflections[i_ref_list].select(d_spacings > self.params.d_min)
       self.reflections = reflections
+
+    # Index the reflections by frame once, so that changing frame only
+    # touches the reflections on the new frame
+    from dials.util.image_viewer.frame_index import ReflectionFrameIndex
+    self.frame_indices = [
+      ReflectionFrameIndex(ref_list) for ref_list in self.reflections]
     self.Bind(EVT_LOADIMG, self.load_file_event)
 
     self.Bind(wx.EVT_UPDATE_UI, self.OnUpdateUIMask,
@@ -1016,10 +1022,23 @@ def mask_raw_data(self, raw_data):
     for rd, m in zip(raw_data, mask):
       rd.set_selected(~m, -2)
 
+  def select_shown_reflections(self, ref_list):
+    if self.settings.show_indexed:
+      indexed_sel = ref_list.get_flags(ref_list.flags.indexed,
+                                          all=False)
+      ref_list = ref_list.select(indexed_sel)
+
+    if self.settings.show_integrated:
+      integrated_sel = ref_list.get_flags(ref_list.flags.integrated,
+                                          all=False)
+      ref_list = ref_list.select(integrated_sel)
+    return ref_list
+
   def get_spotfinder_data(self):
     from scitbx.array_family import flex
     import math
     from dials.algorithms.shoebox import MaskCode
+    from dials.util.image_viewer.frame_index import shoebox_pixels_with_codes
     bg_code = MaskCode.Valid | MaskCode.BackgroundUsed
     fg_code = MaskCode.Valid | MaskCode.Foreground
     strong_code = MaskCode.Valid | MaskCode.Strong
@@ -1060,67 +1079,49 @@ def map_coords(x, y, p):
     self.prediction_colours = ["#e41a1c", "#377eb8", "#4daf4a", "#984ea3",
                                "#ff7f00", "#ffff33", "#a65628", "#f781bf",
                                "#999999"] * 10
-    for ref_list in self.reflections:
-      if self.settings.show_indexed:
-        indexed_sel = ref_list.get_flags(ref_list.flags.indexed,
-                                            all=False)
-        ref_list = ref_list.select(indexed_sel)
-
-      if self.settings.show_integrated:
-        integrated_sel = ref_list.get_flags(ref_list.flags.integrated,
-                                            all=False)
-        ref_list = ref_list.select(integrated_sel)
+    # The number of times each foreground pixel is listed for each
+    # experiment, keyed by screen position
+    pixel_counts = {}
+    n = self.params.sum_images - 1
+    for ref_list, frame_index in zip(self.reflections, self.frame_indices):
       if ref_list.size() == 0: continue
       if 'bbox' in ref_list:
-        bbox = ref_list['bbox']
-        x0, x1, y0, y1, z0, z1 = bbox.parts()
         # ticket #107
-        n = self.params.sum_images - 1
-        bbox_sel = ~ ((i_frame >= z1) | ((i_frame + n) < z0))
-        for reflection in ref_list.select(bbox_sel):
+        bbox_list = self.select_shown_reflections(ref_list.select(
+          frame_index.bbox_selection(i_frame, i_frame + n)))
+        for reflection in bbox_list:
           x0, x1, y0, y1, z0, z1 = reflection['bbox']
           panel = reflection['panel']
-          nx = x1 - x0 # size of reflection box in x-direction
-          ny = y1 - y0 # size of reflection box in y-direction
-          #nz = z1 - z0 # number of frames this spot appears on
           if (self.settings.show_all_pix and 'shoebox' in reflection
               and reflection['shoebox'].mask.size() > 0 and n == 0):
             self.show_all_pix_timer.start()
-            shoebox = reflection['shoebox']
-            iz = i_frame - z0
-            if not reflection['id'] in all_pix_data:
-              all_pix_data[reflection['id']] = []
+            expt_id = reflection['id']
+            if not expt_id in all_pix_data:
+              all_pix_data[expt_id] = []
 
-              all_foreground_circles[reflection['id']] = []
+              all_foreground_circles[expt_id] = []
 
+            xs, ys = shoebox_pixels_with_codes(
+              reflection['shoebox'], i_frame - z0, (strong_code, fg_code))
             this_spot_foreground_pixels = []
-            for ix in range(nx):
-              for iy in range(ny):
-                mask_value = shoebox.mask[iz, iy, ix]
-                if ((mask_value == strong_code) or
-                    (mask_value == fg_code)):
-                  x_, y_ = map_coords(
-                    ix + x0 + 0.5, iy + y0 + 0.5, panel)
-                  this_spot_foreground_pixels.append(matrix.col((x_,y_)))
-                  if len(all_pix_data) > 1:
-                    # look for overlapped pixels
-                    found_it = False
-                    for key, value in all_pix_data.items():
-                      if (x_, y_) in value:
-                        value.pop(value.index((x_, y_)))
-                        found_it = True
-                    if found_it:
-                      overlapped_data.append((x_, y_))
-                    else:
-                      all_pix_data[reflection['id']].append((x_, y_))
-                  else:
-                    all_pix_data[reflection['id']].append((x_, y_))
+            for x, y in zip(xs, ys):
+              x_, y_ = map_coords(x + 0.5, y + 0.5, panel)
+              this_spot_foreground_pixels.append(matrix.col((x_,y_)))
+              counts = pixel_counts.setdefault((x_, y_), {})
+              if len(all_pix_data) > 1 and any(counts.itervalues()):
+                # look for overlapped pixels
+                for key in counts:
+                  if counts[key] > 0:
+                    counts[key] -= 1
+                overlapped_data.append((x_, y_))
+              else:
+                counts[expt_id] = counts.get(expt_id, 0) + 1
             if self.display_foreground_circles_patch and len(this_spot_foreground_pixels)>1:
               per_spot_mean = matrix.col((0.,0.,))
               for pxl in this_spot_foreground_pixels:
                 per_spot_mean+=pxl
               per_spot_mean /= len(this_spot_foreground_pixels)
-              all_foreground_circles[reflection['id']].append(dict(
+              all_foreground_circles[expt_id].append(dict(
                 position=per_spot_mean,radius=max([(t-per_spot_mean).length() for t in this_spot_foreground_pixels])))
             self.show_all_pix_timer.stop()
 
@@ -1171,38 +1172,41 @@ def map_coords(x, y, p):
       if ('xyzcal.px' in ref_list or 'xyzcal.mm' in ref_list) and \
          (self.settings.show_predictions or
            (self.settings.show_miller_indices and 'miller_index' in ref_list)):
-        if 'xyzcal.px' in ref_list:
-          frame_numbers = ref_list['xyzcal.px'].parts()[2]
+        if frame_index.has_prediction_index():
+          frame_predictions_sel = frame_index.prediction_selection(i_frame)
         else:
           phi = ref_list['xyzcal.mm'].parts()[2]
           frame_numbers = scan.get_array_index_from_angle(phi * to_degrees)
-        n = 0 # buffer
-        for i_expt in range(flex.max(ref_list['id'])+1):
-          expt_sel = ref_list['id'] == i_expt
           frame_predictions_sel = (
-            (frame_numbers >= (i_frame-n)) & (frame_numbers < (i_frame+1+n)))
-          for reflection in ref_list.select(frame_predictions_sel & expt_sel):
-            if self.settings.show_predictions or self.settings.show_miller_indices:
-              x = None
-              if 'xyzcal.px' in reflection:
-                x, y = map_coords(reflection['xyzcal.px'][0] + 0.5,
-                                  reflection['xyzcal.px'][1] + 0.5,
-                                  reflection['panel'])
-              elif 'xyzcal.mm' in reflection:
-                x, y = detector[reflection['panel']].millimeter_to_pixel(
-                  reflection['xyzcal.mm'][:2])
-                x, y = map_coords(x+ 0.5, y + 0.5, reflection['panel'])
-              if x is None: next
-
-              if self.settings.show_predictions:
-                predictions_data.append(
-                  (x, y, {'colour':self.prediction_colours[i_expt]}))
-
-              if (self.settings.show_miller_indices and
-                  'miller_index' in reflection and
-                  reflection['miller_index'] != (0,0,0)):
-                miller_indices_data.append((x, y, str(reflection['miller_index']),
-                                            {'placement':'ne', 'radius':0}))
+            (frame_numbers >= i_frame) & (frame_numbers < (i_frame+1)))
+        for reflection in self.select_shown_reflections(
+            ref_list.select(frame_predictions_sel)):
+          i_expt = reflection['id']
+          if i_expt < 0: continue
+          x = None
+          if 'xyzcal.px' in reflection:
+            x, y = map_coords(reflection['xyzcal.px'][0] + 0.5,
+                              reflection['xyzcal.px'][1] + 0.5,
+                              reflection['panel'])
+          elif 'xyzcal.mm' in reflection:
+            x, y = detector[reflection['panel']].millimeter_to_pixel(
+              reflection['xyzcal.mm'][:2])
+            x, y = map_coords(x+ 0.5, y + 0.5, reflection['panel'])
+          if x is None: continue
+
+          if self.settings.show_predictions:
+            predictions_data.append(
+              (x, y, {'colour':self.prediction_colours[i_expt]}))
+
+          if (self.settings.show_miller_indices and
+              'miller_index' in reflection and
+              reflection['miller_index'] != (0,0,0)):
+            miller_indices_data.append((x, y, str(reflection['miller_index']),
+                                        {'placement':'ne', 'radius':0}))
+
+    for xy, counts in pixel_counts.iteritems():
+      for expt_id, count in counts.iteritems():
+        all_pix_data[expt_id].extend([xy] * count)
 
     if len(overlapped_data) > 0:
       #show overlapped pixels in a different color
@@ -264,6 +264,69 @@ def __call__(self):
     return tuple(masks)
 
 
+class CachedMaskGenerator(object):
+  '''
+  Generate a mask, caching the parts that depend only on the experimental
+  geometry.
+
+  The border, untrusted region and resolution masks are computed once for each
+  distinct detector and beam model and reused. The trusted range mask depends
+  on the pixel values and so is still computed from the first image each time.
+
+  '''
+
+  def __init__(self, params, size=8):
+    '''
+    Set the parameters.
+
+    :param params: The mask generator parameters
+    :param size: The number of geometry masks to keep
+
+    '''
+    from copy import deepcopy
+    self.params = params
+    static_params = deepcopy(params)
+    static_params.use_trusted_range = False
+    self.generator = MaskGenerator(static_params)
+    self.size = size
+    self.cache = []
+    self.hits = 0
+    self.misses = 0
+
+  def generate_static(self, imageset):
+    '''
+    Get the geometry mask, generating it if not cached.
+
+    '''
+    detector = imageset.get_detector()
+    beam = imageset.get_beam()
+    for i, (d, b, mask) in enumerate(self.cache):
+      if d == detector and b == beam:
+        self.hits += 1
+        self.cache.insert(0, self.cache.pop(i))
+        return mask
+    self.misses += 1
+    mask = self.generator.generate(imageset)
+    self.cache.insert(0, (detector, beam, mask))
+    del self.cache[self.size:]
+    return mask
+
+  def generate(self, imageset):
+    ''' Generate the mask. '''
+    static = self.generate_static(imageset)
+    if not self.params.use_trusted_range:
+      return tuple(m.deep_copy() for m in static)
+    image = imageset.get_raw_data(0)
+    detector = imageset.get_detector()
+    assert(len(detector) == len(image))
+    masks = []
+    for im, panel, m in zip(image, detector, static):
+      low, high = panel.get_trusted_range()
+      imd = im.as_double()
+      masks.append((imd > low) & (imd < high) & m)
+    return tuple(masks)
+
+
 class GoniometerShadowMaskGenerator(object):
 
   def __init__(self, goniometer, extrema_at_datum, axis):
@@ -265,6 +265,64 @@ def batch_multi_node_parallel_map(
     preserve_exception_message = True)
 
 
+def shared_memory_directory():
+  '''
+  Get a directory backed by shared memory (/dev/shm) if available, otherwise
+  the default temporary directory.
+
+  '''
+  import os
+  import tempfile
+  if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+    return '/dev/shm'
+  return tempfile.gettempdir()
+
+
+class SharedMemoryTable(object):
+  '''
+  A handle to a reflection table written to a memory backed file. Passing the
+  handle between processes only pickles the filename, so the table data does
+  not go through the pipe.
+
+  '''
+
+  def __init__(self, table, directory=None):
+    '''
+    Write the table to shared memory.
+
+    :param table: The reflection table
+    :param directory: The directory in which to create the file
+
+    '''
+    from dials.array_family import columnar
+    import os
+    import tempfile
+    if directory is None:
+      directory = shared_memory_directory()
+    fd, self.filename = tempfile.mkstemp(
+      prefix='dials_', suffix='.refl', dir=directory)
+    os.close(fd)
+    columnar.dump(table, self.filename)
+    self.nrows = len(table)
+
+  def __len__(self):
+    return self.nrows
+
+  def load(self):
+    '''
+    Read the table and release the shared memory.
+
+    :return: The reflection table
+
+    '''
+    from dials.array_family import columnar
+    import os
+    try:
+      return columnar.load(self.filename)
+    finally:
+      os.remove(self.filename)
+
+
 if __name__ == '__main__':
 
   def func(x):
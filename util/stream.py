@@ -279,3 +279,288 @@ def decode_endofseries(self, frames):
 
     '''
     return EndOfSeries()
+
+
+def decode_image_data(data, info):
+  '''
+  Decode the image data from an image message
+
+  :param data: The (possibly compressed) image data
+  :param info: The image info from the message
+  :return: The image as a flex.int array
+
+  '''
+  import numpy
+  import struct
+  from dials.array_family import flex
+
+  # The image dimensions and data type
+  shape = tuple(info['shape'])
+  dtype = numpy.dtype(info['type'])
+  encoding = info['encoding']
+  nbytes = shape[0] * shape[1] * dtype.itemsize
+
+  # Decompress the data
+  if encoding.startswith('bs') and encoding.endswith('-lz4<'):
+    from bitshuffle import decompress_lz4
+    total, block_size = struct.unpack('>QI', data[:12])
+    assert total == nbytes
+    array = decompress_lz4(
+      numpy.frombuffer(data[12:], dtype=numpy.uint8),
+      shape, dtype, block_size // dtype.itemsize)
+  elif encoding == 'lz4<':
+    import lz4.block
+    array = numpy.frombuffer(
+      lz4.block.decompress(data, uncompressed_size=nbytes),
+      dtype=dtype).reshape(shape)
+  elif encoding == '<':
+    array = numpy.frombuffer(data, dtype=dtype).reshape(shape)
+  else:
+    raise RuntimeError('Unknown encoding "%s"' % encoding)
+
+  # Values which overflow a signed integer are saturated pixels and become
+  # negative, so they fall outside the trusted range
+  return flex.int(array.astype(numpy.int32))
+
+
+class ImageWriter(object):
+  '''
+  A class to write the received images to file in a background thread, so
+  that receiving the stream is not held up by the file system
+
+  '''
+
+  def __init__(self, directory, image_template):
+    '''
+    Start the writer thread
+
+    :param directory: The output directory
+    :param image_template: The image filename template
+
+    '''
+    import threading
+    import Queue
+    self.directory = directory
+    self.image_template = image_template
+    self.error = None
+    self._queue = Queue.Queue()
+    self._thread = threading.Thread(target=self._work)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def _work(self):
+    '''
+    Write the queued images until told to stop
+
+    '''
+    from os.path import join
+    import json
+    while True:
+      image = self._queue.get()
+      if image is None:
+        break
+      if self.error is not None:
+        continue
+      try:
+        filename = join(self.directory, self.image_template % image.count)
+        with open(filename, "wb") as outfile:
+          outfile.write(image.data)
+        with open("%s.info" % filename, "w") as outfile:
+          json.dump(image.info, outfile)
+      except Exception as e:
+        self.error = e
+
+  def write(self, image):
+    '''
+    Queue an image to be written
+
+    :param image: The image object
+
+    '''
+    if self.error is not None:
+      raise self.error
+    self._queue.put(image)
+
+  def close(self):
+    '''
+    Wait for the queued images to be written
+
+    '''
+    self._queue.put(None)
+    self._thread.join()
+    if self.error is not None:
+      raise self.error
+
+
+class StreamSpotFinder(object):
+  '''
+  A class to find spots on an image received from the stream, with the same
+  thresholding and filtering used by dials.find_spots
+
+  '''
+
+  def __init__(self, imageset, params, resolution_analysis=True):
+    '''
+    Configure the spot finding
+
+    :param imageset: The imageset created from the header
+    :param params: The parameters containing the spotfinder scope
+    :param resolution_analysis: Estimate the resolution of each image
+
+    '''
+    from dials.algorithms.spot_finding.factory import SpotFinderFactory
+    from dials.algorithms.spot_finding.finder import \
+      ExtractPixelsFromImage2DNoShoeboxes
+    from dxtbx.datablock import DataBlock
+    from libtbx import Auto
+
+    # Set the minimum spot size as for the spot finding server
+    detector = imageset.get_detector()
+    if params.spotfinder.filter.min_spot_size is Auto:
+      if detector[0].get_type() == 'SENSOR_PAD':
+        params.spotfinder.filter.min_spot_size = 3
+      else:
+        params.spotfinder.filter.min_spot_size = 6
+
+    # Read the mask lookup file
+    mask = SpotFinderFactory.load_image(params.spotfinder.lookup.mask)
+
+    self.imageset = imageset
+    self.resolution_analysis = resolution_analysis
+    self.extract = ExtractPixelsFromImage2DNoShoeboxes(
+      imageset                  = imageset,
+      threshold_function        = SpotFinderFactory.configure_threshold(
+        params, DataBlock([imageset])),
+      mask                      = mask,
+      region_of_interest        = params.spotfinder.region_of_interest,
+      max_strong_pixel_fraction =
+        params.spotfinder.filter.max_strong_pixel_fraction,
+      compute_mean_background   = params.spotfinder.compute_mean_background,
+      min_spot_size             = params.spotfinder.filter.min_spot_size,
+      max_spot_size             = params.spotfinder.filter.max_spot_size,
+      filter_spots              = SpotFinderFactory.configure_filter(params))
+
+  def __call__(self, count, data, info):
+    '''
+    Find the spots on an image
+
+    :param count: The image number
+    :param data: The image data from the message
+    :param info: The image info from the message
+    :return: A dictionary of statistics for the image
+
+    '''
+    from dials.algorithms.spot_finding import per_image_analysis
+    image = decode_image_data(data, info).as_double()
+    detector = self.imageset.get_detector()
+    assert len(detector) == 1
+    image = (image,)
+    mask = tuple(
+      panel.get_trusted_range_mask(im) for panel, im in zip(detector, image))
+    reflections = self.extract.extract(count, image, mask)[0]
+    stats = {
+      'image' : count,
+      'n_spots_total' : len(reflections),
+    }
+    if len(reflections) > 0:
+      stats.update(per_image_analysis.stats_single_image(
+        self.imageset, reflections, i=count,
+        resolution_analysis=self.resolution_analysis,
+        plot=False).__dict__)
+    return stats
+
+
+class SpotFinderWorkerPool(object):
+  '''
+  A pool of processes which find spots on the images as they are received.
+  The processes are forked once the header has been received so that each
+  inherits the spot finder; the images are then passed to them through a
+  queue and the statistics for each image returned in the order they are
+  computed.
+
+  '''
+
+  def __init__(self, spot_finder, nproc):
+    '''
+    Start the worker processes
+
+    :param spot_finder: The spot finder for a single image
+    :param nproc: The number of processes
+
+    '''
+    import multiprocessing
+    self.spot_finder = spot_finder
+    self._tasks = multiprocessing.Queue()
+    self._results = multiprocessing.Queue()
+    self._num_pending = 0
+    self._workers = []
+    for i in range(nproc):
+      worker = multiprocessing.Process(target=self._work)
+      worker.daemon = True
+      worker.start()
+      self._workers.append(worker)
+
+  def _work(self):
+    '''
+    Find spots on the queued images until told to stop
+
+    '''
+    while True:
+      task = self._tasks.get()
+      if task is None:
+        break
+      count, data, info = task
+      try:
+        self._results.put((count, self.spot_finder(count, data, info), None))
+      except Exception as e:
+        self._results.put((count, None, str(e)))
+
+  def submit(self, image):
+    '''
+    Queue an image for spot finding
+
+    :param image: The image object
+
+    '''
+    self._tasks.put((image.count, image.data, image.info))
+    self._num_pending += 1
+
+  def results(self, block=False):
+    '''
+    Get the available results
+
+    :param block: Wait for all the queued images to be processed
+    :return: A list of (image number, statistics, error message)
+
+    '''
+    import Queue
+    results = []
+    while self._num_pending > 0:
+      try:
+        if block:
+          result = self._results.get(timeout=1)
+        else:
+          result = self._results.get_nowait()
+      except Queue.Empty:
+        if not block:
+          break
+        if not any(worker.is_alive() for worker in self._workers):
+          raise RuntimeError('Spot finding processes exited unexpectedly')
+        continue
+      self._num_pending -= 1
+      results.append(result)
+    return results
+
+  def close(self):
+    '''
+    Wait for the queued images to be processed and stop the workers
+
+    :return: The remaining results
+
+    '''
+    results = self.results(block=True)
+    for worker in self._workers:
+      self._tasks.put(None)
+    for worker in self._workers:
+      worker.join()
+    return results